@@ -48,6 +48,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'timetableApp.middleware.QueryProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'timetable.urls'
@@ -82,6 +83,26 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# The 'timetable' cache holds rendered timetables and their version counters. It must be shared
+# by every process that serves requests (FileBasedCache, Redis or Memcached), otherwise an edit
+# handled by one worker never invalidates what the others cached; see timetableApp.checks.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'timetable': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / '.cache' / 'timetable',
+        'OPTIONS': {
+            'MAX_ENTRIES': 1000,
+        },
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -122,3 +143,54 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Timetable generation
+# Solver used by generate_timetable ('greedy' or 'backtracking') and its time limit in seconds.
+
+TIMETABLE_SOLVER = 'greedy'
+TIMETABLE_SOLVER_TIME_LIMIT = 10
+
+# Seconds of simulated-annealing improvement after each generation (0 disables it).
+
+TIMETABLE_OPTIMIZE_TIME_LIMIT = 0
+
+# Number of seeded attempts per generation; the best-scoring one is kept. Attempts run on a
+# process pool of TIMETABLE_GENERATION_WORKERS processes (None uses every CPU core).
+
+TIMETABLE_GENERATION_ATTEMPTS = 1
+TIMETABLE_GENERATION_WORKERS = None
+
+# Background generation jobs: worker threads per process, and the number of seconds without a
+# progress report after which a pending or running job is no longer joined by identical requests.
+
+TIMETABLE_JOB_WORKERS = 2
+TIMETABLE_JOB_STALE_AFTER = 300
+
+# Seconds after which a generation lock its holder has not renewed is considered abandoned
+# and taken over by a waiting generation.
+
+TIMETABLE_GENERATION_LOCK_TIMEOUT = 300
+
+# Seconds a snapshot restore waits for a running generation to release the lock before the
+# request is refused.
+
+TIMETABLE_RESTORE_LOCK_WAIT = 5
+
+# Number of automatic timetable snapshots (taken before each generation or restore replaces the
+# timetable) that are kept; older ones are deleted. Snapshots taken on request are kept.
+
+TIMETABLE_SNAPSHOT_KEEP = 20
+
+# Rendered timetable cache: backend alias, lifetime of cached output in seconds, and the number
+# of rendered fragments each process keeps in its in-memory LRU.
+
+TIMETABLE_CACHE_ALIAS = 'timetable'
+TIMETABLE_CACHE_TIMEOUT = 24 * 60 * 60
+TIMETABLE_CACHE_LOCAL_ENTRIES = 500
+
+# Request profiling: fraction of requests whose SQL and latency are recorded (0 disables the
+# middleware entirely), and how many recent samples per view the percentiles are computed from.
+
+TIMETABLE_PROFILING_SAMPLE_RATE = 0
+TIMETABLE_PROFILING_WINDOW = 1000
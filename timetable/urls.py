@@ -21,7 +21,19 @@ from timetableApp import views
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('generate_timetable/', views.generate_timetable_view, name='generate_timetable'),
+    path('generate_timetable/jobs/<int:job_id>/', views.generation_job_status, name='generation_job_status'),
     path('', views.timetable_list, name='timetable_list'),
+    path('export/<str:file_format>/', views.export_timetable, name='export_timetable'),
+    path('export/<str:file_format>/course/<int:course_id>/', views.export_timetable, name='export_course_timetable'),
+    path('export/<str:file_format>/staff/<int:staff_id>/', views.export_timetable, name='export_staff_timetable'),
+    path('api/timetable/<str:by>/', views.timetable_api, name='timetable_api'),
+    path('api/timetable/<str:by>/<str:key>/', views.timetable_api, name='timetable_api_detail'),
+    path('api/score/', views.timetable_score, name='timetable_score'),
+    path('timetable/cache/stats/', views.timetable_cache_stats, name='timetable_cache_stats'),
+    path('profiling/stats/', views.profiling_stats, name='profiling_stats'),
+    path('snapshots/', views.snapshot_list, name='snapshot_list'),
+    path('snapshots/<int:pk>/diff/', views.snapshot_diff, name='snapshot_diff'),
+    path('snapshots/<int:pk>/restore/', views.snapshot_restore, name='snapshot_restore'),
     path('courses/', views.course_list, name='course_list'),
     path('courses/create/', views.create_course, name='create_course'),
     path('courses/<int:pk>/update/', views.update_course, name='update_course'),
@@ -34,7 +46,11 @@ urlpatterns = [
     path('staffs/create/', views.staff_create, name='staff_create'),
     path('staffs/<int:pk>/update/', views.staff_update, name='staff_update'),
     path('staffs/<int:pk>/delete/', views.staff_delete, name='staff_delete'),
+    path('staffs/<int:pk>/timetable/', views.staff_timetable, name='staff_timetable'),
+    path('staffs/timetables/', views.staff_timetables, name='staff_timetables'),
+    path('import/', views.import_data, name='import_data'),
     path('periods/', views.period_list, name='period_list'),
+    path('periods/create/', views.period_create, name='period_create'),
     path('period/update/<int:pk>/', views.period_update, name='period_update'),
     path('timetable/edit/<int:course_id>/<str:day>/', views.edit_timetable_row, name='edit_timetable_row'),
     path('get_staff/<int:subject_id>/', views.get_staff_by_subject, name='get_staff_by_subject'),
@@ -1,8 +1,11 @@
 from django.contrib import admin
-from .models import Course, Subject, Staff, Period, TimetableEntry
+from .models import Course, Subject, Staff, Period, TimetableEntry, GenerationJob, GenerationLock, TimetableSnapshot
 
 admin.site.register(Course)
 admin.site.register(Subject)
 admin.site.register(Staff)
 admin.site.register(Period)
 admin.site.register(TimetableEntry)
+admin.site.register(GenerationJob)
+admin.site.register(GenerationLock)
+admin.site.register(TimetableSnapshot)
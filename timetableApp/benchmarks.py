@@ -0,0 +1,177 @@
+"""
+Benchmarks for timetable generation and the timetable views.
+
+Each size tier from synthetic.SIZE_TIERS is loaded into the current database, then every
+operation is timed over several repetitions while recording its SQL query count, and run once
+more under tracemalloc to record its peak Python memory. Results are plain dictionaries that
+can be written as JSON and compared between commits.
+"""
+import itertools
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+
+import django
+from django.conf import settings
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from . import cache as timetable_cache
+from . import views
+from .generation import generate_timetable
+from .models import Course, Subject, Period
+from .synthetic import SIZE_TIERS, create_institution, clear_institution
+
+
+def _operations(mode):
+    """
+    Returns (name, setup, run) triples for the operations measured on the current data.
+    """
+    factory = RequestFactory()
+    course = Course.objects.order_by('id').first()
+    subject = Subject.objects.order_by('id').first()
+    day = Period.objects.order_by('id').values_list('day', flat=True).first()
+
+    seeds = itertools.count()
+
+    def generate():
+        # A new seed every run, so the result is solved instead of taken from the result cache.
+        generate_timetable(seed=next(seeds), mode=mode, attempts=1)
+
+    def generate_unchanged():
+        generate_timetable(seed=0, mode=mode, attempts=1)
+
+    def invalidate():
+        timetable_cache.invalidate_timetable(structure=True)
+
+    def timetable_list():
+        views.timetable_list(factory.get('/'))
+
+    def edit_timetable_row():
+        views.edit_timetable_row(factory.get(f'/timetable/edit/{course.id}/{day}/'), course.id, day)
+
+    def get_staff_by_subject():
+        views.get_staff_by_subject(factory.get(f'/get_staff/{subject.id}/'), subject.id)
+
+    return [
+        ('generate_timetable', None, generate),
+        ('generate_timetable_unchanged', None, generate_unchanged),
+        ('timetable_list_cold', invalidate, timetable_list),
+        ('timetable_list_warm', None, timetable_list),
+        ('edit_timetable_row', None, edit_timetable_row),
+        ('get_staff_by_subject', None, get_staff_by_subject),
+    ]
+
+
+def _measure(setup, run, repeat):
+    timings = []
+    queries = 0
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        with CaptureQueriesContext(connection) as context:
+            start = time.perf_counter()
+            run()
+            timings.append(time.perf_counter() - start)
+        queries = len(context.captured_queries)
+
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    try:
+        run()
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'seconds_min': min(timings),
+        'seconds_median': statistics.median(timings),
+        'seconds_max': max(timings),
+        'queries': queries,
+        'peak_memory_bytes': peak_memory,
+    }
+
+
+def run_benchmarks(tiers, repeat=3, mode=None, seed=0, report=None):
+    """
+    Runs every operation on each size tier and returns the results.
+
+    The current database is cleared before each tier, so run this against a test database.
+
+    Args:
+        tiers (list): Names of tiers from synthetic.SIZE_TIERS.
+        repeat (int): Timed repetitions per operation.
+        mode (str, optional): Solver used for generate_timetable; defaults to settings.TIMETABLE_SOLVER.
+        seed (int): Seed of the synthetic data.
+        report (callable, optional): Called with each result as soon as it is measured.
+
+    Returns:
+        dict: 'meta' describing the environment and 'results', one dict per tier and operation.
+    """
+    results = []
+    for tier in tiers:
+        parameters = SIZE_TIERS[tier]
+        clear_institution()
+        counts = create_institution(seed=seed, **parameters)
+        timetable_cache.invalidate_timetable(structure=True)
+        for name, setup, run in _operations(mode):
+            result = {'tier': tier, 'operation': name, 'parameters': parameters, 'rows': counts}
+            result.update(_measure(setup, run, repeat))
+            results.append(result)
+            if report is not None:
+                report(result)
+    clear_institution()
+    return {'meta': _environment(repeat, mode or settings.TIMETABLE_SOLVER, seed), 'results': results}
+
+
+def compare_results(baseline, current):
+    """
+    Pairs up results of two runs by tier and operation.
+
+    Args:
+        baseline (dict): Output of an earlier run_benchmarks.
+        current (dict): Output of a later run_benchmarks.
+
+    Returns:
+        list: Dicts with tier, operation, both median times, their ratio and both query counts.
+    """
+    previous = {(result['tier'], result['operation']): result for result in baseline['results']}
+    rows = []
+    for result in current['results']:
+        before = previous.get((result['tier'], result['operation']))
+        if before is None:
+            continue
+        rows.append({
+            'tier': result['tier'],
+            'operation': result['operation'],
+            'baseline_seconds': before['seconds_median'],
+            'current_seconds': result['seconds_median'],
+            'ratio': result['seconds_median'] / before['seconds_median'] if before['seconds_median'] else None,
+            'baseline_queries': before['queries'],
+            'current_queries': result['queries'],
+        })
+    return rows
+
+
+def _environment(repeat, mode, seed):
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'solver': mode,
+        'repeat': repeat,
+        'seed': seed,
+    }
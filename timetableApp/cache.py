@@ -0,0 +1,295 @@
+"""
+Versioned cache for rendered timetables.
+
+Rendered output is stored under keys that embed version counters kept in the cache backend
+configured by settings.TIMETABLE_CACHE_ALIAS, which must be shared by every process serving
+requests (see checks.py):
+
+- the global 'timetable' version changes on any change to the timetable or its inputs and
+  keys the whole timetable page,
+- a per-course version changes when that course or one of its entries changes, and
+- a 'structure' version changes when periods, subjects or staff change, since those appear in
+  every course.
+
+A course fragment is keyed by its course version and the structure version, so editing one
+course only re-renders that course. Because a versioned key always maps to the same content,
+fragments are also kept in a bounded in-process LRU in front of the backend, which makes the
+eviction policy the same for local-memory and file-based backends.
+
+Generated timetables are stored the same way under a fingerprint of their solver input (see
+generation.result_key), so regenerating from unchanged inputs reuses the stored result. The
+fingerprint changes with the data itself, so these entries need no version counter; they are
+bounded by the backend's MAX_ENTRIES and by TIMETABLE_CACHE_TIMEOUT.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+
+class LRUCache:
+    """
+    Thread-safe, size-bounded mapping that evicts the least recently used key.
+    """
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return None
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class CacheStats:
+    """
+    Hit and miss counters of this process, per kind of cached output.
+    """
+    def __init__(self):
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def record(self, kind, hit):
+        name = f"{kind}_{'hits' if hit else 'misses'}"
+        with self._lock:
+            self._counts[name] = self._counts.get(name, 0) + 1
+
+    def as_dict(self):
+        with self._lock:
+            return dict(self._counts)
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+
+
+stats = CacheStats()
+_local = LRUCache(settings.TIMETABLE_CACHE_LOCAL_ENTRIES)
+_pending = threading.local()
+
+
+def _backend():
+    return caches[settings.TIMETABLE_CACHE_ALIAS]
+
+
+def clear():
+    """
+    Empties the cache backend and this process's LRU and resets the hit and miss counters.
+    """
+    _backend().clear()
+    _local.clear()
+    stats.reset()
+
+
+def _version_key(name):
+    return f'timetable:version:{name}'
+
+
+def _initial_version():
+    # Versions start from the clock so a counter that was evicted or lost on restart never
+    # comes back to a value whose cached output is stale.
+    return time.time_ns() // 1000
+
+
+def get_versions(names):
+    """
+    Returns the current value of each named version counter, creating missing ones.
+
+    Args:
+        names (list): Counter names such as 'timetable', 'structure' or 'course:<id>'.
+
+    Returns:
+        dict: Counter name -> version.
+    """
+    backend = _backend()
+    keys = {name: _version_key(name) for name in names}
+    found = backend.get_many(list(keys.values()))
+    versions = {}
+    for name, key in keys.items():
+        if key not in found:
+            backend.add(key, _initial_version(), timeout=None)
+            found[key] = backend.get(key)
+        versions[name] = found[key]
+    return versions
+
+
+def bump_versions(names):
+    """
+    Advances the named version counters, invalidating everything keyed by them.
+
+    A new version is the later of the old one plus one and the clock. Backends such as the
+    file-based one implement incr as a separate read and write, so two processes bumping at
+    once could both write the same incremented value, and a page rendered between the two
+    writes would stay cached under it; clock values keep their writes distinct.
+    """
+    backend = _backend()
+    keys = [_version_key(name) for name in names]
+    current = backend.get_many(keys)
+    backend.set_many(
+        {key: max(current.get(key, 0) + 1, _initial_version()) for key in keys}, timeout=None
+    )
+
+
+def invalidate_timetable(course_ids=(), structure=False):
+    """
+    Invalidates the cached timetable page and the given course fragments.
+
+    Model signals call this automatically. Code that writes with bulk_create, bulk_update or
+    QuerySet.update, which do not send signals, must call it after the write.
+
+    Args:
+        course_ids (iterable): Courses whose fragments changed.
+        structure (bool): True if periods, subjects or staff changed, which affects every course.
+    """
+    names = ['timetable'] + [f'course:{course_id}' for course_id in set(course_ids)]
+    if structure:
+        names.append('structure')
+    bump_versions(names)
+
+
+def schedule_invalidation(course_id=None, structure=False):
+    """
+    Invalidates after the current transaction commits, once for all changes made in it.
+
+    Args:
+        course_id (int, optional): Course whose fragment changed.
+        structure (bool): True if the change affects every course.
+    """
+    if not hasattr(_pending, 'course_ids'):
+        _pending.course_ids = set()
+        _pending.structure = False
+    if course_id is not None:
+        _pending.course_ids.add(course_id)
+    _pending.structure = _pending.structure or structure
+    transaction.on_commit(_flush_pending)
+
+
+def _flush_pending():
+    course_ids = getattr(_pending, 'course_ids', set())
+    structure = getattr(_pending, 'structure', False)
+    if not course_ids and not structure:
+        return
+    _pending.course_ids = set()
+    _pending.structure = False
+    invalidate_timetable(course_ids, structure)
+
+
+def page_key(name):
+    """
+    Returns the versioned key of a whole cached page; read it before loading the page data.
+    """
+    version = get_versions(['timetable'])['timetable']
+    return f'timetable:page:{name}:{version}'
+
+
+def fragment_keys(course_ids):
+    """
+    Returns the versioned fragment key of each course; read them before loading course data.
+
+    Returns:
+        dict: Course id -> cache key.
+    """
+    names = ['structure'] + [f'course:{course_id}' for course_id in course_ids]
+    versions = get_versions(names)
+    structure = versions['structure']
+    return {
+        course_id: f"timetable:course:{course_id}:{versions[f'course:{course_id}']}:{structure}"
+        for course_id in course_ids
+    }
+
+
+def get_page(key):
+    """
+    Returns the cached page stored under key, or None.
+    """
+    return _get('page', key)
+
+
+def set_page(key, content):
+    _set(key, content)
+
+
+def get_fragments(keys):
+    """
+    Returns the cached fragments for a mapping of course id -> key.
+
+    Returns:
+        dict: Course id -> cached fragment, for the courses that were found.
+    """
+    found = {}
+    missing = {}
+    for course_id, key in keys.items():
+        content = _local.get(key)
+        if content is None:
+            missing[course_id] = key
+        else:
+            found[course_id] = content
+    if missing:
+        stored = _backend().get_many(list(missing.values()))
+        for course_id, key in missing.items():
+            if key in stored:
+                _local.set(key, stored[key])
+                found[course_id] = stored[key]
+    for course_id in keys:
+        stats.record('fragment', course_id in found)
+    return found
+
+
+def set_fragment(key, content):
+    _set(key, content)
+
+
+def get_result(key):
+    """
+    Returns the packed generation result stored under key, or None.
+    """
+    return _get('result', key)
+
+
+def set_result(key, packed):
+    _set(key, packed)
+
+
+def discard_result(key):
+    _local.discard(key)
+    _backend().delete(key)
+
+
+def _get(kind, key):
+    content = _local.get(key)
+    if content is None:
+        content = _backend().get(key)
+        if content is not None:
+            _local.set(key, content)
+    stats.record(kind, content is not None)
+    return content
+
+
+def _set(key, content):
+    _local.set(key, content)
+    _backend().set(key, content, timeout=settings.TIMETABLE_CACHE_TIMEOUT)
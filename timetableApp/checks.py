@@ -0,0 +1,32 @@
+"""
+System checks of the timetable settings.
+"""
+from django.conf import settings
+from django.core.checks import Warning, register, Tags
+
+# Backends whose data lives in the memory of one process.
+PROCESS_LOCAL_BACKENDS = {'django.core.cache.backends.locmem.LocMemCache'}
+
+
+@register(Tags.caches)
+def check_timetable_cache(app_configs, **kwargs):
+    """
+    Warns when the timetable cache is local to each process.
+
+    The cache holds the version counters that invalidate rendered timetables and the slot
+    index, so with a local-memory backend an edit handled by one worker process leaves every
+    other worker serving the old timetable until TIMETABLE_CACHE_TIMEOUT expires.
+    """
+    alias = settings.TIMETABLE_CACHE_ALIAS
+    backend = settings.CACHES.get(alias, {}).get('BACKEND')
+    if backend not in PROCESS_LOCAL_BACKENDS:
+        return []
+    return [Warning(
+        f"The '{alias}' cache ({backend}) is local to each process.",
+        hint=(
+            "Cache invalidation only reaches the process that made the change. Use a backend "
+            "shared between processes, such as FileBasedCache or Redis, when serving with more "
+            "than one worker process."
+        ),
+        id='timetableApp.W001',
+    )]
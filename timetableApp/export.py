@@ -0,0 +1,169 @@
+"""
+Streaming timetable exports.
+
+Entries are read with a single joined query through QuerySet.iterator() and written out one
+line at a time, so an export uses the same memory for ten courses as for ten thousand. Each
+format is a generator of text chunks meant for a StreamingHttpResponse:
+
+- csv: one row per entry with a header row,
+- ndjson: one JSON object per line,
+- ics: an iCalendar file with one weekly recurring event per entry, placed in the week that
+  starts on a given Monday using the period's start and end times.
+"""
+import csv
+import json
+from datetime import datetime, timedelta, timezone
+
+from django.db.models import Case, When, Value, IntegerField
+
+from .models import Period, TimetableEntry
+
+ITERATOR_CHUNK_SIZE = 2000
+WRITE_BUFFER_SIZE = 64 * 1024
+CSV_COLUMNS = [
+    'course', 'subject', 'staff', 'day', 'period_number', 'start_time', 'end_time', 'is_adjusted',
+]
+ICS_WEEKDAYS = ['MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU']
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+    'ics': 'text/calendar; charset=utf-8',
+}
+
+
+def export_entries(course_id=None, staff_id=None):
+    """
+    Returns the entries to export, in course, day and period order, as a streaming iterator.
+
+    Args:
+        course_id (int, optional): Only export this course.
+        staff_id (int, optional): Only export this staff member's entries.
+    """
+    day_order = Case(
+        *[When(period__day=day, then=Value(index)) for index, (day, _) in enumerate(Period.DAY_CHOICES)],
+        default=Value(len(Period.DAY_CHOICES)),
+        output_field=IntegerField(),
+    )
+    entries = TimetableEntry.objects.select_related('course', 'subject', 'staff', 'period')
+    if course_id is not None:
+        entries = entries.filter(course_id=course_id)
+    if staff_id is not None:
+        entries = entries.filter(staff_id=staff_id)
+    entries = entries.order_by('course__name', 'course_id', day_order, 'period__day', 'period__period_number')
+    return entries.iterator(chunk_size=ITERATOR_CHUNK_SIZE)
+
+
+def buffered(chunks, size=WRITE_BUFFER_SIZE):
+    """
+    Joins small text chunks into pieces of about `size` characters, so the server writes
+    to the socket once per piece instead of once per line.
+    """
+    pending = []
+    length = 0
+    for chunk in chunks:
+        pending.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield ''.join(pending)
+            pending = []
+            length = 0
+    if pending:
+        yield ''.join(pending)
+
+
+def _time(value):
+    return value.strftime('%H:%M') if value is not None else ''
+
+
+class _LineBuffer:
+    """
+    File-like object whose write() returns the written text, so csv.writer produces lines.
+    """
+    def write(self, value):
+        return value
+
+
+def stream_csv(entries):
+    writer = csv.writer(_LineBuffer())
+    yield writer.writerow(CSV_COLUMNS)
+    for entry in entries:
+        yield writer.writerow([
+            entry.course.name, entry.subject.name, entry.staff.name, entry.period.day,
+            entry.period.period_number, _time(entry.period.start_time), _time(entry.period.end_time),
+            int(entry.is_adjusted),
+        ])
+
+
+def stream_ndjson(entries):
+    for entry in entries:
+        yield json.dumps({
+            'course': {'id': entry.course_id, 'name': entry.course.name},
+            'subject': {'id': entry.subject_id, 'name': entry.subject.name},
+            'staff': {'id': entry.staff_id, 'name': entry.staff.name},
+            'period': {
+                'id': entry.period_id,
+                'day': entry.period.day,
+                'period_number': entry.period.period_number,
+                'start_time': _time(entry.period.start_time) or None,
+                'end_time': _time(entry.period.end_time) or None,
+            },
+            'is_adjusted': entry.is_adjusted,
+        }) + '\n'
+
+
+def _ics_text(value):
+    return value.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+
+
+def _ics_line(line):
+    """
+    Folds a content line at 75 octets as RFC 5545 requires and terminates it with CRLF.
+    """
+    encoded = line.encode('utf-8')
+    parts = []
+    while len(encoded) > 75:
+        cut = 75 if not parts else 74
+        # Never split a multi-byte character.
+        while cut and (encoded[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(encoded[:cut].decode('utf-8'))
+        encoded = encoded[cut:]
+    parts.append(encoded.decode('utf-8'))
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def stream_ics(entries, week_start, domain='timetable'):
+    """
+    Yields an iCalendar file with one weekly recurring event per entry.
+
+    Entries whose period has no start or end time cannot be placed and are left out.
+
+    Args:
+        entries (iterable): TimetableEntry instances with course, subject, staff and period loaded.
+        week_start (date): Monday of the week of the first occurrences.
+        domain (str): Right-hand side of the event UIDs.
+    """
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    day_offset = {day: index for index, (day, _) in enumerate(Period.DAY_CHOICES)}
+    yield _ics_line('BEGIN:VCALENDAR')
+    yield _ics_line('VERSION:2.0')
+    yield _ics_line('PRODID:-//Timetable Generator//Timetable export//EN')
+    yield _ics_line('CALSCALE:GREGORIAN')
+    for entry in entries:
+        period = entry.period
+        offset = day_offset.get(period.day)
+        if offset is None or period.start_time is None or period.end_time is None:
+            continue
+        date = week_start + timedelta(days=offset)
+        start = datetime.combine(date, period.start_time)
+        end = datetime.combine(date, period.end_time)
+        yield _ics_line('BEGIN:VEVENT')
+        yield _ics_line(f'UID:course-{entry.course_id}-period-{entry.period_id}@{domain}')
+        yield _ics_line(f'DTSTAMP:{stamp}')
+        yield _ics_line(f"DTSTART:{start.strftime('%Y%m%dT%H%M%S')}")
+        yield _ics_line(f"DTEND:{end.strftime('%Y%m%dT%H%M%S')}")
+        yield _ics_line(f'RRULE:FREQ=WEEKLY;BYDAY={ICS_WEEKDAYS[offset]}')
+        yield _ics_line(f'SUMMARY:{_ics_text(f"{entry.subject.name} ({entry.course.name})")}')
+        yield _ics_line(f'DESCRIPTION:{_ics_text(f"Staff: {entry.staff.name}")}')
+        yield _ics_line('END:VEVENT')
+    yield _ics_line('END:VCALENDAR')
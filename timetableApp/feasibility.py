@@ -0,0 +1,350 @@
+"""
+Max-flow feasibility pre-check of a solver snapshot.
+
+Before any search starts, the periods that have to be taught are routed through the network
+
+    source -> course -> demand -> staff -> staff day -> slot -> sink
+
+- a course passes at most its open cells,
+- a demand is a subject with a weekly requirement, holding the periods it still needs, or, for
+  solvers that fill every cell, the rest of a course's cells shared by its other subjects (see
+  solver.SubjectQuotas); it reaches the staff qualified for it,
+- a staff member passes at most what their weekly limit leaves, each of their days at most
+  what the daily limit leaves, and reaches each slot they are available and not booked in
+  with one period,
+- a slot passes at most as many periods as there are courses with an open cell in it.
+
+Every timetable the solvers can produce is a flow in this network, so if the maximum flow
+falls short of the demand no timetable exists and the search is skipped. The network does
+not model which course a staff member's period goes to, so passing the check does not
+guarantee a solution. The minimum cut names the bottlenecks: the demands that cannot be
+routed, and the staff, courses and slots whose capacity is used up.
+"""
+from collections import defaultdict, deque, namedtuple
+
+from .solver import UnsatisfiableError
+
+# Bottleneck kinds:
+# - 'subject': a subject (key) needs `needed` more periods but only `available` can be staffed,
+# - 'rest': a course's (key) subjects without a requirement need `needed` periods, `available` can be staffed,
+# - 'course': a course's (key) requirements add up to `needed` periods but it has `available` open cells,
+# - 'staff_week', 'staff_day', 'staff_periods': a staff member (key) whose weekly limit, daily
+#   limits or free periods cap them at the `available` periods routed through them,
+# - 'slot': a slot (key) whose `available` open cells are all used.
+Bottleneck = namedtuple('Bottleneck', ['kind', 'key', 'needed', 'available'])
+SHORTFALL_KINDS = {'subject', 'rest', 'course'}
+
+
+class InfeasibleError(UnsatisfiableError):
+    """
+    Raised when the feasibility pre-check proves that no timetable exists.
+
+    Attributes:
+        report (FeasibilityReport): The failed check.
+        messages (list): One readable sentence per bottleneck.
+    """
+    def __init__(self, report, messages):
+        self.report = report
+        self.messages = messages
+        # Show the largest shortfalls and the first capacity bottlenecks behind them.
+        shortfalls = [message for bottleneck, message in zip(report.bottlenecks, messages)
+                      if bottleneck.kind in SHORTFALL_KINDS]
+        capacities = [message for bottleneck, message in zip(report.bottlenecks, messages)
+                      if bottleneck.kind not in SHORTFALL_KINDS]
+        shown_messages = shortfalls[:3] + capacities[:3]
+        shown = '; '.join(shown_messages)
+        if len(messages) > len(shown_messages):
+            shown += f"; and {len(messages) - len(shown_messages)} more"
+        super().__init__(
+            f"Only {report.flow} of the {report.demand} required periods can be scheduled: {shown}."
+        )
+
+
+class FlowNetwork:
+    """
+    Directed graph with integer edge capacities and Dinic's maximum flow.
+
+    Edges are stored in flat lists in pairs, so edge `e ^ 1` is the residual edge of `e`.
+    """
+    def __init__(self):
+        self.edges_of = []
+        self.target = []
+        self.capacity = []
+
+    def add_node(self):
+        self.edges_of.append([])
+        return len(self.edges_of) - 1
+
+    def add_edge(self, source, target, capacity):
+        """
+        Adds an edge and returns its id.
+        """
+        edge = len(self.target)
+        self.target += [target, source]
+        self.capacity += [capacity, 0]
+        self.edges_of[source].append(edge)
+        self.edges_of[target].append(edge + 1)
+        return edge
+
+    def flow(self, edge):
+        return self.capacity[edge ^ 1]
+
+    def reachable(self, source):
+        """
+        Returns, for each node, whether it can be reached from source along edges with capacity left.
+        """
+        seen = [False] * len(self.edges_of)
+        seen[source] = True
+        queue = deque([source])
+        while queue:
+            node = queue.popleft()
+            for edge in self.edges_of[node]:
+                target = self.target[edge]
+                if self.capacity[edge] > 0 and not seen[target]:
+                    seen[target] = True
+                    queue.append(target)
+        return seen
+
+    def max_flow(self, source, sink):
+        """
+        Saturates the network from source to sink and returns the total flow.
+        """
+        total = 0
+        while True:
+            level = self._levels(source)
+            if level[sink] < 0:
+                return total
+            pointer = [0] * len(self.edges_of)
+            while True:
+                pushed = self._augment(source, sink, level, pointer)
+                if not pushed:
+                    break
+                total += pushed
+
+    def _levels(self, source):
+        level = [-1] * len(self.edges_of)
+        level[source] = 0
+        queue = deque([source])
+        while queue:
+            node = queue.popleft()
+            for edge in self.edges_of[node]:
+                target = self.target[edge]
+                if self.capacity[edge] > 0 and level[target] < 0:
+                    level[target] = level[node] + 1
+                    queue.append(target)
+        return level
+
+    def _augment(self, source, sink, level, pointer):
+        # Walks one shortest path with the current-edge pointers of this phase, retreating from
+        # (and closing) dead ends, and pushes its bottleneck capacity.
+        path = []
+        node = source
+        while node != sink:
+            edges = self.edges_of[node]
+            while pointer[node] < len(edges):
+                edge = edges[pointer[node]]
+                if self.capacity[edge] > 0 and level[self.target[edge]] == level[node] + 1:
+                    break
+                pointer[node] += 1
+            else:
+                if node == source:
+                    return 0
+                level[node] = -1
+                node = self.target[path.pop() ^ 1]
+                pointer[node] += 1
+                continue
+            path.append(edge)
+            node = self.target[edge]
+        pushed = min(self.capacity[edge] for edge in path)
+        for edge in path:
+            self.capacity[edge] -= pushed
+            self.capacity[edge ^ 1] += pushed
+        return pushed
+
+
+class FeasibilityReport:
+    """
+    Result of check_feasibility.
+
+    Attributes:
+        demand (int): Periods that have to be scheduled.
+        flow (int): Periods the network can route.
+        bottlenecks (list): Bottleneck tuples, shortfalls first; empty if the check passed.
+        slot_labels (list): (day, period_number) of each slot, for messages.
+    """
+    def __init__(self, demand, flow, bottlenecks, slot_labels):
+        self.demand = demand
+        self.flow = flow
+        self.bottlenecks = bottlenecks
+        self.slot_labels = slot_labels
+
+    @property
+    def feasible(self):
+        return self.flow >= self.demand
+
+
+def check_feasibility(data, fill_all=False):
+    """
+    Checks by maximum flow whether a snapshot's requirements can be scheduled at all.
+
+    Args:
+        data (SolverInput): The scheduling snapshot.
+        fill_all (bool): Also demand every open cell that is not a free period, as the
+            backtracking solver does; otherwise only weekly subject requirements are demanded.
+
+    Returns:
+        FeasibilityReport: The demand, the maximum flow and, if it falls short, the bottlenecks.
+    """
+    quotas = data.subject_quotas()
+    demands = []  # (kind, key, course_id, periods, staff ids)
+    for course_id in data.course_ids:
+        subject_ids = data.subjects_by_course.get(course_id, ())
+        shared_staff = set()
+        for subject_id in subject_ids:
+            staff_ids = data.staff_by_subject.get(subject_id, ())
+            if subject_id in quotas.remaining:
+                if quotas.remaining[subject_id]:
+                    demands.append(('subject', subject_id, course_id, quotas.remaining[subject_id], staff_ids))
+            else:
+                shared_staff.update(staff_ids)
+        rest = quotas.remaining[('rest', course_id)]
+        if fill_all and rest and course_id not in quotas.free_courses:
+            demands.append(('rest', course_id, course_id, rest, sorted(shared_staff)))
+    demand = sum(periods for _, _, _, periods, _ in demands)
+    if not demand:
+        return FeasibilityReport(0, 0, [], data.slot_labels)
+
+    network = FlowNetwork()
+    source = network.add_node()
+    sink = network.add_node()
+
+    open_cells = {course_id: len(data.periods) for course_id in data.course_ids}
+    slot_open = defaultdict(lambda: len(data.course_ids))
+    for course_id, period_id in data.pinned_cells:
+        if course_id in open_cells:
+            open_cells[course_id] -= 1
+            slot_open[data.slot_of_period[period_id]] -= 1
+
+    course_nodes = {}
+    for course_id in {course_id for _, _, course_id, _, _ in demands}:
+        course_nodes[course_id] = network.add_node()
+        network.add_edge(source, course_nodes[course_id], open_cells[course_id])
+
+    slot_nodes = {}
+    for _, slot in data.periods:
+        if slot_open[slot] > 0:
+            slot_nodes[slot] = network.add_node()
+            network.add_edge(slot_nodes[slot], sink, slot_open[slot])
+
+    limits = data.staff_limits()
+    busy = data.busy_staff()
+    staff_nodes = {}  # staff id -> (in node, out node, {day: node})
+    for staff_id in sorted({staff_id for *_, staff_ids in demands for staff_id in staff_ids}):
+        week_left = demand
+        if staff_id in data.max_per_week:
+            booked = limits.booked[staff_id].bit_count() + data.base_load.get(staff_id, 0)
+            week_left = max(0, data.max_per_week[staff_id] - booked)
+        staff_in, staff_out = network.add_node(), network.add_node()
+        network.add_edge(staff_in, staff_out, week_left)
+        day_nodes = {}
+        unavailable = data.unavailable.get(staff_id, 0)
+        for slot, slot_node in slot_nodes.items():
+            if staff_id in busy[slot] or unavailable >> slot & 1:
+                continue
+            day = data.slot_labels[slot][0]
+            if day not in day_nodes:
+                day_left = demand
+                if staff_id in data.max_per_day:
+                    booked = (limits.booked[staff_id] & limits.day_mask_of_slot[slot]).bit_count()
+                    day_left = max(0, data.max_per_day[staff_id] - booked)
+                day_nodes[day] = network.add_node()
+                network.add_edge(staff_out, day_nodes[day], day_left)
+            network.add_edge(day_nodes[day], slot_node, 1)
+        staff_nodes[staff_id] = (staff_in, staff_out, day_nodes)
+
+    demand_edges = []
+    for kind, key, course_id, periods, staff_ids in demands:
+        node = network.add_node()
+        demand_edges.append(network.add_edge(course_nodes[course_id], node, periods))
+        for staff_id in staff_ids:
+            network.add_edge(node, staff_nodes[staff_id][0], periods)
+
+    flow = network.max_flow(source, sink)
+    if flow >= demand:
+        return FeasibilityReport(demand, flow, [], data.slot_labels)
+
+    reached = network.reachable(source)
+    bottlenecks = []
+    short_courses = defaultdict(int)
+    for (kind, key, course_id, periods, _), edge in zip(demands, demand_edges):
+        routed = network.flow(edge)
+        if routed >= periods:
+            continue
+        if not reached[course_nodes[course_id]]:
+            short_courses[course_id] += periods
+        else:
+            bottlenecks.append(Bottleneck(kind, key, periods, routed))
+    for course_id in short_courses:
+        needed = sum(periods for _, _, owner, periods, _ in demands if owner == course_id)
+        bottlenecks.append(Bottleneck('course', course_id, needed, open_cells[course_id]))
+    bottlenecks.sort(key=lambda bottleneck: bottleneck.available - bottleneck.needed)
+
+    for staff_id, (staff_in, staff_out, day_nodes) in staff_nodes.items():
+        if not reached[staff_in]:
+            continue
+        routed = sum(network.flow(edge) for edge in network.edges_of[staff_in] if edge % 2 == 0)
+        if not reached[staff_out]:
+            kind = 'staff_week'
+        elif any(not reached[node] for node in day_nodes.values()):
+            kind = 'staff_day'
+        else:
+            kind = 'staff_periods'
+        bottlenecks.append(Bottleneck(kind, staff_id, None, routed))
+    for slot, node in slot_nodes.items():
+        if reached[node]:
+            bottlenecks.append(Bottleneck('slot', slot, None, slot_open[slot]))
+    return FeasibilityReport(demand, flow, bottlenecks, data.slot_labels)
+
+
+def describe(report):
+    """
+    Returns one sentence per bottleneck of a failed check, naming courses, subjects and staff.
+
+    Takes up to three queries to look up the names.
+    """
+    from .models import Course, Subject, Staff
+
+    keys = defaultdict(set)
+    for bottleneck in report.bottlenecks:
+        keys[bottleneck.kind].add(bottleneck.key)
+    subjects = Subject.objects.select_related('course').in_bulk(keys['subject']) if keys['subject'] else {}
+    course_ids = keys['course'] | keys['rest']
+    courses = Course.objects.in_bulk(course_ids) if course_ids else {}
+    staff_ids = keys['staff_week'] | keys['staff_day'] | keys['staff_periods']
+    staff = Staff.objects.in_bulk(staff_ids) if staff_ids else {}
+
+    messages = []
+    for kind, key, needed, available in report.bottlenecks:
+        if kind == 'subject':
+            subject = subjects[key]
+            messages.append(
+                f"{subject.name} ({subject.course.name}) needs {needed} more periods but its staff can teach {available}"
+            )
+        elif kind == 'rest':
+            messages.append(
+                f"{courses[key].name} needs {needed} periods of subjects without a weekly requirement "
+                f"but their staff can teach {available}"
+            )
+        elif kind == 'course':
+            messages.append(f"{courses[key].name} requires {needed} periods but has {available} to fill")
+        elif kind == 'slot':
+            day, period_number = report.slot_labels[key]
+            messages.append(f"all {available} open cells on {day} period {period_number} are needed")
+        else:
+            reason = {
+                'staff_week': 'their weekly limit',
+                'staff_day': 'their daily limits',
+                'staff_periods': 'their free periods',
+            }[kind]
+            messages.append(f"{staff[key].name} is fully used ({available} periods, capped by {reason})")
+    return messages
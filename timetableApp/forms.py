@@ -1,5 +1,6 @@
 from django import forms
 from .models import Course, Subject, Staff, Period, TimetableEntry
+from .importer import KINDS, detect_format
 
 class CourseForm(forms.ModelForm):
     """
@@ -25,14 +26,15 @@ class SubjectForm(forms.ModelForm):
         - 'name': The name of the subject.
         - 'course': The related course for the subject.
         - 'staff': The staff members eligible to teach this subject.
+        - 'periods_per_week': Periods the subject is taught per week, empty to share the remaining periods.
     
     Meta:
         model (Subject): The Subject model.
-        fields (list): Specifies the 'name', 'course', and 'staff' fields.
+        fields (list): Specifies the 'name', 'course', 'staff' and 'periods_per_week' fields.
     """
     class Meta:
         model = Subject
-        fields = ['name', 'course', 'staff']
+        fields = ['name', 'course', 'staff', 'periods_per_week']
 
 
 class StaffForm(forms.ModelForm):
@@ -42,13 +44,16 @@ class StaffForm(forms.ModelForm):
     Fields:
         - 'name': The name of the staff member.
         - 'subjects': Subjects that the staff member is qualified to teach.
+        - 'max_periods_per_day': Most periods per day, empty for no limit.
+        - 'max_periods_per_week': Most periods per week, empty for no limit.
+        - 'unavailable_periods': Periods in which the staff member cannot teach.
     
     Attributes:
         subjects (ModelMultipleChoiceField): Allows selection of multiple subjects.
     
     Meta:
         model (Staff): The Staff model.
-        fields (list): Specifies the 'name' and 'subjects' fields.
+        fields (list): Specifies the name, subjects, load limit and unavailable period fields.
     """
     subjects = forms.ModelMultipleChoiceField(
         queryset=Subject.objects.all(),
@@ -56,7 +61,7 @@ class StaffForm(forms.ModelForm):
     )
     class Meta:
         model = Staff
-        fields = ['name', 'subjects'] 
+        fields = ['name', 'subjects', 'max_periods_per_day', 'max_periods_per_week', 'unavailable_periods']
 
 
 class PeriodForm(forms.ModelForm):
@@ -78,4 +83,21 @@ class PeriodForm(forms.ModelForm):
         fields = ['day', 'period_number', 'start_time', 'end_time']
 
 
-        
+class ImportForm(forms.Form):
+    """
+    Form for uploading a CSV or JSON file to import in bulk.
+
+    Fields:
+        - 'kind': What the file contains (courses, subjects, staff or qualifications).
+        - 'file': The uploaded file; its format is taken from the extension.
+    """
+    kind = forms.ChoiceField(choices=[(kind, kind.capitalize()) for kind in KINDS])
+    file = forms.FileField(help_text="CSV with a header row (.csv), or a JSON array or JSON Lines file (.json, .jsonl).")
+
+    def clean_file(self):
+        upload = self.cleaned_data['file']
+        try:
+            self.file_format = detect_format(upload.name)
+        except ValueError as error:
+            raise forms.ValidationError(str(error))
+        return upload
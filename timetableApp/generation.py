@@ -0,0 +1,267 @@
+"""
+Timetable generation service.
+
+Loads the solver snapshot for a scope, runs the configured solver and replaces the
+generated entries of that scope in one short transaction. Generations take turns on the lock
+in locks.py, so concurrent runs never interleave their writes.
+
+Results of seeded generations are memoized under result_key, a fingerprint of the snapshot
+and the generation options. Regenerating with unchanged courses, subjects, qualifications,
+periods and pinned entries and the same seed and options reuses the stored result, and leaves
+the database untouched if it already holds that timetable. Generations without a seed are
+never memoized, so each one draws a new timetable.
+
+solve_timetable runs the same pipeline on a snapshot in memory, for dry runs of the
+generate_timetable management command.
+"""
+import hashlib
+import json
+import random
+from array import array
+from itertools import chain
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from . import cache as timetable_cache
+from .cache import invalidate_timetable
+from .feasibility import InfeasibleError, check_feasibility, describe
+from .locks import hold_lock
+from .models import TimetableEntry
+from .multistart import solve_multistart
+from .optimizer import optimize_assignments
+from .snapshots import take_snapshot
+from .solver import COMPLETE_SOLVERS, Assignment, load_solver_input, get_solver, SolverError
+
+# Number of times generation re-solves when a concurrent edit makes its result violate
+# the double-booking constraints while it is being written.
+WRITE_ATTEMPTS = 3
+
+
+class GenerationConflict(SolverError):
+    """
+    Raised when concurrent edits keep conflicting with the generated timetable.
+    """
+
+
+def generate_timetable(seed=None, mode=None, time_limit=None, attempts=None, workers=None,
+                       course_ids=None, days=None, progress=None, optimize_time=None):
+    """
+    Generates a new timetable by assigning subjects and available staff to courses and periods, ensuring no scheduling conflicts.
+    
+    - Loads the courses, subjects, staff qualifications and periods in scope in a fixed number of queries.
+    - With a seed, reuses the stored result if the snapshot and options are unchanged (see result_key).
+    - Checks by maximum flow that the weekly subject requirements (and, for complete solvers,
+      every cell) can be staffed at all, and fails fast naming the bottlenecks if not.
+    - Keeps manually adjusted entries and entries outside the scope, treating their staff as occupied.
+    - Solves the whole timetable in memory with the selected solver, tracking staff occupancy per slot.
+    - With several attempts, runs them in parallel worker processes and keeps the best-scoring timetable.
+    - Optionally improves the result by simulated annealing (see optimizer.py), which keeps
+      pinned entries and never double-books staff.
+    - Replaces the remaining TimetableEntry records in scope with a single bulk insert, in one
+      short transaction after the result is complete, keeping the previous timetable as an
+      automatic snapshot that can be restored.
+    - Holds the generation lock (see locks.py) throughout, so concurrent runs take turns; a
+      duplicate request waits for the running one and returns the result it published.
+
+    Args:
+        seed (int, optional): Seed for the random subject and staff ordering.
+        mode (str, optional): Solver name from solver.SOLVERS; defaults to settings.TIMETABLE_SOLVER.
+        time_limit (float, optional): Search time limit in seconds; defaults to settings.TIMETABLE_SOLVER_TIME_LIMIT.
+        attempts (int, optional): Number of seeded attempts; defaults to settings.TIMETABLE_GENERATION_ATTEMPTS.
+        workers (int, optional): Worker processes for the attempts; defaults to settings.TIMETABLE_GENERATION_WORKERS.
+        course_ids (list, optional): Only regenerate these courses; defaults to every course.
+        days (list, optional): Only regenerate periods on these days; defaults to every day.
+        progress (callable, optional): Called with (cells_filled, cells_total) while the solver
+            and the optimizer run; the generation lock is renewed from the same reports.
+        optimize_time (float, optional): Seconds of local-search improvement after solving, 0 to skip;
+            defaults to settings.TIMETABLE_OPTIMIZE_TIME_LIMIT.
+
+    Returns:
+        list: The TimetableEntry instances that were created, or the existing generated entries
+        if they already hold the stored result for unchanged inputs.
+
+    Raises:
+        InfeasibleError: If the feasibility pre-check fails; no search is run.
+        SolverError: If the solver cannot fill the timetable; existing entries are left untouched.
+        GenerationConflict: If concurrent edits kept violating the unique (staff, period) or
+            (course, period) constraints while the result was written.
+        LockLost: If the lock was taken over as abandoned before the result was published.
+    """
+    mode, time_limit, attempts, optimize_time = _resolve_options(mode, time_limit, attempts, optimize_time)
+    with hold_lock() as lease:
+        progress = lease.renewing(progress)
+        for _ in range(WRITE_ATTEMPTS):
+            data = load_solver_input(course_ids, days)
+            key = result_key(
+                data, seed=seed, mode=mode, time_limit=time_limit, attempts=attempts,
+                optimize_time=optimize_time, course_ids=course_ids, days=days,
+            )
+            if lease.waited and lease.result_key == key:
+                # An identical request published this result while this one waited for the lock.
+                progress(data.open_cell_count(), data.open_cell_count())
+                return list(_generated_entries(course_ids, days))
+            # Only a seed pins down the result; unseeded requests ask for a fresh timetable.
+            packed = timetable_cache.get_result(key) if seed is not None else None
+            if packed is not None:
+                assignments = unpack_assignments(packed)
+                progress(len(assignments), data.open_cell_count())
+                entries = _stored_entries(assignments, course_ids, days)
+                if entries is not None:
+                    return entries
+            else:
+                assignments = solve_timetable(
+                    data, seed=seed, mode=mode, time_limit=time_limit, attempts=attempts,
+                    workers=workers, progress=progress, optimize_time=optimize_time,
+                )
+                if seed is not None:
+                    timetable_cache.set_result(key, pack_assignments(assignments))
+            try:
+                return _publish(assignments, course_ids, days, lease, key)
+            except IntegrityError:
+                # An editor booked one of the solved slots after the snapshot was loaded; the
+                # database constraints rejected the write, so solve again from fresh data.
+                timetable_cache.discard_result(key)
+                continue
+    raise GenerationConflict("The timetable kept changing while it was being generated; please try again.")
+
+
+def solve_timetable(data, seed=None, mode=None, time_limit=None, attempts=None, workers=None,
+                    progress=None, optimize_time=None):
+    """
+    Solves a snapshot in memory, without reading or writing the timetable.
+
+    Runs the feasibility pre-check, the solver (several seeded attempts on a process pool if
+    `attempts` is above 1) and the optional simulated-annealing improvement. Options default
+    to the same settings as generate_timetable.
+
+    Args:
+        data (SolverInput): The snapshot to solve, from solver.load_solver_input.
+        seed, mode, time_limit, attempts, workers, progress, optimize_time: As for generate_timetable.
+
+    Returns:
+        list: Assignment tuples of the solved cells that are not pinned.
+
+    Raises:
+        InfeasibleError: If the feasibility pre-check fails; naming the bottlenecks takes up to
+            three queries.
+        SolverError: If the solver cannot fill the timetable.
+    """
+    mode, time_limit, attempts, optimize_time = _resolve_options(mode, time_limit, attempts, optimize_time)
+    report = check_feasibility(data, fill_all=mode in COMPLETE_SOLVERS)
+    if not report.feasible:
+        raise InfeasibleError(report, describe(report))
+    if attempts > 1:
+        assignments, _ = solve_multistart(
+            data, mode, attempts,
+            workers=workers or settings.TIMETABLE_GENERATION_WORKERS,
+            seed=seed,
+            time_limit=time_limit,
+            progress=progress
+        )
+    else:
+        assignments = get_solver(mode)(data, random.Random(seed), time_limit, progress)
+    if optimize_time > 0:
+        assignments, _ = optimize_assignments(
+            data, assignments, random.Random(seed), optimize_time, progress=progress
+        )
+    return assignments
+
+
+def _resolve_options(mode, time_limit, attempts, optimize_time):
+    """
+    Fills in the generation options left as None from the settings and validates the solver name.
+    """
+    mode = mode or settings.TIMETABLE_SOLVER
+    get_solver(mode)
+    if time_limit is None:
+        time_limit = settings.TIMETABLE_SOLVER_TIME_LIMIT
+    if attempts is None:
+        attempts = settings.TIMETABLE_GENERATION_ATTEMPTS
+    if optimize_time is None:
+        optimize_time = settings.TIMETABLE_OPTIMIZE_TIME_LIMIT
+    return mode, time_limit, attempts, optimize_time
+
+
+def result_key(data, **options):
+    """
+    Returns the cache key of a generation result.
+
+    Args:
+        data (SolverInput): The snapshot the result is solved from.
+        **options: JSON-serializable generation options that affect the result, such as the
+            seed, solver, time limits and scope.
+
+    Returns:
+        str: A key that changes whenever the snapshot or any option changes.
+    """
+    canonical = json.dumps(
+        {name: sorted(value) if isinstance(value, (list, tuple, set)) else value for name, value in options.items()},
+        sort_keys=True, separators=(',', ':'),
+    )
+    options_hash = hashlib.sha256(canonical.encode()).hexdigest()
+    return f'timetable:result:{data.fingerprint()}:{options_hash}'
+
+
+def pack_assignments(assignments):
+    """
+    Packs assignments into bytes, four 64-bit integers per assignment.
+    """
+    return array('q', chain.from_iterable(assignments)).tobytes()
+
+
+def unpack_assignments(packed):
+    """
+    Returns the Assignment tuples packed by pack_assignments.
+    """
+    values = array('q')
+    values.frombytes(packed)
+    return [Assignment(*values[index:index + 4]) for index in range(0, len(values), 4)]
+
+
+def _generated_entries(course_ids, days):
+    entries = TimetableEntry.objects.filter(is_adjusted=False)
+    if course_ids is not None:
+        entries = entries.filter(course_id__in=course_ids)
+    if days is not None:
+        entries = entries.filter(period__day__in=days)
+    return entries
+
+
+def _stored_entries(assignments, course_ids, days):
+    """
+    Returns the generated entries in scope if they are exactly the given assignments, else None.
+    """
+    entries = list(_generated_entries(course_ids, days))
+    stored = {Assignment(entry.course_id, entry.period_id, entry.subject_id, entry.staff_id) for entry in entries}
+    return entries if stored == set(assignments) and len(entries) == len(assignments) else None
+
+
+def _publish(assignments, course_ids, days, lease, key):
+    """
+    Replaces the unadjusted entries in scope with the solved assignments in one transaction.
+
+    The result is complete before the transaction starts, so readers see either the previous
+    timetable or the new one, never a partly written grid. The previous timetable is kept as
+    an automatic snapshot (see snapshots.py).
+
+    Raises:
+        LockLost: If another generation took the lock over; nothing is written.
+    """
+    with transaction.atomic():
+        lease.publish(key)
+        take_snapshot(automatic=True)
+        _generated_entries(course_ids, days).delete()
+        entries = TimetableEntry.objects.bulk_create([
+            TimetableEntry(
+                course_id=assignment.course_id,
+                subject_id=assignment.subject_id,
+                staff_id=assignment.staff_id,
+                period_id=assignment.period_id
+            )
+            for assignment in assignments
+        ])
+        # bulk_create sends no post_save signals, so invalidate the regenerated courses here.
+        regenerated_courses = {assignment.course_id for assignment in assignments}
+        transaction.on_commit(lambda: invalidate_timetable(regenerated_courses))
+    return entries
@@ -0,0 +1,136 @@
+"""
+Timetable grid helpers.
+
+Places entries into a dense day x period grid so templates can render each cell directly
+instead of searching the entry list. Rows and columns come from the cached slot index (see
+slots.py), so an entry is placed by its period id alone, without joining the Period table.
+"""
+from .models import TimetableEntry
+from .slots import get_slot_index
+
+
+def _place_entries(owner_ids, entries, owner_of, index):
+    """
+    Returns owner id -> day rows -> period columns -> entries, attaching each entry's cached Period.
+    """
+    grid = {
+        owner_id: [[[] for _ in index.period_numbers] for _ in index.days]
+        for owner_id in owner_ids
+    }
+    for entry in entries:
+        slot = index.slot_of_period.get(entry.period_id)
+        owner_id = owner_of(entry)
+        if owner_id in grid and slot is not None:
+            entry.period = index.periods[slot]
+            grid[owner_id][index.day_of_slot[slot]][index.column_of_slot[slot]].append(entry)
+    return grid
+
+
+def build_course_grid(courses, entries, index):
+    """
+    Places timetable entries into a course -> day -> period grid.
+
+    Args:
+        courses (iterable): Course instances, in display order.
+        entries (iterable): TimetableEntry instances; their period does not need to be loaded.
+        index (SlotIndex): Slot index whose days are the rows and period numbers the columns.
+
+    Returns:
+        list: (course, rows) pairs where rows is a list of (day, cells) and each cell is the
+        list of entries scheduled for that course, day and period number.
+    """
+    courses = list(courses)
+    grid = _place_entries([course.id for course in courses], entries, lambda entry: entry.course_id, index)
+    return [(course, list(zip(index.days, grid[course.id]))) for course in courses]
+
+
+def build_staff_grid(staff_members, entries, index):
+    """
+    Places timetable entries into a staff -> day -> period grid with weekly load totals.
+
+    Args:
+        staff_members (iterable): Staff instances, in display order.
+        entries (iterable): TimetableEntry instances; their period does not need to be loaded.
+        index (SlotIndex): Slot index whose days are the rows and period numbers the columns.
+
+    Returns:
+        list: (staff, rows, load) triples where rows is a list of (day, cells, periods taught that
+        day) and load is a dict with the weekly 'periods' taught and the number of 'courses'.
+    """
+    staff_members = list(staff_members)
+    grid = _place_entries([member.id for member in staff_members], entries, lambda entry: entry.staff_id, index)
+    result = []
+    for member in staff_members:
+        rows = []
+        courses = set()
+        for day, cells in zip(index.days, grid[member.id]):
+            rows.append((day, cells, sum(len(cell) for cell in cells)))
+            courses.update(entry.course_id for cell in cells for entry in cell)
+        load = {'periods': sum(count for _, _, count in rows), 'courses': len(courses)}
+        result.append((member, rows, load))
+    return result
+
+GRID_KEYS = ['course', 'staff', 'day']
+
+
+def timetable_payload(by='course', key=None):
+    """
+    Builds the compact JSON form of the timetable grid, grouped by course, staff member or day.
+
+    Cells refer to days and period numbers by their index in 'days' and 'period_numbers', and to
+    courses, subjects and staff by id; each name appears once in the shared 'names' table.
+    Entries are read in one query joined only to the name columns; slots come from the cached index.
+
+    Args:
+        by (str): 'course', 'staff' or 'day'; the keys of 'grid'.
+        key (str or int, optional): Only include this course id, staff id or day name.
+
+    Returns:
+        dict: 'by', 'days', 'period_numbers', 'names' ({'courses', 'subjects', 'staff'}: id -> name),
+        'grid', mapping each key to a list of [day, period, course, subject, staff, is_adjusted]
+        cells, and 'load', mapping each key to its number of cells per day; for staff this is
+        the weekly teaching load.
+    """
+    if by not in GRID_KEYS:
+        raise ValueError(f"Unknown grid key {by!r}; expected one of {', '.join(GRID_KEYS)}.")
+
+    index = get_slot_index()
+    entries = TimetableEntry.objects.all()
+    if key is not None and by == 'day':
+        entries = entries.filter(period_id__in=[index.period_ids[slot] for slot in index.slots_on(key)])
+    elif key is not None:
+        entries = entries.filter(**{f'{by}_id': key})
+    rows = entries.values_list(
+        'course_id', 'course__name', 'subject_id', 'subject__name', 'staff_id', 'staff__name',
+        'period_id', 'is_adjusted',
+    )
+
+    names = {'courses': {}, 'subjects': {}, 'staff': {}}
+    grid = {}
+    for course_id, course, subject_id, subject, staff_id, staff, period_id, is_adjusted in rows:
+        slot = index.slot_of_period.get(period_id)
+        if slot is None:
+            continue
+        names['courses'][course_id] = course
+        names['subjects'][subject_id] = subject
+        names['staff'][staff_id] = staff
+        day = index.day_of_slot[slot]
+        group = {'course': course_id, 'staff': staff_id, 'day': index.days[day]}[by]
+        grid.setdefault(group, []).append([
+            day, index.column_of_slot[slot], course_id, subject_id, staff_id, int(is_adjusted),
+        ])
+    load = {}
+    for group, cells in grid.items():
+        cells.sort()
+        per_day = [0] * len(index.days)
+        for cell in cells:
+            per_day[cell[0]] += 1
+        load[group] = per_day
+    return {
+        'by': by,
+        'days': index.days,
+        'period_numbers': index.period_numbers,
+        'names': names,
+        'grid': grid,
+        'load': load,
+    }
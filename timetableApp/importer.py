@@ -0,0 +1,254 @@
+"""
+Streaming bulk import of courses, subjects, staff and qualifications.
+
+Files are read one row at a time and written in batches. Names are resolved to ids through
+in-memory lookup maps, missing courses, subjects and staff are created with bulk_create, and
+qualifications are inserted straight into the Subject-Staff through table. Each batch runs in
+its own transaction, so an interrupted import keeps the batches that completed.
+
+Memory is bounded by the batch size and the lookup maps, which hold one entry per course,
+subject and staff member and, for qualification imports, one per existing qualification.
+
+Each kind of file has these columns (CSV) or keys (JSON):
+
+- courses: name
+- subjects: name, course
+- staff: name
+- qualifications: staff, subject, course
+
+Rows are matched to existing records by exact name after stripping whitespace; anything that
+does not exist yet is created. Importing the same file twice therefore creates nothing new.
+"""
+import csv
+import json
+import re
+from itertools import islice
+
+from django.db import transaction
+
+from . import cache as timetable_cache
+from .models import Course, Subject, Staff
+
+KINDS = {
+    'courses': ['name'],
+    'subjects': ['name', 'course'],
+    'staff': ['name'],
+    'qualifications': ['staff', 'subject', 'course'],
+}
+FORMATS = ['csv', 'json']
+BATCH_SIZE = 5000
+MAX_REPORTED_ERRORS = 20
+JSON_CHUNK_SIZE = 64 * 1024
+MAX_JSON_RECORD_SIZE = 1024 * 1024
+
+# Whitespace, commas and brackets between JSON records, so that both a top-level array of
+# objects and one object per line (JSON Lines) can be streamed.
+_JSON_SEPARATORS = re.compile(r'[\s,\[\]]*')
+
+
+def detect_format(filename):
+    """
+    Returns 'csv' or 'json' from a file name's extension.
+
+    Raises:
+        ValueError: If the extension is not .csv, .json, .jsonl or .ndjson.
+    """
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if extension == 'csv':
+        return 'csv'
+    if extension in ('json', 'jsonl', 'ndjson'):
+        return 'json'
+    raise ValueError(f"Cannot tell the format of {filename!r}; use a .csv or .json file.")
+
+
+def read_rows(stream, file_format):
+    """
+    Yields (position, row) pairs from a text stream without reading it all into memory.
+
+    The position is the line number for CSV and the record number for JSON.
+
+    Args:
+        stream (file): Text stream; CSV streams should be opened with newline=''.
+        file_format (str): 'csv' or 'json'.
+    """
+    if file_format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    elif file_format == 'json':
+        for number, record in enumerate(_json_records(stream), start=1):
+            yield number, record
+    else:
+        raise ValueError(f"Unknown import format {file_format!r}; expected one of {', '.join(FORMATS)}.")
+
+
+def _json_records(stream):
+    decoder = json.JSONDecoder()
+    buffer = ''
+    offset = 0
+    eof = False
+    while True:
+        offset = _JSON_SEPARATORS.match(buffer, offset).end()
+        if offset < len(buffer):
+            try:
+                record, offset = decoder.raw_decode(buffer, offset)
+            except json.JSONDecodeError:
+                # The record may be cut off at the end of the buffer; read more unless there is
+                # nothing left or the record is too large to be a row.
+                if eof or len(buffer) - offset > MAX_JSON_RECORD_SIZE:
+                    raise
+            else:
+                if not isinstance(record, dict):
+                    raise ValueError(f"JSON records must be objects, not {type(record).__name__}.")
+                yield record
+                continue
+        elif eof:
+            return
+        chunk = stream.read(JSON_CHUNK_SIZE)
+        eof = not chunk
+        buffer = buffer[offset:] + chunk
+        offset = 0
+
+
+class _Lookups:
+    """
+    Name -> id maps of the existing courses, subjects and staff, and for qualification imports
+    the set of existing (subject id, staff id) pairs, extended as rows are created.
+
+    When several records share a name, the oldest one is used.
+    """
+    def __init__(self, kind):
+        self.courses = {}
+        self.subjects = {}
+        self.staff = {}
+        self.qualifications = set()
+        if kind in ('courses', 'subjects', 'qualifications'):
+            for pk, name in Course.objects.order_by('-pk').values_list('pk', 'name').iterator():
+                self.courses[name] = pk
+        if kind in ('subjects', 'qualifications'):
+            for pk, course_id, name in Subject.objects.order_by('-pk').values_list('pk', 'course_id', 'name').iterator():
+                self.subjects[course_id, name] = pk
+        if kind in ('staff', 'qualifications'):
+            for pk, name in Staff.objects.order_by('-pk').values_list('pk', 'name').iterator():
+                self.staff[name] = pk
+        if kind == 'qualifications':
+            self.qualifications.update(Subject.staff.through.objects.values_list('subject_id', 'staff_id').iterator())
+
+    def ensure_courses(self, names):
+        missing = [name for name in dict.fromkeys(names) if name not in self.courses]
+        for course in Course.objects.bulk_create([Course(name=name) for name in missing]):
+            self.courses[course.name] = course.pk
+        return len(missing)
+
+    def ensure_subjects(self, pairs):
+        """
+        Creates the missing subjects of (course name, subject name) pairs; courses must exist.
+        """
+        keys = dict.fromkeys((self.courses[course], name) for course, name in pairs)
+        missing = [key for key in keys if key not in self.subjects]
+        for subject in Subject.objects.bulk_create([Subject(course_id=course_id, name=name) for course_id, name in missing]):
+            self.subjects[subject.course_id, subject.name] = subject.pk
+        return len(missing)
+
+    def ensure_staff(self, names):
+        missing = [name for name in dict.fromkeys(names) if name not in self.staff]
+        for member in Staff.objects.bulk_create([Staff(name=name) for name in missing]):
+            self.staff[member.name] = member.pk
+        return len(missing)
+
+    def ensure_qualifications(self, pairs):
+        """
+        Creates the missing (subject id, staff id) qualifications.
+        """
+        missing = [pair for pair in dict.fromkeys(pairs) if pair not in self.qualifications]
+        Qualification = Subject.staff.through
+        # A concurrent import may have added some of them since the map was loaded.
+        Qualification.objects.bulk_create(
+            [Qualification(subject_id=subject_id, staff_id=staff_id) for subject_id, staff_id in missing],
+            ignore_conflicts=True,
+        )
+        self.qualifications.update(missing)
+        return len(missing)
+
+
+def _clean(position, row, columns, stats):
+    """
+    Returns the stripped values of the row's columns, or None after recording an error.
+    """
+    values = []
+    for column in columns:
+        value = row.get(column)
+        value = str(value).strip() if value is not None else ''
+        if not value:
+            stats['skipped'] += 1
+            if len(stats['errors']) < MAX_REPORTED_ERRORS:
+                stats['errors'].append(f"Row {position}: missing {column!r}.")
+            return None
+        values.append(value)
+    return values
+
+
+def _import_batch(kind, rows, lookups, stats):
+    created = stats['created']
+    if kind == 'courses':
+        created['courses'] += lookups.ensure_courses(name for name, in rows)
+    elif kind == 'staff':
+        created['staff'] += lookups.ensure_staff(name for name, in rows)
+    elif kind == 'subjects':
+        created['courses'] += lookups.ensure_courses(course for _, course in rows)
+        created['subjects'] += lookups.ensure_subjects((course, name) for name, course in rows)
+    else:
+        created['courses'] += lookups.ensure_courses(course for _, _, course in rows)
+        created['subjects'] += lookups.ensure_subjects((course, subject) for _, subject, course in rows)
+        created['staff'] += lookups.ensure_staff(staff for staff, _, _ in rows)
+        created['qualifications'] += lookups.ensure_qualifications(
+            (lookups.subjects[lookups.courses[course], subject], lookups.staff[staff])
+            for staff, subject, course in rows
+        )
+
+
+def import_rows(kind, rows, batch_size=BATCH_SIZE, progress=None):
+    """
+    Imports (position, row) pairs, as yielded by read_rows, in batches.
+
+    Rows with a missing value are skipped and reported; everything else is created unless it
+    already exists.
+
+    Args:
+        kind (str): One of KINDS.
+        rows (iterable): (position, dict) pairs.
+        batch_size (int): Rows written per transaction.
+        progress (callable, optional): Called with the statistics after each batch.
+
+    Returns:
+        dict: 'rows' read, 'batches' written, 'skipped' rows, 'created' counts per model and
+        the first 'errors' messages.
+
+    Raises:
+        ValueError: If the kind is unknown or the file cannot be parsed.
+    """
+    if kind not in KINDS:
+        raise ValueError(f"Unknown import kind {kind!r}; expected one of {', '.join(KINDS)}.")
+    columns = KINDS[kind]
+    stats = {
+        'rows': 0,
+        'batches': 0,
+        'skipped': 0,
+        'created': {'courses': 0, 'subjects': 0, 'staff': 0, 'qualifications': 0},
+        'errors': [],
+    }
+    lookups = _Lookups(kind)
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, batch_size))
+        if not chunk:
+            return stats
+        stats['rows'] += len(chunk)
+        batch = [values for values in (_clean(position, row, columns, stats) for position, row in chunk) if values]
+        if batch:
+            with transaction.atomic():
+                _import_batch(kind, batch, lookups, stats)
+                timetable_cache.schedule_invalidation(structure=True)
+            stats['batches'] += 1
+        if progress is not None:
+            progress(stats)
@@ -0,0 +1,153 @@
+"""
+Background timetable generation jobs.
+
+Generation runs on a local thread pool so the request that starts it returns immediately.
+Each job records its progress on its GenerationJob row, which the status endpoint reads.
+Requests with identical parameters join the job that is already pending or running.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .generation import generate_timetable
+from .models import GenerationJob
+from .solver import SolverError
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+_enqueue_lock = threading.Lock()
+
+# Minimum number of seconds between two progress writes of a running job.
+PROGRESS_WRITE_INTERVAL = 0.5
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.TIMETABLE_JOB_WORKERS,
+                thread_name_prefix='timetable-job'
+            )
+        return _executor
+
+
+def job_key(parameters):
+    """
+    Returns a stable hash of generation parameters, used to detect identical requests.
+    """
+    canonical = json.dumps(parameters, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def enqueue_generation(**parameters):
+    """
+    Starts a background generation, or joins an identical one that is still active.
+
+    A pending or running job is only joined if it reported progress within
+    settings.TIMETABLE_JOB_STALE_AFTER seconds, so jobs orphaned by a restart are not reused.
+
+    Args:
+        **parameters: JSON-serializable keyword arguments for generate_timetable.
+
+    Returns:
+        tuple: (GenerationJob, created) where created is False if an existing job was joined.
+    """
+    key = job_key(parameters)
+    fresh_after = timezone.now() - timedelta(seconds=settings.TIMETABLE_JOB_STALE_AFTER)
+    with _enqueue_lock:
+        job = GenerationJob.objects.filter(
+            key=key,
+            status__in=[GenerationJob.PENDING, GenerationJob.RUNNING],
+            updated_at__gte=fresh_after
+        ).order_by('-created_at').first()
+        if job is not None:
+            return job, False
+        job = GenerationJob.objects.create(key=key, parameters=parameters)
+    transaction.on_commit(lambda: _get_executor().submit(run_job, job.pk))
+    return job, True
+
+
+class _ProgressRecorder:
+    """
+    Progress callback that writes the filled cell count of a job at most every PROGRESS_WRITE_INTERVAL seconds.
+    """
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.filled = 0
+        self.total = 0
+        self.last_write = 0.0
+
+    def __call__(self, filled, total):
+        self.filled, self.total = filled, total
+        now = time.monotonic()
+        if now - self.last_write >= PROGRESS_WRITE_INTERVAL:
+            self.last_write = now
+            GenerationJob.objects.filter(pk=self.job_id).update(
+                cells_filled=filled, cells_total=total, updated_at=timezone.now()
+            )
+
+
+def run_job(job_id):
+    """
+    Executes a generation job and records its outcome; runs on a worker thread.
+
+    Args:
+        job_id (int): The primary key of the GenerationJob to execute.
+    """
+    try:
+        job = GenerationJob.objects.get(pk=job_id)
+        GenerationJob.objects.filter(pk=job_id).update(
+            status=GenerationJob.RUNNING, started_at=timezone.now(), updated_at=timezone.now()
+        )
+        recorder = _ProgressRecorder(job_id)
+        try:
+            generate_timetable(progress=recorder, **job.parameters)
+        except Exception as error:
+            if not isinstance(error, SolverError):
+                logger.exception("Timetable generation job %s failed", job_id)
+            GenerationJob.objects.filter(pk=job_id).update(
+                status=GenerationJob.FAILED, error=str(error),
+                finished_at=timezone.now(), updated_at=timezone.now()
+            )
+        else:
+            GenerationJob.objects.filter(pk=job_id).update(
+                status=GenerationJob.SUCCEEDED,
+                cells_filled=recorder.filled, cells_total=recorder.total,
+                finished_at=timezone.now(), updated_at=timezone.now()
+            )
+    finally:
+        connection.close()
+
+
+def job_status(job):
+    """
+    Returns the JSON-serializable status of a job.
+
+    Args:
+        job (GenerationJob): The job to describe.
+
+    Returns:
+        dict: id, status, percent_filled, cells_filled, cells_total, elapsed_seconds and error.
+    """
+    started = job.started_at or job.created_at
+    finished = job.finished_at or timezone.now()
+    return {
+        'id': job.pk,
+        'status': job.status,
+        'percent_filled': job.percent_filled,
+        'cells_filled': job.cells_filled,
+        'cells_total': job.cells_total,
+        'elapsed_seconds': round((finished - started).total_seconds(), 3),
+        'error': job.error,
+    }
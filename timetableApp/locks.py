@@ -0,0 +1,146 @@
+"""
+Database-backed lock that lets one timetable generation run at a time.
+
+A generation holds the lock from loading its snapshot until its result is published, so two
+runs cannot interleave their deletes and inserts, and a duplicate request waits for the
+running one and then reuses its result instead of solving again. Every scope shares the
+TIMETABLE_LOCK: scopes overlap through shared staff, so what one generation publishes is
+part of the snapshot of the next.
+
+The lock is a GenerationLock row that is free while its owner is blank. Acquiring and
+releasing it are single conditional UPDATEs, so they are atomic on every database. The
+holder renews the lock as the solver, the attempt pool and the optimizer report progress (see
+Lease.renewing); a lock that has not been renewed for settings.TIMETABLE_GENERATION_LOCK_TIMEOUT
+seconds was left by a crashed process and is taken over.
+"""
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import GenerationLock
+from .solver import SolverError
+
+TIMETABLE_LOCK = 'timetable'
+# Seconds between two attempts to take a held lock.
+POLL_INTERVAL = 0.2
+# Minimum number of seconds between two renewals of a held lock.
+RENEW_INTERVAL = 5
+
+
+class LockLost(SolverError):
+    """
+    Raised when a generation's lock was taken over before it could publish its result.
+    """
+
+
+class LockTimeout(SolverError):
+    """
+    Raised when a lock is still held by another generation after the caller's timeout.
+    """
+
+
+class Lease:
+    """
+    A held generation lock.
+
+    Attributes:
+        name (str): Name of the lock.
+        owner (str): Token identifying this holder.
+        waited (bool): True if another generation held the lock when it was requested.
+        result_key (str): Result key of the last timetable published under the lock, read
+            when it was acquired.
+    """
+    def __init__(self, name, owner, waited, result_key):
+        self.name = name
+        self.owner = owner
+        self.waited = waited
+        self.result_key = result_key
+        self.last_renewal = time.monotonic()
+
+    def _held(self):
+        return GenerationLock.objects.filter(name=self.name, owner=self.owner)
+
+    def renewing(self, progress=None):
+        """
+        Returns a progress callback that renews the lock at most every RENEW_INTERVAL seconds
+        before passing the progress on.
+
+        Args:
+            progress (callable, optional): Callback to pass (cells_filled, cells_total) on to.
+        """
+        def renew_and_report(filled, total):
+            now = time.monotonic()
+            if now - self.last_renewal >= RENEW_INTERVAL:
+                self.last_renewal = now
+                self._held().update(renewed_at=timezone.now())
+            if progress is not None:
+                progress(filled, total)
+        return renew_and_report
+
+    def publish(self, result_key):
+        """
+        Records the result being published; call it inside the publishing transaction.
+
+        The UPDATE also locks the row until the transaction ends, so the lock cannot be
+        taken over between this check and the commit.
+
+        Raises:
+            LockLost: If another generation has taken the lock over.
+        """
+        if not self._held().update(renewed_at=timezone.now(), result_key=result_key):
+            raise LockLost("Another generation took over the timetable; please try again.")
+        self.result_key = result_key
+
+    def release(self):
+        self._held().update(owner='', renewed_at=timezone.now())
+
+
+def acquire(name=TIMETABLE_LOCK, timeout=None):
+    """
+    Waits until the named lock is free or abandoned and takes it.
+
+    Args:
+        name (str): Name of the lock.
+        timeout (float, optional): Seconds to wait at most; None waits until the lock is free.
+
+    Returns:
+        Lease: The held lock.
+
+    Raises:
+        LockTimeout: If the lock is still held after `timeout` seconds.
+    """
+    GenerationLock.objects.get_or_create(name=name)
+    owner = uuid.uuid4().hex
+    waited = False
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    while True:
+        now = timezone.now()
+        abandoned = now - timedelta(seconds=settings.TIMETABLE_GENERATION_LOCK_TIMEOUT)
+        taken = GenerationLock.objects.filter(name=name).filter(
+            Q(owner='') | Q(renewed_at__lt=abandoned)
+        ).update(owner=owner, renewed_at=now)
+        if taken:
+            break
+        if deadline is not None and time.monotonic() >= deadline:
+            raise LockTimeout("A timetable generation is running; please try again when it has finished.")
+        waited = True
+        time.sleep(POLL_INTERVAL)
+    result_key = GenerationLock.objects.filter(name=name).values_list('result_key', flat=True).get()
+    return Lease(name, owner, waited, result_key)
+
+
+@contextmanager
+def hold_lock(name=TIMETABLE_LOCK, timeout=None):
+    """
+    Holds the named lock for the duration of a with block (see acquire).
+    """
+    lease = acquire(name, timeout)
+    try:
+        yield lease
+    finally:
+        lease.release()
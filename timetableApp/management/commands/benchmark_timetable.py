@@ -0,0 +1,67 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from timetableApp.benchmarks import run_benchmarks, compare_results
+from timetableApp.solver import SOLVERS
+from timetableApp.synthetic import SIZE_TIERS
+
+
+class Command(BaseCommand):
+    """
+    Benchmarks timetable generation and views on synthetic institutions of several sizes.
+
+    The benchmark runs in a throwaway test database, so existing data is never touched.
+
+    Example:
+        python manage.py benchmark_timetable --tiers small medium --output results.json
+        python manage.py benchmark_timetable --compare results.json
+    """
+    help = "Benchmarks timetable generation and views on synthetic data and writes JSON results."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tiers', nargs='+', choices=list(SIZE_TIERS), default=['small', 'medium', 'large'],
+                            help="Size tiers to run (default: small medium large).")
+        parser.add_argument('--repeat', type=int, default=3, help="Timed repetitions per operation.")
+        parser.add_argument('--mode', choices=list(SOLVERS), help="Solver used for generation.")
+        parser.add_argument('--seed', type=int, default=0, help="Seed of the synthetic data.")
+        parser.add_argument('--output', help="Write the results as JSON to this file.")
+        parser.add_argument('--compare', help="Compare against the JSON results of an earlier run.")
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError("--repeat must be at least 1.")
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as baseline_file:
+                baseline = json.load(baseline_file)
+
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            results = run_benchmarks(
+                options['tiers'], repeat=options['repeat'], mode=options['mode'],
+                seed=options['seed'], report=self.report
+            )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                json.dump(results, output_file, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+        if baseline is not None:
+            for row in compare_results(baseline, results):
+                ratio = f"{row['ratio']:.2f}x" if row['ratio'] is not None else "n/a"
+                self.stdout.write(
+                    f"{row['tier']:<8} {row['operation']:<22} {row['baseline_seconds'] * 1000:9.2f} ms -> "
+                    f"{row['current_seconds'] * 1000:9.2f} ms ({ratio}), "
+                    f"queries {row['baseline_queries']} -> {row['current_queries']}"
+                )
+
+    def report(self, result):
+        self.stdout.write(
+            f"{result['tier']:<8} {result['operation']:<22} {result['seconds_median'] * 1000:9.2f} ms "
+            f"{result['queries']:6d} queries {result['peak_memory_bytes'] / 1024:10.1f} KiB peak"
+        )
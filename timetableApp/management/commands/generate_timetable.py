@@ -0,0 +1,175 @@
+import json
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from timetableApp.generation import generate_timetable, solve_timetable
+from timetableApp.models import Course, Period
+from timetableApp.scoring import Scorer, score_timetable
+from timetableApp.solver import SOLVERS, Assignment, SolverError, UnsatisfiableError, load_solver_input
+
+try:
+    import resource
+except ImportError:  # Not available on Windows.
+    resource = None
+
+# Exit status when the timetable is proven infeasible or comes out incomplete; other solver
+# failures exit with 1.
+INFEASIBLE_EXIT_CODE = 2
+
+
+def peak_rss_bytes(who='self'):
+    """
+    Returns the peak resident set size of this process ('self') or of its finished worker
+    processes ('children') in bytes, or None where the platform does not report it.
+    """
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF if who == 'self' else resource.RUSAGE_CHILDREN)
+    # ru_maxrss is in bytes on macOS and in KiB elsewhere.
+    return usage.ru_maxrss if sys.platform == 'darwin' else usage.ru_maxrss * 1024
+
+
+class Command(BaseCommand):
+    """
+    Generates the timetable without the web interface, for cron jobs and batch runs.
+
+    Runs the same engine as /generate_timetable/ and prints throughput statistics: cells filled
+    per second, SQL queries issued, peak RSS and the score of the result. Exits with status 2
+    if the timetable is infeasible or the result leaves cells in scope unfilled or weekly
+    requirements unmet (unless --allow-incomplete is given), and 1 on any other solver failure.
+
+    Example:
+        python manage.py generate_timetable --mode backtracking --seed 7 --time-limit 60
+        python manage.py generate_timetable --course 3 --course 4 --day Monday --dry-run
+        python manage.py generate_timetable --attempts 8 --workers 4 --json
+    """
+    help = "Generates the timetable from the command line and prints throughput statistics."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, help="Seed for the solver; the same seed and data give the same timetable.")
+        parser.add_argument('--mode', choices=list(SOLVERS), help="Solver (default: TIMETABLE_SOLVER).")
+        parser.add_argument('--time-limit', type=float,
+                            help="Search time limit in seconds (default: TIMETABLE_SOLVER_TIME_LIMIT).")
+        parser.add_argument('--attempts', type=int,
+                            help="Seeded attempts, keeping the best (default: TIMETABLE_GENERATION_ATTEMPTS).")
+        parser.add_argument('--workers', type=int,
+                            help="Worker processes for the attempts (default: TIMETABLE_GENERATION_WORKERS).")
+        parser.add_argument('--optimize', type=float, dest='optimize_time',
+                            help="Seconds of simulated annealing after solving (default: TIMETABLE_OPTIMIZE_TIME_LIMIT).")
+        parser.add_argument('--course', type=int, action='append', dest='course_ids',
+                            help="Only regenerate this course id; repeat for several courses.")
+        parser.add_argument('--day', action='append', dest='days', choices=[day for day, _ in Period.DAY_CHOICES],
+                            help="Only regenerate periods on this day; repeat for several days.")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Solve in memory and report the statistics without writing to the database.")
+        parser.add_argument('--json', action='store_true', help="Print the statistics as JSON.")
+        parser.add_argument('--allow-incomplete', action='store_true',
+                            help="Exit with status 0 even if cells are left unfilled or requirements unmet.")
+
+    def handle(self, *args, **options):
+        for name in ('time_limit', 'attempts', 'workers', 'optimize_time'):
+            if options[name] is not None and options[name] < 0:
+                raise CommandError(f"--{name.replace('_', '-')} must not be negative.")
+        course_ids = options['course_ids']
+        if course_ids:
+            missing = set(course_ids) - set(Course.objects.filter(id__in=course_ids).values_list('id', flat=True))
+            if missing:
+                raise CommandError(f"Unknown course ids: {', '.join(map(str, sorted(missing)))}.")
+        generation_options = {
+            name: options[name]
+            for name in ('seed', 'mode', 'time_limit', 'attempts', 'workers', 'optimize_time')
+        }
+        progress = self.progress if options['verbosity'] > 1 else None
+        self.last_progress = None
+
+        start = time.perf_counter()
+        try:
+            with CaptureQueriesContext(connection) as queries:
+                if options['dry_run']:
+                    data = load_solver_input(course_ids, options['days'])
+                    assignments = solve_timetable(data, progress=progress, **generation_options)
+                    cells = len(assignments)
+                else:
+                    entries = generate_timetable(
+                        course_ids=course_ids, days=options['days'], progress=progress, **generation_options
+                    )
+                    assignments = [
+                        Assignment(entry.course_id, entry.period_id, entry.subject_id, entry.staff_id)
+                        for entry in entries
+                    ]
+                    cells = len(entries)
+        except UnsatisfiableError as error:
+            raise CommandError(f"Infeasible: {error}", returncode=INFEASIBLE_EXIT_CODE)
+        except SolverError as error:
+            raise CommandError(str(error))
+        elapsed = time.perf_counter() - start
+        attempts = options['attempts'] if options['attempts'] is not None else settings.TIMETABLE_GENERATION_ATTEMPTS
+
+        if options['dry_run']:
+            scorer = Scorer.from_solver_input(data)
+            scores = scorer.summary(scorer.score(*scorer.encode(data.pinned + assignments)))['totals']
+        else:
+            scores = score_timetable()['totals']
+            # Completeness is judged within the scope, like the dry run, not over the whole timetable.
+            data = load_solver_input(course_ids, options['days'])
+        unfilled, requirement_gap = data.shortfall(assignments)
+        stats = {
+            'dry_run': options['dry_run'],
+            'cells_filled': cells,
+            'seconds': elapsed,
+            'cells_per_second': cells / elapsed if elapsed else None,
+            'queries': len(queries.captured_queries),
+            'peak_rss_bytes': peak_rss_bytes(),
+            # Only attempts above 1 run on a process pool.
+            'peak_worker_rss_bytes': peak_rss_bytes('children') if attempts > 1 else None,
+            'unfilled_cells': unfilled,
+            'requirement_gap': requirement_gap,
+            'score': scores,
+        }
+        if options['json']:
+            self.stdout.write(json.dumps(stats, indent=2))
+        else:
+            self.write_stats(stats)
+        if (unfilled or requirement_gap) and not options['allow_incomplete']:
+            raise CommandError(
+                f"Incomplete: {unfilled} cells unfilled, requirement gap {requirement_gap}; "
+                f"pass --allow-incomplete to accept it.",
+                returncode=INFEASIBLE_EXIT_CODE,
+            )
+
+    def progress(self, filled, total):
+        # The attempt pool and the optimizer repeat the last count while they run.
+        if (filled, total) == self.last_progress:
+            return
+        self.last_progress = (filled, total)
+        self.stderr.write(f"\r{filled}/{total} cells", ending='')
+        if filled >= total:
+            self.stderr.write('')
+
+    def write_stats(self, stats):
+        rss = stats['peak_rss_bytes']
+        worker_rss = stats['peak_worker_rss_bytes']
+        memory = f"{rss / 2 ** 20:.1f} MiB" if rss is not None else "n/a"
+        if worker_rss:
+            memory += f" (workers {worker_rss / 2 ** 20:.1f} MiB)"
+        score = stats['score']
+        self.stdout.write(f"{'cells filled':>16}  {stats['cells_filled']}")
+        self.stdout.write(f"{'cells unfilled':>16}  {stats['unfilled_cells']}")
+        self.stdout.write(f"{'requirement gap':>16}  {stats['requirement_gap']}")
+        self.stdout.write(f"{'seconds':>16}  {stats['seconds']:.3f}")
+        self.stdout.write(f"{'cells per second':>16}  {stats['cells_per_second'] or 0:.0f}")
+        self.stdout.write(f"{'queries':>16}  {stats['queries']}")
+        self.stdout.write(f"{'peak RSS':>16}  {memory}")
+        self.stdout.write(
+            f"{'score':>16}  penalty {score['penalty']:g}, {score['violations']} violations, "
+            f"{score['empty_cells']} empty cells, requirement gap {score['requirement_gap']}"
+        )
+        if stats['dry_run']:
+            self.stdout.write(self.style.WARNING("Dry run: the timetable was not changed."))
+        else:
+            self.stdout.write(self.style.SUCCESS("Timetable generated."))
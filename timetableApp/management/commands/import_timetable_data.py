@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from timetableApp.importer import KINDS, FORMATS, BATCH_SIZE, detect_format, read_rows, import_rows
+
+
+class Command(BaseCommand):
+    """
+    Streams a CSV or JSON file of courses, subjects, staff or qualifications into the database.
+
+    Example:
+        python manage.py import_timetable_data staff staff.csv
+        python manage.py import_timetable_data qualifications qualifications.jsonl --batch-size 10000
+    """
+    help = "Imports courses, subjects, staff or qualifications from a CSV or JSON file in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=list(KINDS), help="What the file contains.")
+        parser.add_argument('path', help="CSV file with a header row, or JSON array / JSON Lines file.")
+        parser.add_argument('--format', choices=FORMATS, help="File format (default: from the extension).")
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                            help=f"Rows written per transaction (default: {BATCH_SIZE}).")
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+        try:
+            file_format = options['format'] or detect_format(options['path'])
+            with open(options['path'], newline='', encoding='utf-8-sig') as stream:
+                stats = import_rows(
+                    options['kind'], read_rows(stream, file_format),
+                    batch_size=options['batch_size'], progress=self.report
+                )
+        except (OSError, ValueError) as error:
+            raise CommandError(error)
+
+        for message in stats['errors']:
+            self.stderr.write(message)
+        created = ', '.join(f"{count} {name}" for name, count in stats['created'].items())
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {stats['rows']} rows ({stats['skipped']} skipped); created {created}."
+        ))
+
+    def report(self, stats):
+        created = stats['created']
+        self.stdout.write(
+            f"{stats['rows']:>10} rows read, {created['courses']} courses, {created['subjects']} subjects, "
+            f"{created['staff']} staff, {created['qualifications']} qualifications created"
+        )
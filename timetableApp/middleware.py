@@ -0,0 +1,43 @@
+import random
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from .profiling import QueryRecorder, store
+
+
+class QueryProfilingMiddleware:
+    """
+    Records SQL and latency statistics for a sample of requests, grouped by URL name.
+
+    Sampled requests have every query counted, timed and fingerprinted through a database
+    execute wrapper; results are aggregated in profiling.store and served by the
+    'profiling_stats' view. The middleware removes itself when
+    settings.TIMETABLE_PROFILING_SAMPLE_RATE is 0, and otherwise costs one random number per
+    unsampled request.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = settings.TIMETABLE_PROFILING_SAMPLE_RATE
+        if self.sample_rate <= 0:
+            raise MiddlewareNotUsed
+        store.window = settings.TIMETABLE_PROFILING_WINDOW
+
+    def __call__(self, request):
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        wall_seconds = time.perf_counter() - start
+
+        match = getattr(request, 'resolver_match', None)
+        store.record(match.view_name if match else '<unresolved>', wall_seconds, recorder)
+        return response
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:13
+
+from django.db import migrations, models
+
+
+def remove_double_bookings(apps, schema_editor):
+    """
+    Deletes entries that would violate the new constraints, keeping the oldest entry of each
+    course/period cell and of each staff member/period slot.
+    """
+    TimetableEntry = apps.get_model('timetableApp', 'TimetableEntry')
+    seen_cells = set()
+    seen_slots = set()
+    duplicates = []
+    rows = TimetableEntry.objects.order_by('id').values_list('id', 'course_id', 'staff_id', 'period_id')
+    for entry_id, course_id, staff_id, period_id in rows.iterator():
+        if (course_id, period_id) in seen_cells or (staff_id, period_id) in seen_slots:
+            duplicates.append(entry_id)
+        else:
+            seen_cells.add((course_id, period_id))
+            seen_slots.add((staff_id, period_id))
+    TimetableEntry.objects.filter(id__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timetableApp', '0002_generationjob'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='timetableentry',
+            unique_together=set(),
+        ),
+        migrations.RunPython(remove_double_bookings, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='timetableentry',
+            index=models.Index(fields=['period', 'staff'], name='timetable_period_staff_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='timetableentry',
+            constraint=models.UniqueConstraint(fields=('course', 'period'), name='unique_course_period'),
+        ),
+        migrations.AddConstraint(
+            model_name='timetableentry',
+            constraint=models.UniqueConstraint(fields=('staff', 'period'), name='unique_staff_period'),
+        ),
+    ]
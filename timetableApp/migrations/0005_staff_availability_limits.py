@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timetableApp', '0004_period_weekend_days'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='staff',
+            name='max_periods_per_day',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='staff',
+            name='max_periods_per_week',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='staff',
+            name='unavailable_periods',
+            field=models.ManyToManyField(blank=True, related_name='unavailable_staff', to='timetableApp.period'),
+        ),
+    ]
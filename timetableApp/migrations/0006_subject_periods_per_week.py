@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timetableApp', '0005_staff_availability_limits'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subject',
+            name='periods_per_week',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timetableApp', '0006_subject_periods_per_week'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GenerationLock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=64, unique=True)),
+                ('owner', models.CharField(blank=True, max_length=32)),
+                ('renewed_at', models.DateTimeField(blank=True, null=True)),
+                ('result_key', models.CharField(blank=True, max_length=255)),
+            ],
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timetableApp', '0007_generationlock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimetableSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(blank=True, max_length=100)),
+                ('automatic', models.BooleanField(default=False)),
+                ('entry_count', models.PositiveIntegerField(default=0)),
+                ('cells', models.BinaryField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
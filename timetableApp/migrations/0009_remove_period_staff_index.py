@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:27
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timetableApp', '0008_timetablesnapshot'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='timetableentry',
+            name='timetable_period_staff_idx',
+        ),
+    ]
@@ -21,10 +21,13 @@ class Subject(models.Model):
         name (CharField): The name of the subject.
         course (ForeignKey): Reference to the related course.
         staff (ManyToManyField): Staff members qualified to teach this subject.
+        periods_per_week (PositiveSmallIntegerField): Exact number of periods the subject is taught
+            per week; empty to share the course's remaining periods evenly with the other subjects.
     """
     name = models.CharField(max_length=100)
     course = models.ForeignKey(Course, related_name='subjects', on_delete=models.CASCADE)
     staff = models.ManyToManyField('Staff', related_name='subjects')
+    periods_per_week = models.PositiveSmallIntegerField(null=True, blank=True)
 
     def __str__(self):
         return f"{self.name} - {self.course.name}"
@@ -36,8 +39,15 @@ class Staff(models.Model):
 
     Attributes:
         name (CharField): The name of the staff member.
+        max_periods_per_day (PositiveSmallIntegerField): Most periods the staff member teaches on one day; empty for no limit.
+        max_periods_per_week (PositiveSmallIntegerField): Most periods the staff member teaches in the week; empty for no limit.
+        unavailable_periods (ManyToManyField): Periods in which the staff member cannot teach,
+            such as the days or hours a part-time teacher is not in.
     """
     name = models.CharField(max_length=100)
+    max_periods_per_day = models.PositiveSmallIntegerField(blank=True, null=True)
+    max_periods_per_week = models.PositiveSmallIntegerField(blank=True, null=True)
+    unavailable_periods = models.ManyToManyField('Period', blank=True, related_name='unavailable_staff')
 
     def __str__(self):
         return self.name
@@ -45,7 +55,10 @@ class Staff(models.Model):
 
 class Period(models.Model):
     """
-    Represents a specific period in the school timetable for each weekday.
+    Represents a specific period in the school timetable.
+
+    The week consists of exactly the periods in this table: any subset of days, each with its
+    own period numbers.
 
     Attributes:
         day (CharField): The day of the week for this period.
@@ -62,6 +75,8 @@ class Period(models.Model):
         ('Wednesday', 'Wednesday'),
         ('Thursday', 'Thursday'),
         ('Friday', 'Friday'),
+        ('Saturday', 'Saturday'),
+        ('Sunday', 'Sunday'),
     ]
     
     day = models.CharField(max_length=10, choices=DAY_CHOICES)  
@@ -88,7 +103,9 @@ class TimetableEntry(models.Model):
         is_adjusted (BooleanField): Flag indicating if this entry has been manually adjusted.
 
     Meta:
-        unique_together (tuple): Ensures unique combination of course, period, and subject.
+        constraints (list): A course has at most one entry per period, and a staff member
+            teaches at most one course per period. Their indexes serve the course and staff
+            lookups, and the index of the period foreign key serves occupancy lookups by period.
     """
     course = models.ForeignKey(Course, on_delete=models.CASCADE)
     subject = models.ForeignKey(Subject, on_delete=models.CASCADE)
@@ -97,7 +114,105 @@ class TimetableEntry(models.Model):
     is_adjusted = models.BooleanField(default=False) 
 
     class Meta:
-        unique_together = ('course', 'period', 'subject')
+        constraints = [
+            models.UniqueConstraint(fields=['course', 'period'], name='unique_course_period'),
+            models.UniqueConstraint(fields=['staff', 'period'], name='unique_staff_period'),
+        ]
 
     def __str__(self):
         return f"{self.course.name} - {self.subject.name} - {self.period}"
+
+
+class GenerationJob(models.Model):
+    """
+    Represents a timetable generation run executed in the background.
+
+    Attributes:
+        key (CharField): Hash of the generation parameters; identical requests share a key.
+        parameters (JSONField): Keyword arguments passed to generate_timetable.
+        status (CharField): Current state of the job.
+        cells_filled (PositiveIntegerField): Number of cells filled so far.
+        cells_total (PositiveIntegerField): Number of cells the solver has to fill.
+        error (TextField): Failure message if the job failed.
+        created_at (DateTimeField): When the job was enqueued.
+        started_at (DateTimeField): When a worker started the job.
+        finished_at (DateTimeField): When the job succeeded or failed.
+        updated_at (DateTimeField): Last time the job reported progress.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    ]
+
+    key = models.CharField(max_length=64, db_index=True)
+    parameters = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    cells_filled = models.PositiveIntegerField(default=0)
+    cells_total = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Generation job {self.pk} ({self.status})"
+
+    @property
+    def is_finished(self):
+        return self.status in (self.SUCCEEDED, self.FAILED)
+
+    @property
+    def percent_filled(self):
+        if not self.cells_total:
+            return 100.0 if self.status == self.SUCCEEDED else 0.0
+        return round(100.0 * self.cells_filled / self.cells_total, 1)
+
+
+class GenerationLock(models.Model):
+    """
+    Lock that lets one timetable generation run at a time (see locks.py).
+
+    Attributes:
+        name (CharField): Name of the locked scope.
+        owner (CharField): Token of the generation holding the lock; blank while it is free.
+        renewed_at (DateTimeField): When the holder acquired the lock or last renewed it.
+        result_key (CharField): Result key (see generation.result_key) of the last timetable
+            published under the lock.
+    """
+    name = models.CharField(max_length=64, unique=True)
+    owner = models.CharField(max_length=32, blank=True)
+    renewed_at = models.DateTimeField(blank=True, null=True)
+    result_key = models.CharField(max_length=255, blank=True)
+
+    def __str__(self):
+        return f"Generation lock {self.name} ({'held' if self.owner else 'free'})"
+
+
+class TimetableSnapshot(models.Model):
+    """
+    A saved copy of the whole timetable (see snapshots.py).
+
+    Attributes:
+        name (CharField): Optional label.
+        automatic (BooleanField): True for the snapshots taken before a generation or a restore
+            replaces the timetable; only the newest settings.TIMETABLE_SNAPSHOT_KEEP are kept.
+        entry_count (PositiveIntegerField): Number of entries in the snapshot.
+        cells (BinaryField): The entries as a packed little-endian int64 array, one row of
+            (course id, period id, subject id, staff id, is_adjusted) per entry.
+        created_at (DateTimeField): When the snapshot was taken.
+    """
+    name = models.CharField(max_length=100, blank=True)
+    automatic = models.BooleanField(default=False)
+    entry_count = models.PositiveIntegerField(default=0)
+    cells = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Snapshot {self.name or self.pk} ({self.entry_count} entries)"
@@ -0,0 +1,201 @@
+"""
+Parallel multi-start timetable generation.
+
+Runs several independently seeded solver attempts on a process pool and keeps the best
+timetable according to score_assignments. The solver snapshot is sent to each worker once,
+when the worker starts, and is shared read-only by all attempts that run on it.
+"""
+import multiprocessing
+import random
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from .solver import get_solver, SolverError
+
+# Seconds between two progress reports while attempts run on the pool, so callers that renew
+# a lock or a job from the progress callback keep them during long attempts.
+HEARTBEAT_INTERVAL = 1.0
+
+
+def score_assignments(data, assignments):
+    """
+    Scores a candidate timetable; lower is better and (0, 0, ...) means perfect.
+
+    Args:
+        data (SolverInput): The snapshot the candidate was solved from.
+        assignments (list): Assignment tuples of the candidate.
+
+    Returns:
+        tuple: (unfilled, imbalance, load_spread) where
+            - unfilled is the number of empty course/period cells, not counting the free
+              periods of courses whose subjects all have weekly requirements,
+            - imbalance sums how far each subject with a weekly requirement is from it and, over
+              courses, how far the gap between the most and least scheduled of the other
+              subjects exceeds one period (the best achievable balance),
+            - load_spread is the gap between the busiest and least busy qualified staff member.
+    """
+    quotas = data.subject_quotas()
+    free = sum(quotas.remaining[('rest', course_id)] for course_id in quotas.free_courses)
+    unfilled = data.open_cell_count() - free - len(assignments)
+
+    subject_counts = defaultdict(int)
+    staff_load = defaultdict(int)
+    for assignment in data.pinned + assignments:
+        subject_counts[assignment.subject_id] += 1
+        staff_load[assignment.staff_id] += 1
+
+    targets = data.subject_targets()
+    imbalance = sum(abs(subject_counts[subject_id] - target) for subject_id, target in targets.items())
+    for course_id in data.course_ids:
+        counts = [
+            subject_counts[subject_id]
+            for subject_id in data.subjects_by_course.get(course_id, ())
+            if subject_id not in targets
+        ]
+        if counts:
+            imbalance += max(0, max(counts) - min(counts) - 1)
+
+    qualified_staff = {staff_id for staff in data.staff_by_subject.values() for staff_id in staff}
+    loads = [staff_load[staff_id] for staff_id in qualified_staff]
+    load_spread = max(loads) - min(loads) if loads else 0
+    return unfilled, imbalance, load_spread
+
+
+def is_perfect(score):
+    """
+    Returns True if a score has every cell filled and every course balanced.
+    """
+    return score[0] == 0 and score[1] == 0
+
+
+_worker_state = {}
+
+
+class _AttemptStopped(Exception):
+    """
+    Raised from the solver's progress callback to abandon an attempt once another attempt
+    has found a perfect timetable.
+    """
+
+
+def _init_worker(data, mode, time_limit, stop_event, progress=None):
+    _worker_state.update(data=data, mode=mode, time_limit=time_limit, stop_event=stop_event, progress=progress)
+
+
+def _run_attempt(seed):
+    """
+    Runs one seeded solver attempt inside a worker.
+
+    The solver's progress callback, which both solvers call regularly, checks the shared stop
+    event, so a running attempt is abandoned as soon as another one finds a perfect timetable,
+    and passes the progress on to the worker's progress callback, if any.
+
+    Returns:
+        tuple: (score, seed, assignments), (None, seed, error message) if the solver failed,
+        or None if another attempt already found a perfect timetable.
+    """
+    state = _worker_state
+    stop_event = state['stop_event']
+    progress = state.get('progress')
+    if stop_event is not None and stop_event.is_set():
+        return None
+    solve = get_solver(state['mode'])
+
+    def check_stop(filled, total):
+        if stop_event is not None and stop_event.is_set():
+            raise _AttemptStopped
+        if progress is not None:
+            progress(filled, total)
+
+    try:
+        assignments = solve(
+            state['data'], random.Random(seed), state['time_limit'],
+            check_stop if stop_event is not None or progress is not None else None
+        )
+    except _AttemptStopped:
+        return None
+    except SolverError as error:
+        return None, seed, str(error)
+    score = score_assignments(state['data'], assignments)
+    if is_perfect(score) and stop_event is not None:
+        stop_event.set()
+    return score, seed, assignments
+
+
+def _keep_best(best, result, errors):
+    if result is None:
+        return best
+    score, _, payload = result
+    if score is None:
+        errors.append(payload)
+        return best
+    if best is None or score < best[0]:
+        return result
+    return best
+
+
+def solve_multistart(data, mode, attempts, workers=None, seed=None, time_limit=None, progress=None):
+    """
+    Runs `attempts` seeded solver runs and returns the best-scoring timetable.
+
+    Attempts are spread over a ProcessPoolExecutor with `workers` processes. As soon as one
+    attempt produces a perfect timetable the queued attempts are cancelled and the running
+    ones stop at their next progress report.
+
+    Args:
+        data (SolverInput): The scheduling snapshot, shared read-only by all attempts.
+        mode (str): Solver name from solver.SOLVERS.
+        attempts (int): Number of seeded attempts to run.
+        workers (int, optional): Number of worker processes; defaults to the CPU count.
+        seed (int, optional): Base seed; attempt i uses seed + i, so runs are reproducible.
+        time_limit (float, optional): Time limit in seconds for each attempt.
+        progress (callable, optional): Called with (cells_filled, cells_total) of the best
+            timetable so far (0 cells before the first one) each time an attempt finishes, and
+            while attempts run: from the solver's progress reports when the attempts run in
+            this process, at least every HEARTBEAT_INTERVAL seconds on the pool.
+
+    Returns:
+        tuple: (assignments, score) of the best attempt.
+
+    Raises:
+        SolverError: If every attempt failed.
+    """
+    if seed is None:
+        seed = random.randrange(2 ** 32)
+    seeds = [seed + attempt for attempt in range(max(1, attempts))]
+    workers = min(workers or multiprocessing.cpu_count(), len(seeds))
+
+    best = None
+    errors = []
+    total = data.open_cell_count()
+
+    def report(*_):
+        if progress is not None:
+            progress(len(best[2]) if best is not None else 0, total)
+
+    if workers <= 1:
+        _init_worker(data, mode, time_limit, None, report if progress is not None else None)
+        for attempt_seed in seeds:
+            best = _keep_best(best, _run_attempt(attempt_seed), errors)
+            report()
+            if best is not None and is_perfect(best[0]):
+                break
+    else:
+        context = multiprocessing.get_context()
+        stop_event = context.Event()
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                                 initargs=(data, mode, time_limit, stop_event)) as executor:
+            pending = {executor.submit(_run_attempt, attempt_seed) for attempt_seed in seeds}
+            while pending:
+                done, pending = wait(pending, timeout=HEARTBEAT_INTERVAL, return_when=FIRST_COMPLETED)
+                for future in done:
+                    best = _keep_best(best, future.result(), errors)
+                report()
+                if best is not None and is_perfect(best[0]):
+                    executor.shutdown(wait=True, cancel_futures=True)
+                    break
+
+    if best is None:
+        raise SolverError(errors[0] if errors else "No timetable attempt completed.")
+    score, _, assignments = best
+    return assignments, score
@@ -0,0 +1,135 @@
+"""
+Staff occupancy of a single day.
+
+Loads every entry of a day once and answers staff availability questions from an in-memory
+staff x period matrix, so editing a timetable row needs no per-period or per-staff queries.
+Entries are selected and placed by their period's slot (see slots.py), without joining Period.
+Staff availability and daily and weekly load limits are loaded for all candidates at once by
+load_limits and checked the same way.
+"""
+from django.db.models import Count
+
+from .models import Staff, TimetableEntry
+
+
+class DayOccupancy:
+    """
+    Staff x period occupancy matrix of one day, excluding the course being edited.
+
+    Attributes:
+        day (str): The day the matrix covers.
+        period_numbers (list): Period numbers of the day, in order.
+        matrix (dict): Staff id -> list of booleans indexed by the slot index's columns, True
+            where the staff member already teaches another course in that period.
+        unavailable (dict): Staff id -> set of columns the staff member is unavailable in.
+        max_per_day (dict): Staff id -> daily limit, for staff with one.
+        max_per_week (dict): Staff id -> weekly limit, for staff with one.
+        week_load (dict): Staff id -> periods taught in the week outside the edited row, for
+            staff with a weekly limit.
+    """
+    def __init__(self, index, day, course_id):
+        self.day = day
+        self.course_id = course_id
+        self._index = index
+        slots = index.slots_on(day)
+        self.period_numbers = [index.label(slot)[1] for slot in slots]
+        self._period_ids = [index.period_ids[slot] for slot in slots]
+        self.matrix = {}
+        self.unavailable = {}
+        self.max_per_day = {}
+        self.max_per_week = {}
+        self.week_load = {}
+        entries = TimetableEntry.objects.filter(period_id__in=self._period_ids).exclude(course_id=course_id)
+        for staff_id, period_id in entries.values_list('staff_id', 'period_id'):
+            self._occupy_column(staff_id, index.column_of_slot[index.slot_of_period[period_id]])
+
+    def _occupy_column(self, staff_id, column):
+        row = self.matrix.setdefault(staff_id, [False] * len(self._index.period_numbers))
+        row[column] = True
+
+    def load_limits(self, staff_members):
+        """
+        Loads the availability of the given staff on this day and their weekly loads.
+
+        Takes one query, and a second one if any of them has a weekly limit.
+
+        Args:
+            staff_members (iterable): Staff instances; their limit fields are read directly.
+        """
+        staff_members = list(staff_members)
+        for member in staff_members:
+            if member.max_periods_per_day is not None:
+                self.max_per_day[member.id] = member.max_periods_per_day
+            if member.max_periods_per_week is not None:
+                self.max_per_week[member.id] = member.max_periods_per_week
+        unavailable = Staff.unavailable_periods.through.objects.filter(
+            staff_id__in=[member.id for member in staff_members], period_id__in=self._period_ids
+        )
+        index = self._index
+        for staff_id, period_id in unavailable.values_list('staff_id', 'period_id'):
+            column = index.column_of_slot[index.slot_of_period[period_id]]
+            self.unavailable.setdefault(staff_id, set()).add(column)
+        if self.max_per_week:
+            # Everything the staff member teaches except this course's row on this day, which
+            # the caller counts from the row being edited.
+            entries = TimetableEntry.objects.filter(staff_id__in=list(self.max_per_week)).exclude(
+                course_id=self.course_id, period_id__in=self._period_ids
+            )
+            self.week_load = dict(
+                entries.values('staff_id').annotate(count=Count('id')).values_list('staff_id', 'count')
+            )
+
+    def violation(self, staff_id, period_number, row_count=1):
+        """
+        Returns which limit teaching in the given period would break, or None.
+
+        Args:
+            staff_id (int): The staff member.
+            period_number (int): The period of the edited row.
+            row_count (int): Cells of the edited row the staff member would teach, including this one.
+
+        Returns:
+            str: 'unavailable', 'day' or 'week', or None if the staff member may teach the period.
+        """
+        if self._index.column_of_number[period_number] in self.unavailable.get(staff_id, ()):
+            return 'unavailable'
+        day_limit = self.max_per_day.get(staff_id)
+        if day_limit is not None and sum(self.matrix.get(staff_id, ())) + row_count > day_limit:
+            return 'day'
+        week_limit = self.max_per_week.get(staff_id)
+        if week_limit is not None and self.week_load.get(staff_id, 0) + row_count > week_limit:
+            return 'week'
+        return None
+
+    def occupy(self, staff_id, period_number):
+        self._occupy_column(staff_id, self._index.column_of_number[period_number])
+
+    def is_free(self, staff_id, period_number):
+        """
+        Returns True if the staff member teaches no other course in the given period.
+        """
+        return self._is_free_column(staff_id, self._index.column_of_number[period_number])
+
+    def _is_free_column(self, staff_id, column):
+        row = self.matrix.get(staff_id)
+        return row is None or not row[column]
+
+    def free_staff(self, staff, period_number, row_counts=None):
+        """
+        Returns the members of `staff` (Staff instances or ids) that are free in the given period
+        and within their limits.
+
+        Args:
+            staff (iterable): Candidate Staff instances or ids.
+            period_number (int): The period of the edited row.
+            row_counts (dict, optional): Staff id -> other cells of the edited row they teach.
+        """
+        column = self._index.column_of_number[period_number]
+        row_counts = row_counts or {}
+        free = []
+        for member in staff:
+            staff_id = getattr(member, 'id', member)
+            if (self._is_free_column(staff_id, column)
+                    and self.violation(staff_id, period_number, row_counts.get(staff_id, 0) + 1) is None):
+                free.append(member)
+        return free
@@ -0,0 +1,317 @@
+"""
+Local-search improvement of a solved timetable by simulated annealing.
+
+Starting from the solver's assignments, the search repeatedly tries one of two moves:
+
+- swap: exchange the contents of two cells of the same course (either may be empty),
+- reassign: give a filled cell to another qualified staff member who is free in that slot.
+
+A move is only kept if every staff member stays in at most one cell per slot and within their
+availability and daily and weekly limits, and cells of pinned entries (manually adjusted or
+outside the scope) are never touched. Neither move
+changes how often a course teaches each subject, so the search optimizes the remaining soft
+metrics of scoring.Scorer with the same weights: same-day consecutive repeats, staff idle gaps
+and the variance of each staff member's daily load.
+
+Each move is evaluated incrementally. Repeats only change around the two slots involved, and
+a staff member's gaps and daily loads come from one bitmask per day, so a move costs a few
+integer operations regardless of the size of the timetable. The best timetable seen is not
+copied when it is reached: the cells changed since are journaled and undone at the end.
+"""
+import math
+import random
+import time
+from functools import partial
+
+from .scoring import PENALTY_WEIGHTS
+from .solver import Assignment
+
+START_TEMPERATURE = 2.0
+END_TEMPERATURE = 0.02
+SWAP_PROBABILITY = 0.5
+# Iterations between checks of the clock.
+CHECK_INTERVAL = 256
+
+
+def _gaps(mask):
+    """
+    Returns the free slots between the first and last set bit of a day mask.
+    """
+    if not mask:
+        return 0
+    return mask.bit_length() - (mask & -mask).bit_length() + 1 - mask.bit_count()
+
+
+class _State:
+    """
+    Mutable timetable of the courses in scope with the bookkeeping needed for delta evaluation.
+
+    Cells are addressed by `row * slot_count + slot`; `subjects` and `staff` hold None for
+    empty cells.
+    """
+    def __init__(self, data, assignments):
+        self.data = data
+        slot_count = data.slot_count
+        self.slot_count = slot_count
+        self.row_of_course = {course_id: row for row, course_id in enumerate(data.course_ids)}
+        self.period_of_slot = {slot: period_id for period_id, slot in data.periods}
+
+        days = list(dict.fromkeys(day for day, _ in data.slot_labels))
+        day_position = {day: index for index, day in enumerate(days)}
+        self.day_count = len(days)
+        self.day_of_slot = [day_position[day] for day, _ in data.slot_labels]
+        first_slot = {}
+        for slot, day in enumerate(self.day_of_slot):
+            first_slot.setdefault(day, slot)
+        self.bit_of_slot = [1 << (slot - first_slot[day]) for slot, day in enumerate(self.day_of_slot)]
+        self.same_day_next = [
+            slot + 1 < slot_count and self.day_of_slot[slot + 1] == self.day_of_slot[slot]
+            for slot in range(slot_count)
+        ]
+
+        cells = len(data.course_ids) * slot_count
+        self.subjects = [None] * cells
+        self.staff = [None] * cells
+        self.busy = [set() for _ in range(slot_count)]
+        self.limits = data.staff_limits()
+        self.masks = {}
+        self.movable = [[] for _ in data.course_ids]
+        for row, course_id in enumerate(data.course_ids):
+            for period_id, slot in data.periods:
+                if (course_id, period_id) not in data.pinned_cells:
+                    self.movable[row].append(slot)
+        for assignment in list(data.pinned) + list(assignments):
+            slot = data.slot_of_period[assignment.period_id]
+            self._book(assignment.staff_id, slot)
+            row = self.row_of_course.get(assignment.course_id)
+            if row is not None:
+                cell = row * slot_count + slot
+                self.subjects[cell] = assignment.subject_id
+                self.staff[cell] = assignment.staff_id
+
+        self.staff_costs = {staff_id: self.staff_cost(staff_id) for staff_id in self.masks}
+        self.cost = sum(self.staff_costs.values()) + sum(
+            self.repeat(row, slot) for row in range(len(data.course_ids)) for slot in range(slot_count)
+        ) * PENALTY_WEIGHTS['repeats']
+
+    def _book(self, staff_id, slot):
+        self.busy[slot].add(staff_id)
+        self.limits.book(staff_id, slot)
+        masks = self.masks.setdefault(staff_id, [0] * self.day_count)
+        masks[self.day_of_slot[slot]] |= self.bit_of_slot[slot]
+
+    def _release(self, staff_id, slot):
+        self.busy[slot].discard(staff_id)
+        self.limits.release(staff_id, slot)
+        self.masks[staff_id][self.day_of_slot[slot]] &= ~self.bit_of_slot[slot]
+
+    def staff_cost(self, staff_id):
+        masks = self.masks.get(staff_id)
+        if not masks:
+            return 0.0
+        loads = [mask.bit_count() for mask in masks]
+        mean = sum(loads) / len(loads)
+        variance = sum((load - mean) ** 2 for load in loads) / len(loads)
+        gaps = sum(_gaps(mask) for mask in masks)
+        return PENALTY_WEIGHTS['idle_gaps'] * gaps + PENALTY_WEIGHTS['daily_load_variance'] * variance
+
+    def repeat(self, row, slot):
+        """
+        Returns 1 if the course teaches the same subject in `slot` and the next slot of that day.
+        """
+        if not self.same_day_next[slot]:
+            return 0
+        cell = row * self.slot_count + slot
+        subject_id = self.subjects[cell]
+        return int(subject_id is not None and subject_id == self.subjects[cell + 1])
+
+    def repeats_around(self, row, slots):
+        pairs = {pair for slot in slots for pair in (slot - 1, slot) if pair >= 0}
+        return sum(self.repeat(row, pair) for pair in pairs)
+
+    def swap(self, row, first, second):
+        """
+        Exchanges two cells of a course and returns the change in cost, or None if the swap
+        would double-book a staff member or break their limits (nothing is changed then).
+        """
+        a = row * self.slot_count + first
+        b = row * self.slot_count + second
+        staff_a, staff_b = self.staff[a], self.staff[b]
+        if staff_a is None and staff_b is None:
+            return None
+        if staff_a != staff_b:
+            if staff_a is not None and staff_a in self.busy[second]:
+                return None
+            if staff_b is not None and staff_b in self.busy[first]:
+                return None
+        before = self.repeats_around(row, (first, second))
+        self._exchange(a, b, first, second)
+        if not (self.limits.within(staff_a) and self.limits.within(staff_b)):
+            self._exchange(a, b, first, second)
+            return None
+        delta = (self.repeats_around(row, (first, second)) - before) * PENALTY_WEIGHTS['repeats']
+        return delta + self._restaff({staff_a, staff_b} - {None})
+
+    def undo_swap(self, row, first, second):
+        self._exchange(row * self.slot_count + first, row * self.slot_count + second, first, second)
+        self._restaff({self.staff[row * self.slot_count + first], self.staff[row * self.slot_count + second]} - {None})
+
+    def _exchange(self, a, b, first, second):
+        staff_a, staff_b = self.staff[a], self.staff[b]
+        if staff_a != staff_b:
+            if staff_a is not None:
+                self._release(staff_a, first)
+            if staff_b is not None:
+                self._release(staff_b, second)
+            if staff_a is not None:
+                self._book(staff_a, second)
+            if staff_b is not None:
+                self._book(staff_b, first)
+        self.subjects[a], self.subjects[b] = self.subjects[b], self.subjects[a]
+        self.staff[a], self.staff[b] = staff_b, staff_a
+
+    def reassign(self, cell, slot, staff_id):
+        """
+        Gives a filled cell to another staff member and returns the change in cost.
+        """
+        previous = self.staff[cell]
+        self._release(previous, slot)
+        self._book(staff_id, slot)
+        self.staff[cell] = staff_id
+        return self._restaff({previous, staff_id})
+
+    def _restaff(self, staff_ids):
+        """
+        Recomputes the cost of the given staff members and returns the total change.
+        """
+        delta = 0.0
+        for staff_id in staff_ids:
+            cost = self.staff_cost(staff_id)
+            delta += cost - self.staff_costs.get(staff_id, 0.0)
+            self.staff_costs[staff_id] = cost
+        return delta
+
+    def contents(self, cells):
+        """
+        Returns the (cell, subject, staff) contents of the given cells, for the undo journal.
+        """
+        return [(cell, self.subjects[cell], self.staff[cell]) for cell in cells]
+
+    def assignments(self, subjects, staff):
+        """
+        Returns the assignments of the movable cells for a snapshot of `subjects` and `staff`.
+        """
+        result = []
+        for row, course_id in enumerate(self.data.course_ids):
+            for slot in self.movable[row]:
+                cell = row * self.slot_count + slot
+                if subjects[cell] is not None:
+                    result.append(Assignment(course_id, self.period_of_slot[slot], subjects[cell], staff[cell]))
+        return result
+
+
+def _undo_journal(subjects, staff, journal):
+    """
+    Returns copies of `subjects` and `staff` with the journaled changes undone, latest first.
+    """
+    subjects, staff = list(subjects), list(staff)
+    for cell, subject_id, staff_id in reversed(journal):
+        subjects[cell] = subject_id
+        staff[cell] = staff_id
+    return subjects, staff
+
+
+def optimize_assignments(data, assignments, rng=random, time_limit=1.0, max_iterations=None, progress=None):
+    """
+    Improves a solved timetable by simulated annealing within a time budget.
+
+    The temperature falls geometrically from START_TEMPERATURE to END_TEMPERATURE over the
+    budget, and the best timetable seen is returned, so the result never scores worse than
+    the input.
+
+    Args:
+        data (SolverInput): The snapshot the assignments were solved from.
+        assignments (list): Assignment tuples of the solved, unpinned cells.
+        rng (random.Random): Source of randomness for move selection and acceptance.
+        time_limit (float): Search time in seconds.
+        max_iterations (int, optional): Stop after this many moves, for reproducible runs.
+        progress (callable, optional): Called with (cells_filled, cells_total) every
+            CHECK_INTERVAL moves; moves never change how many cells are filled.
+
+    Returns:
+        tuple: (assignments, stats) where stats has 'iterations', 'accepted',
+        'initial_cost' and 'cost' (the cost of the returned timetable).
+    """
+    state = _State(data, assignments)
+    initial_cost = best_cost = state.cost
+    # Contents of the cells changed since the best timetable, before each accepted change, so
+    # the best is recovered by undoing them. Once the journal outgrows the timetable the best is
+    # copied instead, which keeps both the memory and the copying at O(1) per accepted move.
+    journal = []
+    best = None
+    rows = [row for row, slots in enumerate(state.movable) if slots]
+    iterations = accepted = 0
+    if not rows or time_limit <= 0:
+        return assignments, {'iterations': 0, 'accepted': 0, 'initial_cost': initial_cost, 'cost': initial_cost}
+
+    filled, total = len(assignments), data.open_cell_count()
+    start = time.perf_counter()
+    temperature = START_TEMPERATURE
+    cooling = math.log(END_TEMPERATURE / START_TEMPERATURE)
+    while max_iterations is None or iterations < max_iterations:
+        if iterations % CHECK_INTERVAL == 0:
+            if progress is not None:
+                progress(filled, total)
+            elapsed = (time.perf_counter() - start) / time_limit
+            if elapsed >= 1:
+                break
+            temperature = START_TEMPERATURE * math.exp(cooling * elapsed)
+        iterations += 1
+
+        row = rng.choice(rows)
+        slots = state.movable[row]
+        if rng.random() < SWAP_PROBABILITY:
+            if len(slots) < 2:
+                continue
+            first, second = rng.sample(slots, 2)
+            before = state.contents((row * state.slot_count + first, row * state.slot_count + second))
+            delta = state.swap(row, first, second)
+            if delta is None:
+                continue
+            undo = partial(state.undo_swap, row, first, second)
+        else:
+            slot = rng.choice(slots)
+            cell = row * state.slot_count + slot
+            current = state.staff[cell]
+            if current is None:
+                continue
+            candidates = [
+                staff_id for staff_id in data.staff_by_subject.get(state.subjects[cell], ())
+                if staff_id != current and staff_id not in state.busy[slot] and state.limits.allows(staff_id, slot)
+            ]
+            if not candidates:
+                continue
+            before = state.contents((cell,))
+            delta = state.reassign(cell, slot, rng.choice(candidates))
+            undo = partial(state.reassign, cell, slot, current)
+
+        if delta <= 0 or rng.random() < math.exp(-delta / temperature):
+            accepted += 1
+            state.cost += delta
+            if state.cost < best_cost - 1e-9:
+                best_cost = state.cost
+                journal.clear()
+                best = None
+            elif best is None:
+                journal.extend(before)
+                if len(journal) > len(state.subjects):
+                    best = _undo_journal(state.subjects, state.staff, journal)
+                    journal.clear()
+        else:
+            undo()
+
+    if best is None:
+        best = _undo_journal(state.subjects, state.staff, journal)
+    return state.assignments(*best), {
+        'iterations': iterations, 'accepted': accepted, 'initial_cost': initial_cost, 'cost': best_cost,
+    }
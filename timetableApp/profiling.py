@@ -0,0 +1,125 @@
+"""
+In-process request profiling statistics.
+
+QueryProfilingMiddleware records, for sampled requests, the view wall time, the number and total
+duration of SQL queries, and which query shapes ran more than once in the same request (the
+signature of an N+1 pattern). Samples are kept per URL name in a rolling window from which
+p50/p95/p99 are computed on demand.
+"""
+import math
+import re
+import threading
+import time
+from collections import Counter, deque
+
+# Number of distinct duplicate-query fingerprints kept per view.
+MAX_FINGERPRINTS = 50
+
+_IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+\b')
+
+
+def fingerprint(sql):
+    """
+    Normalizes SQL so that queries differing only in parameter values compare equal.
+    """
+    sql = _IN_LIST.sub('IN (...)', sql)
+    sql = _STRING.sub('?', sql)
+    return _NUMBER.sub('?', sql)
+
+
+def percentile(sorted_values, fraction):
+    """
+    Returns the nearest-rank percentile of an ascending list of values.
+    """
+    if not sorted_values:
+        return None
+    # The rank is the smallest covering `fraction` of the values; the tolerance keeps products
+    # such as 0.57 * 100 = 57.00000000000001 from rounding up to the next rank.
+    rank = math.ceil(fraction * len(sorted_values) - 1e-9)
+    return sorted_values[min(len(sorted_values), max(1, rank)) - 1]
+
+
+class QueryRecorder:
+    """
+    Database execute wrapper that counts and times queries of a single request.
+    """
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.count += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+    def duplicates(self):
+        """
+        Returns fingerprint -> number of repeated executions for shapes that ran more than once.
+        """
+        return {sql: count - 1 for sql, count in self.fingerprints.items() if count > 1}
+
+
+class _ViewStats:
+    def __init__(self, window):
+        self.requests = 0
+        self.samples = deque(maxlen=window)  # (wall_ms, queries, sql_ms)
+        self.duplicates = Counter()
+
+    def add(self, wall_seconds, recorder):
+        self.requests += 1
+        self.samples.append((round(wall_seconds * 1000, 3), recorder.count, round(recorder.seconds * 1000, 3)))
+        self.duplicates.update(recorder.duplicates())
+        if len(self.duplicates) > MAX_FINGERPRINTS * 2:
+            self.duplicates = Counter(dict(self.duplicates.most_common(MAX_FINGERPRINTS)))
+
+    def summary(self):
+        columns = list(zip(*self.samples)) if self.samples else [(), (), ()]
+        summary = {'requests': self.requests, 'window': len(self.samples)}
+        for name, values in zip(('wall_ms', 'queries', 'sql_ms'), columns):
+            values = sorted(values)
+            summary[name] = {
+                'p50': percentile(values, 0.50),
+                'p95': percentile(values, 0.95),
+                'p99': percentile(values, 0.99),
+                'max': values[-1] if values else None,
+            }
+        summary['duplicate_queries'] = [
+            {'fingerprint': sql, 'repeats': repeats}
+            for sql, repeats in self.duplicates.most_common(10)
+        ]
+        return summary
+
+
+class ProfileStore:
+    """
+    Thread-safe per-view statistics of the current process.
+    """
+    def __init__(self, window=1000):
+        self.window = window
+        self._views = {}
+        self._lock = threading.Lock()
+
+    def record(self, view_name, wall_seconds, recorder):
+        with self._lock:
+            stats = self._views.get(view_name)
+            if stats is None:
+                stats = self._views[view_name] = _ViewStats(self.window)
+            stats.add(wall_seconds, recorder)
+
+    def summary(self):
+        with self._lock:
+            return {name: stats.summary() for name, stats in sorted(self._views.items())}
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+
+
+store = ProfileStore()
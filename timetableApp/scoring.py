@@ -0,0 +1,408 @@
+"""
+Vectorized timetable quality scoring.
+
+A timetable is encoded as two course x slot integer arrays, the subject index and the staff
+index of every cell (-1 where the cell is empty). Every metric is computed with whole-array
+NumPy operations over a leading candidate axis, so a batch of candidate timetables is scored
+in one pass:
+
+- empty_cells: cells without a subject,
+- requirement_gap: how far each subject with a weekly requirement is from its required periods,
+- subject_variance: for each course, the variance of how often each of its other subjects is taught,
+- daily_load / daily_load_variance: periods each staff member teaches on each day, and the
+  variance of that load across the days of the week,
+- idle_gaps: free periods between a staff member's first and last period of a day,
+- repeats: the same subject in two consecutive periods of a course on the same day,
+- violations: hard-constraint breaches, that is staff teaching two cells in one period, staff
+  not qualified for the subject, subjects of another course, cells with only a subject or
+  only a staff member, staff teaching in a period they are unavailable in, and periods taught
+  beyond a staff member's daily or weekly limit.
+
+`penalty` folds these into one number with PENALTY_WEIGHTS; lower is better.
+"""
+import numpy as np
+
+from .slots import get_slot_index
+
+# Weight of each metric in the penalty. A hard violation outweighs any amount of soft
+# imbalance a realistic timetable can have, and an empty cell outweighs uneven spreading.
+PENALTY_WEIGHTS = {
+    'violations': 10000.0,
+    'empty_cells': 100.0,
+    'requirement_gap': 100.0,
+    'subject_variance': 10.0,
+    'daily_load_variance': 1.0,
+    'idle_gaps': 1.0,
+    'repeats': 1.0,
+}
+VIOLATION_KINDS = [
+    'double_booked', 'unqualified', 'wrong_course', 'incomplete',
+    'unavailable', 'over_daily_limit', 'over_weekly_limit',
+]
+
+
+def _sorted_ids(ids):
+    return np.asarray(sorted(ids), dtype=np.int64)
+
+
+def _lookup(sorted_ids, values):
+    """
+    Returns the position of each value in sorted_ids, or -1 for values that are not in it.
+    """
+    values = np.asarray(values, dtype=np.int64)
+    positions = np.searchsorted(sorted_ids, values)
+    positions = np.minimum(positions, max(len(sorted_ids) - 1, 0))
+    found = (sorted_ids[positions] == values) if len(sorted_ids) else np.zeros(len(values), dtype=bool)
+    return np.where(found, positions, -1)
+
+
+class Scorer:
+    """
+    Scores timetables of a fixed set of courses, subjects, staff and slots.
+
+    Attributes:
+        course_ids (ndarray): Course id of each row, ascending.
+        subject_ids (ndarray): Subject id of each subject index, ascending.
+        staff_ids (ndarray): Staff id of each staff index, ascending.
+        slot_labels (list): (day, period_number) of each slot.
+        days (list): Day names in slot order.
+        subject_course (ndarray): Row of the course each subject belongs to.
+        qualified (ndarray): Subject x staff booleans, True where the staff member may teach it.
+        required (ndarray): Required periods of each subject index, -1 for subjects without a requirement.
+        unavailable (ndarray): Staff x slot booleans, True where the staff member cannot teach.
+        max_per_day, max_per_week (ndarray): Limit of each staff index, -1 for staff without one.
+        base_load (ndarray): Periods each staff index teaches outside the scored slots, which
+            count towards the weekly limit.
+
+    `subject_course` and `qualified` end with an extra -1 / False entry, so the -1 of an empty
+    cell can be used as an index into them like any subject or staff index.
+    """
+    def __init__(self, course_ids, subjects_by_course, staff_by_subject, staff_ids, slot_labels, slot_of_period,
+                 required=None, unavailable=None, max_per_day=None, max_per_week=None, base_load=None):
+        """
+        Args:
+            course_ids (iterable): Courses to score.
+            subjects_by_course (dict): Course id -> ids of its subjects.
+            staff_by_subject (dict): Subject id -> ids of the staff qualified to teach it.
+            staff_ids (iterable): Every staff member that may appear in a timetable.
+            slot_labels (list): (day, period_number) of each slot, in slot order (see slots.SlotIndex).
+            slot_of_period (dict): Period id -> slot.
+            required (dict, optional): Subject id -> periods the subject must be taught in the
+                scored slots, for subjects with a weekly requirement.
+            unavailable (dict, optional): Staff id -> slots the staff member cannot teach in.
+            max_per_day (dict, optional): Staff id -> most periods per day, for staff with a daily limit.
+            max_per_week (dict, optional): Staff id -> most periods per week, for staff with a weekly limit.
+            base_load (dict, optional): Staff id -> periods taught outside the scored slots.
+        """
+        self.course_ids = _sorted_ids(course_ids)
+        subject_course = {
+            subject_id: course_id
+            for course_id, subject_ids in subjects_by_course.items()
+            for subject_id in subject_ids
+        }
+        self.subject_ids = _sorted_ids(subject_course)
+        self.staff_ids = _sorted_ids(set(staff_ids).union(*map(set, staff_by_subject.values())))
+        self.subject_course = np.append(
+            _lookup(self.course_ids, [subject_course[subject_id] for subject_id in self.subject_ids]), -1
+        )
+
+        self.qualified = np.zeros((len(self.subject_ids) + 1, len(self.staff_ids) + 1), dtype=bool)
+        for subject_id, qualified_staff in staff_by_subject.items():
+            row = _lookup(self.subject_ids, [subject_id])[0]
+            if row >= 0 and qualified_staff:
+                self.qualified[row, _lookup(self.staff_ids, qualified_staff)] = True
+        self.course_subjects = np.zeros((len(self.course_ids), len(self.subject_ids)), dtype=bool)
+        known = np.flatnonzero(self.subject_course[:-1] >= 0)
+        self.course_subjects[self.subject_course[known], known] = True
+        self.required = np.full(len(self.subject_ids), -1, dtype=np.int64)
+        for subject_id, periods in (required or {}).items():
+            position = _lookup(self.subject_ids, [subject_id])[0]
+            if position >= 0:
+                self.required[position] = periods
+        # Subjects without a requirement are balanced against each other.
+        self.shared_subjects = self.course_subjects & (self.required < 0)
+        self.subject_totals = self.shared_subjects.sum(axis=1)
+
+        self.slot_labels = list(slot_labels)
+        self.days = list(dict.fromkeys(day for day, _ in self.slot_labels))
+        period_numbers = sorted({number for _, number in self.slot_labels})
+        day_position = {day: index for index, day in enumerate(self.days)}
+        column_of_number = {number: index for index, number in enumerate(period_numbers)}
+        self.day_of_slot = np.array([day_position[day] for day, _ in self.slot_labels], dtype=np.intp)
+        self.column_of_slot = np.array([column_of_number[number] for _, number in self.slot_labels], dtype=np.intp)
+        # Day x column cells that are real periods, and which slot follows another on the same day.
+        self.valid_columns = np.zeros((len(self.days), len(period_numbers)), dtype=bool)
+        self.valid_columns[self.day_of_slot, self.column_of_slot] = True
+        self.same_day_next = self.day_of_slot[1:] == self.day_of_slot[:-1]
+
+        self.period_ids = _sorted_ids(slot_of_period)
+        self.slot_of_period_id = np.array([slot_of_period[period_id] for period_id in self.period_ids], dtype=np.intp)
+
+        self.unavailable = np.zeros((len(self.staff_ids), len(self.slot_labels)), dtype=bool)
+        for staff_id, slots in (unavailable or {}).items():
+            column = _lookup(self.staff_ids, [staff_id])[0]
+            if column >= 0:
+                self.unavailable[column, list(slots)] = True
+        self.max_per_day = self._per_staff(max_per_day, -1)
+        self.max_per_week = self._per_staff(max_per_week, -1)
+        self.base_load = self._per_staff(base_load, 0)
+
+    def _per_staff(self, values, default):
+        """
+        Returns an array with the value of each staff index from a staff id mapping.
+        """
+        array = np.full(len(self.staff_ids), default, dtype=np.int64)
+        if values:
+            columns = _lookup(self.staff_ids, list(values))
+            known = columns >= 0
+            array[columns[known]] = np.fromiter(values.values(), dtype=np.int64, count=len(values))[known]
+        return array
+
+    @property
+    def shape(self):
+        """
+        The (courses, slots) shape of an encoded timetable.
+        """
+        return len(self.course_ids), len(self.slot_labels)
+
+    @classmethod
+    def from_solver_input(cls, data, staff_ids=()):
+        """
+        Returns a scorer for the candidates solved from a SolverInput snapshot.
+        """
+        pinned_staff = {entry.staff_id for entry in data.pinned}
+        unavailable = {
+            staff_id: [slot for slot in range(data.slot_count) if mask >> slot & 1]
+            for staff_id, mask in data.unavailable.items()
+        }
+        return cls(
+            data.course_ids, data.subjects_by_course, data.staff_by_subject,
+            pinned_staff.union(staff_ids), data.slot_labels, data.slot_of_period, data.subject_targets(),
+            unavailable, data.max_per_day, data.max_per_week, data.base_load,
+        )
+
+    def encode(self, assignments):
+        """
+        Encodes assignments as (subjects, staff) course x slot index arrays.
+
+        Assignments of courses, periods or subjects the scorer does not know are left out; an
+        unknown staff member is encoded as -1, which counts as an incomplete cell.
+
+        Args:
+            assignments (iterable): Assignment tuples or any (course_id, period_id, subject_id, staff_id).
+
+        Returns:
+            tuple: Two int32 arrays of shape `self.shape`, -1 where a cell is empty.
+        """
+        values = np.array(list(assignments), dtype=np.int64).reshape(-1, 4)
+        rows = _lookup(self.course_ids, values[:, 0])
+        period_positions = _lookup(self.period_ids, values[:, 1])
+        subjects = _lookup(self.subject_ids, values[:, 2])
+        staff = _lookup(self.staff_ids, values[:, 3])
+        keep = (rows >= 0) & (period_positions >= 0) & (subjects >= 0)
+        slots = self.slot_of_period_id[period_positions[keep]]
+
+        subject_grid = np.full(self.shape, -1, dtype=np.int32)
+        staff_grid = np.full(self.shape, -1, dtype=np.int32)
+        subject_grid[rows[keep], slots] = subjects[keep]
+        staff_grid[rows[keep], slots] = staff[keep]
+        return subject_grid, staff_grid
+
+    def score(self, subjects, staff):
+        """
+        Scores one timetable or a batch of candidates.
+
+        Args:
+            subjects (ndarray): Subject indexes, shape (courses, slots) or (candidates, courses, slots).
+            staff (ndarray): Staff indexes of the same shape.
+
+        Returns:
+            dict: Metric name -> array with one value per candidate (a leading axis of length 1
+            for a single timetable). 'per_course' and 'per_staff' hold (candidates, courses)
+            and (candidates, staff) breakdowns, and 'daily_load' the (candidates, staff, days) loads.
+        """
+        subjects = np.asarray(subjects)
+        staff = np.asarray(staff)
+        if subjects.ndim == 2:
+            subjects = subjects[np.newaxis]
+            staff = staff[np.newaxis]
+        candidates, courses, slots = subjects.shape
+        subject_count, staff_count = len(self.subject_ids), len(self.staff_ids)
+        filled = subjects >= 0
+        staffed = staff >= 0
+        candidate_axis = np.arange(candidates)[:, np.newaxis, np.newaxis]
+        course_axis = np.arange(courses)[np.newaxis, :, np.newaxis]
+        slot_axis = np.arange(slots)[np.newaxis, np.newaxis, :]
+
+        empty = (~filled).sum(axis=(1, 2))
+
+        # Subject balance: how often each course teaches each of its subjects, compared with the
+        # requirement where there is one and with the course's other subjects otherwise.
+        subject_counts = np.bincount(
+            ((candidate_axis * courses + course_axis) * subject_count + subjects)[filled],
+            minlength=candidates * courses * subject_count,
+        ).reshape(candidates, courses, subject_count)
+        required = self.course_subjects & (self.required >= 0)
+        course_gap = np.where(required, np.abs(subject_counts - self.required), 0).sum(axis=2)
+        totals = np.maximum(self.subject_totals, 1)
+        own_counts = np.where(self.shared_subjects, subject_counts, 0)
+        means = own_counts.sum(axis=2) / totals
+        deviations = np.where(self.shared_subjects, subject_counts - means[..., np.newaxis], 0.0)
+        course_variance = (deviations ** 2).sum(axis=2) / totals
+
+        # Staff occupancy of every slot, then laid out as day x column to find daily loads and gaps.
+        occupancy = np.bincount(
+            ((candidate_axis * staff_count + staff) * slots + slot_axis)[staffed],
+            minlength=candidates * staff_count * slots,
+        ).reshape(candidates, staff_count, slots)
+        double_booked = np.maximum(occupancy - 1, 0).sum(axis=(1, 2))
+        week = np.zeros((candidates, staff_count) + self.valid_columns.shape, dtype=bool)
+        week[..., self.day_of_slot, self.column_of_slot] = occupancy > 0
+        daily_load = week.sum(axis=3)
+        started = np.logical_or.accumulate(week, axis=3)
+        unfinished = np.logical_or.accumulate(week[..., ::-1], axis=3)[..., ::-1]
+        staff_gaps = (started & unfinished & ~week & self.valid_columns).sum(axis=(2, 3))
+        staff_load_variance = daily_load.var(axis=2) if self.days else np.zeros((candidates, staff_count))
+
+        # Staff limits: cells in unavailable slots, and periods beyond the daily and weekly caps.
+        unavailable = (occupancy * self.unavailable).sum(axis=2)
+        day_limit = self.max_per_day[:, np.newaxis]
+        over_daily_limit = np.where(day_limit >= 0, np.maximum(daily_load - day_limit, 0), 0).sum(axis=2)
+        periods = occupancy.sum(axis=2)
+        over_weekly_limit = np.where(
+            self.max_per_week >= 0, np.maximum(periods + self.base_load - self.max_per_week, 0), 0
+        )
+
+        repeats = (
+            (subjects[..., 1:] == subjects[..., :-1]) & filled[..., 1:] & self.same_day_next
+        ).sum(axis=2)
+
+        unqualified = (filled & staffed & ~self.qualified[subjects, staff]).sum(axis=(1, 2))
+        wrong_course = (filled & (self.subject_course[subjects] != course_axis)).sum(axis=(1, 2))
+        incomplete = (filled != staffed).sum(axis=(1, 2))
+
+        scores = {
+            'empty_cells': empty,
+            'requirement_gap': course_gap.sum(axis=1),
+            'subject_variance': course_variance.sum(axis=1),
+            'daily_load_variance': staff_load_variance.sum(axis=1),
+            'max_daily_load': daily_load.max(axis=(1, 2)) if daily_load.size else np.zeros(candidates, dtype=int),
+            'idle_gaps': staff_gaps.sum(axis=1),
+            'repeats': repeats.sum(axis=1),
+            'double_booked': double_booked,
+            'unqualified': unqualified,
+            'wrong_course': wrong_course,
+            'incomplete': incomplete,
+            'unavailable': unavailable.sum(axis=1),
+            'over_daily_limit': over_daily_limit.sum(axis=1),
+            'over_weekly_limit': over_weekly_limit.sum(axis=1),
+        }
+        scores['violations'] = sum(scores[kind] for kind in VIOLATION_KINDS)
+        scores['penalty'] = sum(weight * scores[name] for name, weight in PENALTY_WEIGHTS.items())
+        scores['per_course'] = {
+            'empty_cells': (~filled).sum(axis=2),
+            'requirement_gap': course_gap,
+            'subject_variance': course_variance,
+            'repeats': repeats,
+        }
+        scores['per_staff'] = {
+            'periods': periods,
+            'idle_gaps': staff_gaps,
+            'daily_load_variance': staff_load_variance,
+            'unavailable': unavailable,
+            'over_daily_limit': over_daily_limit,
+            'over_weekly_limit': over_weekly_limit,
+        }
+        scores['daily_load'] = daily_load
+        return scores
+
+    def summary(self, scores, candidate=0):
+        """
+        Returns the scores of one candidate as a JSON-serializable dict.
+
+        Per-course and per-staff breakdowns are keyed by id; staff are listed only if they teach.
+        """
+        totals = {
+            name: value[candidate].item()
+            for name, value in scores.items()
+            if name not in ('per_course', 'per_staff', 'daily_load')
+        }
+        per_course = scores['per_course']
+        per_staff = scores['per_staff']
+        daily_load = scores['daily_load'][candidate]
+        teaching = np.flatnonzero(per_staff['periods'][candidate])
+        return {
+            'totals': totals,
+            'weights': PENALTY_WEIGHTS,
+            'days': self.days,
+            'courses': {
+                str(course_id): {name: values[candidate, row].item() for name, values in per_course.items()}
+                for row, course_id in enumerate(self.course_ids.tolist())
+            },
+            'staff': {
+                str(self.staff_ids[column].item()): dict(
+                    {name: values[candidate, column].item() for name, values in per_staff.items()},
+                    daily_load=daily_load[column].tolist(),
+                )
+                for column in teaching.tolist()
+            },
+        }
+
+
+def load_timetable():
+    """
+    Loads the stored timetable and a scorer for it in six queries, plus one for the slot index
+    when periods changed.
+
+    Returns:
+        tuple: (scorer, subjects, staff) with the timetable encoded by the scorer.
+    """
+    from .models import Course, Subject, Staff, TimetableEntry
+
+    index = get_slot_index()
+    subjects_by_course = {}
+    required = {}
+    for subject_id, course_id, periods_per_week in Subject.objects.values_list('id', 'course_id', 'periods_per_week'):
+        subjects_by_course.setdefault(course_id, []).append(subject_id)
+        if periods_per_week is not None:
+            required[subject_id] = periods_per_week
+    staff_by_subject = {}
+    for subject_id, staff_id in Subject.staff.through.objects.values_list('subject_id', 'staff_id'):
+        staff_by_subject.setdefault(subject_id, []).append(staff_id)
+    staff_ids, max_per_day, max_per_week = [], {}, {}
+    for staff_id, day_limit, week_limit in Staff.objects.values_list(
+            'id', 'max_periods_per_day', 'max_periods_per_week'):
+        staff_ids.append(staff_id)
+        if day_limit is not None:
+            max_per_day[staff_id] = day_limit
+        if week_limit is not None:
+            max_per_week[staff_id] = week_limit
+    unavailable = {}
+    for staff_id, period_id in Staff.unavailable_periods.through.objects.values_list('staff_id', 'period_id'):
+        unavailable.setdefault(staff_id, []).append(index.slot_of_period[period_id])
+    scorer = Scorer(
+        Course.objects.values_list('id', flat=True),
+        subjects_by_course,
+        staff_by_subject,
+        staff_ids,
+        [index.label(slot) for slot in range(len(index))],
+        index.slot_of_period,
+        required,
+        unavailable,
+        max_per_day,
+        max_per_week,
+    )
+    entries = TimetableEntry.objects.values_list('course_id', 'period_id', 'subject_id', 'staff_id')
+    subjects, staff = scorer.encode(entries)
+    return scorer, subjects, staff
+
+
+def score_timetable():
+    """
+    Scores the stored timetable.
+
+    Returns:
+        dict: Scorer.summary of the timetable.
+    """
+    scorer, subjects, staff = load_timetable()
+    return scorer.summary(scorer.score(subjects, staff))
@@ -0,0 +1,30 @@
+"""
+Signal receivers that invalidate the cached timetable when its data changes.
+"""
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .cache import schedule_invalidation
+from .models import Course, Subject, Staff, Period, TimetableEntry
+
+
+@receiver(post_save, sender=TimetableEntry)
+@receiver(post_delete, sender=TimetableEntry)
+def invalidate_entry_course(sender, instance, **kwargs):
+    schedule_invalidation(course_id=instance.course_id)
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+def invalidate_course(sender, instance, **kwargs):
+    schedule_invalidation(course_id=instance.pk)
+
+
+@receiver(post_save, sender=Period)
+@receiver(post_delete, sender=Period)
+@receiver(post_save, sender=Subject)
+@receiver(post_delete, sender=Subject)
+@receiver(post_save, sender=Staff)
+@receiver(post_delete, sender=Staff)
+def invalidate_structure(sender, instance, **kwargs):
+    schedule_invalidation(structure=True)
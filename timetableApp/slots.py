@@ -0,0 +1,102 @@
+"""
+Dense integer index of the week's timetable slots.
+
+Every Period is a slot numbered 0..n-1 in timetable order: days in Period.DAY_CHOICES order (days
+outside the choices last), then by period number. Each slot also has a day index and a column,
+the position of its period number among all period numbers in the week, so grids and occupancy
+matrices are addressed with plain list lookups instead of matching day names and period numbers.
+
+The week is whatever the Period table holds; nothing assumes five days or four periods.
+get_slot_index() keeps one index per process and rebuilds it when the cache's 'structure'
+version changes, which happens whenever a period is saved or deleted.
+"""
+import threading
+
+from . import cache as timetable_cache
+from .models import Period
+
+
+class SlotIndex:
+    """
+    Slot numbering of a set of periods.
+
+    Attributes:
+        days (list): Day names that have periods, in timetable order.
+        period_numbers (list): Every period number used on any day, ascending.
+        periods (list): Period of each slot (any objects with id, day and period_number).
+        period_ids (list): Period id of each slot.
+        day_of_slot (list): Index into `days` of each slot.
+        column_of_slot (list): Index into `period_numbers` of each slot.
+        slot_of_period (dict): Period id -> slot.
+        column_of_number (dict): Period number -> column.
+    """
+    def __init__(self, periods):
+        periods = list(periods)
+        day_order = {day: index for index, (day, _) in enumerate(Period.DAY_CHOICES)}
+        periods.sort(key=lambda period: (day_order.get(period.day, len(day_order)), period.day, period.period_number))
+        self.days = list(dict.fromkeys(period.day for period in periods))
+        self.period_numbers = sorted({period.period_number for period in periods})
+        day_position = {day: index for index, day in enumerate(self.days)}
+        self.column_of_number = {number: index for index, number in enumerate(self.period_numbers)}
+
+        self.periods = periods
+        self.period_ids = [period.id for period in periods]
+        self.day_of_slot = [day_position[period.day] for period in periods]
+        self.column_of_slot = [self.column_of_number[period.period_number] for period in periods]
+        self.slot_of_period = {period_id: slot for slot, period_id in enumerate(self.period_ids)}
+        self._day_slots = [[] for _ in self.days]
+        for slot, day in enumerate(self.day_of_slot):
+            self._day_slots[day].append(slot)
+
+    def __len__(self):
+        return len(self.periods)
+
+    def slots_on(self, day):
+        """
+        Returns the slots of a day name in period number order; empty for days without periods.
+        """
+        try:
+            return self._day_slots[self.days.index(day)]
+        except ValueError:
+            return []
+
+    def week_rows(self):
+        """
+        Returns the week as a grid: one [day, periods] pair per day, with the Period of each
+        column of `period_numbers`, or None where the day has no such period.
+        """
+        rows = [[day, [None] * len(self.period_numbers)] for day in self.days]
+        for slot, period in enumerate(self.periods):
+            rows[self.day_of_slot[slot]][1][self.column_of_slot[slot]] = period
+        return rows
+
+    def label(self, slot):
+        """
+        Returns the (day, period_number) of a slot.
+        """
+        period = self.periods[slot]
+        return period.day, period.period_number
+
+
+_cached = (None, None)
+_lock = threading.Lock()
+
+
+def get_slot_index():
+    """
+    Returns the slot index of the current Period table, rebuilt only after periods change.
+
+    The structure version is read before the periods, so a change committed in between is
+    picked up by the next call.
+    """
+    global _cached
+    version = timetable_cache.get_versions(['structure'])['structure']
+    cached_version, index = _cached
+    if cached_version == version:
+        return index
+    with _lock:
+        cached_version, index = _cached
+        if cached_version != version:
+            index = SlotIndex(Period.objects.all())
+            _cached = (version, index)
+    return index
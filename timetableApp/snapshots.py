@@ -0,0 +1,193 @@
+"""
+Timetable snapshots: compact saved copies of the whole timetable that can be compared and
+restored.
+
+A snapshot stores every entry as one row of a packed int64 array (see TimetableSnapshot), so
+taking one is a single SELECT and a single INSERT, and restoring one is a DELETE and a bulk
+insert. Cells are identified by (course id, period id): period ids stay valid when periods
+are added or removed, unlike positions in the slot index.
+
+Snapshots are compared in NumPy without per-cell queries: the (course, period) pairs of both
+sides are merged with np.unique and the subject and staff columns compared in one step.
+
+Generation and restore take an automatic snapshot of the timetable they replace, so a bad
+regeneration can be rolled back, and so can a restore.
+"""
+from collections import namedtuple
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+
+from .cache import invalidate_timetable
+from .locks import hold_lock
+from .models import Course, Period, Staff, Subject, TimetableEntry, TimetableSnapshot
+
+COLUMNS = ('course_id', 'period_id', 'subject_id', 'staff_id', 'is_adjusted')
+CELL_DTYPE = np.dtype('<i8')
+
+# A cell that differs between two timetables; before and after are (subject_id, staff_id)
+# or None where the cell is empty.
+CellChange = namedtuple('CellChange', ['course_id', 'period_id', 'before', 'after'])
+
+
+def current_cells():
+    """
+    Returns the stored timetable as an (entries x 5) int64 array of COLUMNS, in one query.
+    """
+    rows = TimetableEntry.objects.order_by('course_id', 'period_id').values_list(*COLUMNS)
+    return np.array(list(rows), dtype=CELL_DTYPE).reshape(-1, len(COLUMNS))
+
+
+def unpack_cells(snapshot):
+    """
+    Returns the cells of a snapshot as an (entries x 5) int64 array of COLUMNS.
+    """
+    return np.frombuffer(bytes(snapshot.cells), dtype=CELL_DTYPE).reshape(-1, len(COLUMNS))
+
+
+def take_snapshot(name='', automatic=False):
+    """
+    Saves the whole stored timetable as a snapshot.
+
+    Args:
+        name (str): Optional label.
+        automatic (bool): True for the snapshots taken before the timetable is replaced; older
+            automatic snapshots beyond settings.TIMETABLE_SNAPSHOT_KEEP are deleted.
+
+    Returns:
+        TimetableSnapshot: The new snapshot, or None for an automatic snapshot of an empty
+        timetable, which is not saved.
+    """
+    cells = current_cells()
+    if automatic and not len(cells):
+        return None
+    snapshot = TimetableSnapshot.objects.create(
+        name=name, automatic=automatic, entry_count=len(cells), cells=cells.tobytes()
+    )
+    if automatic:
+        stale = TimetableSnapshot.objects.filter(automatic=True).order_by('-created_at', '-pk').values_list(
+            'pk', flat=True
+        )[settings.TIMETABLE_SNAPSHOT_KEEP:]
+        TimetableSnapshot.objects.filter(pk__in=list(stale)).delete()
+    return snapshot
+
+
+def diff_cells(before, after):
+    """
+    Returns the cells whose subject or staff differ between two cell arrays.
+
+    Args:
+        before (numpy.ndarray): Cells from current_cells or unpack_cells.
+        after (numpy.ndarray): Cells to compare against.
+
+    Returns:
+        list: CellChange tuples ordered by course and period. Whether an entry was adjusted by
+        hand is not compared.
+    """
+    keys = np.concatenate([before[:, :2], after[:, :2]])
+    pairs, inverse = np.unique(keys, axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    old = np.full((len(pairs), 2), -1, dtype=CELL_DTYPE)
+    new = np.full((len(pairs), 2), -1, dtype=CELL_DTYPE)
+    old[inverse[:len(before)]] = before[:, 2:4]
+    new[inverse[len(before):]] = after[:, 2:4]
+    changed = np.flatnonzero((old != new).any(axis=1))
+
+    def content(row):
+        return None if row[0] < 0 else (int(row[0]), int(row[1]))
+
+    return [
+        CellChange(int(pairs[index, 0]), int(pairs[index, 1]), content(old[index]), content(new[index]))
+        for index in changed
+    ]
+
+
+def describe_changes(changes):
+    """
+    Returns JSON-serializable descriptions of cell changes with the names of their courses,
+    periods, subjects and staff, in four queries.
+
+    Ids that no longer exist are described with a None name.
+    """
+    course_ids, period_ids, subject_ids, staff_ids = set(), set(), set(), set()
+    for change in changes:
+        course_ids.add(change.course_id)
+        period_ids.add(change.period_id)
+        for side in (change.before, change.after):
+            if side is not None:
+                subject_ids.add(side[0])
+                staff_ids.add(side[1])
+    courses = dict(Course.objects.filter(id__in=course_ids).values_list('id', 'name'))
+    periods = {period.id: period for period in Period.objects.filter(id__in=period_ids)}
+    subjects = dict(Subject.objects.filter(id__in=subject_ids).values_list('id', 'name'))
+    staff = dict(Staff.objects.filter(id__in=staff_ids).values_list('id', 'name'))
+
+    def side(cell):
+        if cell is None:
+            return None
+        return {
+            'subject_id': cell[0], 'subject': subjects.get(cell[0]),
+            'staff_id': cell[1], 'staff': staff.get(cell[1]),
+        }
+
+    described = []
+    for change in changes:
+        period = periods.get(change.period_id)
+        described.append({
+            'course_id': change.course_id,
+            'course': courses.get(change.course_id),
+            'period_id': change.period_id,
+            'day': period.day if period else None,
+            'period_number': period.period_number if period else None,
+            'before': side(change.before),
+            'after': side(change.after),
+        })
+    return described
+
+
+def restore_snapshot(snapshot):
+    """
+    Replaces the whole stored timetable with a snapshot, including which entries were
+    adjusted by hand.
+
+    Holds the generation lock, so it never interleaves with a generation, waiting at most
+    settings.TIMETABLE_RESTORE_LOCK_WAIT seconds for a running one, and takes an automatic
+    snapshot of the timetable it replaces first. Entries whose course, period, subject or
+    staff member has been deleted since are skipped. Qualifications and staff
+    limits are not rechecked: the snapshot is restored as it was.
+
+    Args:
+        snapshot (TimetableSnapshot): The snapshot to restore.
+
+    Returns:
+        tuple: (restored, skipped) entry counts.
+
+    Raises:
+        LockTimeout: If a generation still holds the lock after the wait; nothing is changed.
+        LockLost: If the lock was taken over as abandoned before the restore was written.
+    """
+    cells = unpack_cells(snapshot)
+    with hold_lock(timeout=settings.TIMETABLE_RESTORE_LOCK_WAIT) as lease:
+        keep = np.ones(len(cells), dtype=bool)
+        for column, model in enumerate((Course, Period, Subject, Staff)):
+            ids = np.unique(cells[:, column]).tolist()
+            existing = np.array(list(model.objects.filter(id__in=ids).values_list('id', flat=True)), dtype=CELL_DTYPE)
+            keep &= np.isin(cells[:, column], existing)
+        restored = cells[keep]
+        with transaction.atomic():
+            # Anything published before this restore is no longer in the timetable.
+            lease.publish('')
+            take_snapshot(automatic=True)
+            TimetableEntry.objects.all().delete()
+            TimetableEntry.objects.bulk_create([
+                TimetableEntry(
+                    course_id=course_id, period_id=period_id, subject_id=subject_id,
+                    staff_id=staff_id, is_adjusted=bool(is_adjusted)
+                )
+                for course_id, period_id, subject_id, staff_id, is_adjusted in restored.tolist()
+            ])
+            # bulk_create sends no post_save signals, so invalidate the restored courses here.
+            restored_courses = set(restored[:, 0].tolist())
+            transaction.on_commit(lambda: invalidate_timetable(restored_courses))
+    return len(restored), len(cells) - len(restored)
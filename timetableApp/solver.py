@@ -0,0 +1,798 @@
+"""
+In-memory timetable solver.
+
+The solver works on a read-only snapshot of courses, subjects, qualified staff and periods
+that is loaded in a fixed number of queries. Staff occupancy is tracked in memory, so
+producing a timetable never touches the database after the snapshot has been taken.
+Only load_solver_input touches the ORM, so the solvers themselves can run in worker processes
+that never set up Django.
+"""
+import hashlib
+import heapq
+import math
+import random
+import time
+from collections import defaultdict, namedtuple
+
+
+Assignment = namedtuple('Assignment', ['course_id', 'period_id', 'subject_id', 'staff_id'])
+
+# Number of search steps between two progress reports of the backtracking solver.
+PROGRESS_INTERVAL = 256
+# Search steps per open cell, beyond the one step each cell needs, before the backtracking
+# solver first restarts (at least MIN_RESTART_SLACK); the slack doubles with every restart.
+RESTART_SLACK = 0.1
+MIN_RESTART_SLACK = 16
+
+
+class SolverError(Exception):
+    """
+    Raised when a solver cannot produce a complete timetable.
+    """
+
+
+class UnsatisfiableError(SolverError):
+    """
+    Raised when the search space is exhausted without filling every cell.
+    """
+
+
+class SolverTimeout(SolverError):
+    """
+    Raised when a solver does not finish within its time limit.
+    """
+
+
+class SolverInput:
+    """
+    Snapshot of the data needed to generate a timetable.
+
+    Attributes:
+        course_ids (list): Primary keys of the courses to schedule.
+        subjects_by_course (dict): Maps a course id to the ids of its subjects.
+        staff_by_subject (dict): Maps a subject id to the ids of staff qualified to teach it.
+        periods (list): (period_id, slot) pairs of the periods to schedule, in timetable order.
+            Slots are dense integers numbering every period of the week (see slots.SlotIndex).
+        slot_labels (list): (day, period_number) of each slot, used in messages.
+        slot_of_period (dict): Period id -> slot, for every period of the week.
+        pinned (list): Assignment tuples of existing entries in these periods that must be kept.
+            They occupy their staff and, for scheduled courses, their cell.
+        pinned_cells (set): (course_id, period_id) cells already filled by pinned entries.
+        unavailable (dict): Staff id -> bitmask of the slots the staff member cannot teach in
+            (bit n is slot n). Staff without unavailable periods are left out.
+        max_per_day (dict): Staff id -> most periods per day, for staff with a daily limit.
+        max_per_week (dict): Staff id -> most periods per week, for staff with a weekly limit.
+        base_load (dict): Staff id -> periods taught in kept entries outside the snapshot, which
+            count towards the weekly limit.
+        required (dict): Subject id -> periods per week, for subjects with a weekly requirement.
+        subject_base (dict): Subject id -> periods taught in kept entries outside the snapshot,
+            which count towards the requirement.
+    """
+    def __init__(self, course_ids, subjects_by_course, staff_by_subject, periods, slot_labels,
+                 slot_of_period, pinned=(), unavailable=None, max_per_day=None, max_per_week=None,
+                 base_load=None, required=None, subject_base=None):
+        self.course_ids = course_ids
+        self.subjects_by_course = subjects_by_course
+        self.staff_by_subject = staff_by_subject
+        self.periods = periods
+        self.slot_labels = slot_labels
+        self.slot_of_period = slot_of_period
+        self.pinned = list(pinned)
+        self.pinned_cells = {(entry.course_id, entry.period_id) for entry in self.pinned}
+        self.unavailable = unavailable or {}
+        self.max_per_day = max_per_day or {}
+        self.max_per_week = max_per_week or {}
+        self.base_load = base_load or {}
+        self.required = required or {}
+        self.subject_base = subject_base or {}
+
+    def fingerprint(self):
+        """
+        Returns a hash of the snapshot's contents, independent of the order they were loaded in.
+
+        Any change to the courses, subjects, weekly requirements, qualifications, periods, pinned
+        entries or staff limits in the snapshot produces a different fingerprint.
+        """
+        canonical = (
+            sorted(self.course_ids),
+            sorted((course_id, sorted(subject_ids)) for course_id, subject_ids in self.subjects_by_course.items()),
+            sorted((subject_id, sorted(staff_ids)) for subject_id, staff_ids in self.staff_by_subject.items()),
+            sorted(self.periods),
+            self.slot_labels,
+            sorted(self.slot_of_period.items()),
+            sorted(self.pinned),
+            sorted(self.unavailable.items()),
+            sorted(self.max_per_day.items()),
+            sorted(self.max_per_week.items()),
+            sorted(self.base_load.items()),
+            sorted(self.required.items()),
+            sorted(self.subject_base.items()),
+        )
+        return hashlib.sha256(repr(canonical).encode()).hexdigest()
+
+    @property
+    def slot_count(self):
+        return len(self.slot_labels)
+
+    def open_cell_count(self):
+        """
+        Returns the number of cells of the scheduled courses that the solver has to fill.
+        """
+        course_ids = set(self.course_ids)
+        pinned = sum(1 for course_id, _ in self.pinned_cells if course_id in course_ids)
+        return len(self.course_ids) * len(self.periods) - pinned
+
+    def busy_staff(self):
+        """
+        Returns a list with, for each slot, the set of staff ids occupied by pinned entries.
+        """
+        busy = [set() for _ in range(self.slot_count)]
+        for entry in self.pinned:
+            busy[self.slot_of_period[entry.period_id]].add(entry.staff_id)
+        return busy
+
+    def staff_limits(self):
+        """
+        Returns a StaffLimits tracker with the pinned entries already booked.
+        """
+        limits = StaffLimits(self)
+        for entry in self.pinned:
+            limits.book(entry.staff_id, self.slot_of_period[entry.period_id])
+        return limits
+
+    def subject_targets(self):
+        """
+        Returns subject id -> periods each subject with a weekly requirement must be taught in the
+        snapshot's periods, pinned entries included.
+        """
+        return {
+            subject_id: max(0, periods - self.subject_base.get(subject_id, 0))
+            for subject_id, periods in self.required.items()
+        }
+
+    def subject_quotas(self):
+        """
+        Returns a SubjectQuotas tracker with the pinned entries already counted.
+        """
+        return SubjectQuotas(self)
+
+    def shortfall(self, assignments):
+        """
+        Returns how far a solution of the snapshot is from complete.
+
+        Args:
+            assignments (list): Assignment tuples of the solved, unpinned cells.
+
+        Returns:
+            tuple: (unfilled, requirement_gap) where unfilled counts the open cells left empty,
+            not counting the free periods of courses whose subjects all have weekly
+            requirements, and requirement_gap sums how far each subject with a requirement is
+            from its target in the snapshot's periods (see subject_targets).
+        """
+        unfilled = max(0, self.open_cell_count() - self.subject_quotas().free_cells() - len(assignments))
+        taught = self.pinned_subject_counts()
+        for assignment in assignments:
+            taught[assignment.subject_id] += 1
+        requirement_gap = sum(abs(taught[subject_id] - target) for subject_id, target in self.subject_targets().items())
+        return unfilled, requirement_gap
+
+    def pinned_subject_counts(self):
+        """
+        Returns a mapping of subject id to the number of pinned entries teaching it.
+        """
+        counts = defaultdict(int)
+        for entry in self.pinned:
+            counts[entry.subject_id] += 1
+        return counts
+
+
+class StaffLimits:
+    """
+    Availability and load limits of a snapshot's staff, checked against the slots they are booked in.
+
+    Each limited staff member's bookings are one integer bitmask over the slots, so whether a
+    slot is unavailable, and the day's and the week's loads, are a mask and a popcount away.
+    Staff without limits are never tracked and always allowed.
+    """
+    def __init__(self, data):
+        self.unavailable = data.unavailable
+        self.max_per_day = data.max_per_day
+        self.max_per_week = data.max_per_week
+        self.base_load = data.base_load
+        self.limited = set(self.unavailable) | set(self.max_per_day) | set(self.max_per_week)
+        day_masks = defaultdict(int)
+        for slot, (day, _) in enumerate(data.slot_labels):
+            day_masks[day] |= 1 << slot
+        self.day_masks = list(day_masks.values())
+        self.day_mask_of_slot = [day_masks[day] for day, _ in data.slot_labels]
+        self.booked = defaultdict(int)
+
+    def violation(self, staff_id, slot):
+        """
+        Returns which limit booking the staff member in the slot would break: 'unavailable',
+        'day' or 'week', or None if the booking is allowed.
+        """
+        if staff_id not in self.limited:
+            return None
+        if self.unavailable.get(staff_id, 0) >> slot & 1:
+            return 'unavailable'
+        booked = self.booked[staff_id]
+        day_limit = self.max_per_day.get(staff_id)
+        if day_limit is not None and (booked & self.day_mask_of_slot[slot]).bit_count() >= day_limit:
+            return 'day'
+        week_limit = self.max_per_week.get(staff_id)
+        if week_limit is not None and booked.bit_count() + self.base_load.get(staff_id, 0) >= week_limit:
+            return 'week'
+        return None
+
+    def allows(self, staff_id, slot):
+        return self.violation(staff_id, slot) is None
+
+    def within(self, staff_id):
+        """
+        Returns True if the staff member's current bookings respect all of their limits.
+        """
+        if staff_id not in self.limited:
+            return True
+        booked = self.booked[staff_id]
+        if booked & self.unavailable.get(staff_id, 0):
+            return False
+        day_limit = self.max_per_day.get(staff_id)
+        if day_limit is not None and any(
+            (booked & day_mask).bit_count() > day_limit for day_mask in self.day_masks
+        ):
+            return False
+        week_limit = self.max_per_week.get(staff_id)
+        return week_limit is None or booked.bit_count() + self.base_load.get(staff_id, 0) <= week_limit
+
+    def book(self, staff_id, slot):
+        if staff_id in self.limited:
+            self.booked[staff_id] |= 1 << slot
+
+    def release(self, staff_id, slot):
+        if staff_id in self.limited:
+            self.booked[staff_id] &= ~(1 << slot)
+
+
+class SubjectQuotas:
+    """
+    Cells each subject of the scheduled courses may still fill.
+
+    Cells draw from buckets. A subject with a weekly requirement is its own bucket, holding
+    exactly the periods it still needs. The course's other open cells form its rest bucket,
+    ('rest', course_id), shared by the subjects without a requirement; if every subject of the
+    course has one, the rest cells are left free. Filling every open cell therefore meets every
+    requirement exactly.
+
+    Attributes:
+        remaining (dict): Bucket -> cells it may still fill.
+        free_courses (set): Courses whose rest cells stay free.
+        targets (dict): Subject id -> cells the subject should get in the snapshot; subjects
+            without a requirement get an even share of the rest. Used to order subjects.
+    """
+    def __init__(self, data):
+        required = data.subject_targets()
+        taught = data.pinned_subject_counts()
+        pinned_cells = defaultdict(int)
+        for course_id, _ in data.pinned_cells:
+            pinned_cells[course_id] += 1
+        self.remaining = {}
+        self.free_courses = set()
+        self.targets = {}
+        for course_id in data.course_ids:
+            subject_ids = data.subjects_by_course.get(course_id, ())
+            shared = [subject_id for subject_id in subject_ids if subject_id not in required]
+            rest = len(data.periods) - pinned_cells[course_id]
+            share = len(data.periods)
+            for subject_id in subject_ids:
+                if subject_id in required:
+                    self.targets[subject_id] = required[subject_id]
+                    self.remaining[subject_id] = max(0, required[subject_id] - taught[subject_id])
+                    rest -= self.remaining[subject_id]
+                    share -= required[subject_id]
+            for subject_id in shared:
+                self.targets[subject_id] = max(0, share) / len(shared)
+            self.remaining[('rest', course_id)] = max(0, rest)
+            if subject_ids and not shared:
+                self.free_courses.add(course_id)
+
+    def bucket(self, course_id, subject_id=None):
+        """
+        Returns the bucket a cell of the course draws from when it teaches the subject, or when
+        it is left free if subject_id is None.
+        """
+        return subject_id if subject_id in self.remaining else ('rest', course_id)
+
+    def allows(self, bucket):
+        return self.remaining[bucket] > 0
+
+    def free_cells(self):
+        """
+        Returns the rest cells of the free courses, which a complete timetable leaves empty.
+        """
+        return sum(self.remaining[('rest', course_id)] for course_id in self.free_courses)
+
+    def progress(self, subject_id, taught):
+        """
+        Returns the fraction of its target a subject reaches with `taught` cells.
+        """
+        target = self.targets.get(subject_id)
+        return taught / target if target else math.inf
+
+    def book(self, bucket):
+        self.remaining[bucket] -= 1
+
+    def release(self, bucket):
+        self.remaining[bucket] += 1
+
+
+def load_solver_input(course_ids=None, days=None):
+    """
+    Loads the courses, subjects, periods, qualifications, pinned entries and staff limits of a scope.
+
+    Takes seven queries, and with a day scope one more if any staff member has a weekly limit
+    and one more if any subject has a weekly requirement. Without a scope the whole timetable
+    is loaded. Entries marked as manually adjusted, and entries of courses outside the scope
+    that fall on the scoped days, are loaded as pinned so the solver keeps them and never
+    double-books their staff. Entries on days outside the scope count towards weekly limits
+    and requirements through SolverInput.base_load and SolverInput.subject_base.
+
+    Args:
+        course_ids (iterable, optional): Restrict scheduling to these courses.
+        days (iterable, optional): Restrict scheduling to periods on these days.
+
+    Returns:
+        SolverInput: The snapshot used by the solver.
+    """
+    from django.db.models import Count, Q
+    from .models import Course, Subject, Staff, Period, TimetableEntry
+    from .slots import SlotIndex
+
+    courses = Course.objects.order_by('id')
+    subjects = Subject.objects.order_by('id')
+    qualifications = Subject.staff.through.objects.order_by('subject_id', 'staff_id')
+    pinned = TimetableEntry.objects.filter(is_adjusted=True)
+    if course_ids is not None:
+        course_ids = list(course_ids)
+        courses = courses.filter(id__in=course_ids)
+        subjects = subjects.filter(course_id__in=course_ids)
+        qualifications = qualifications.filter(subject__course_id__in=course_ids)
+        pinned = TimetableEntry.objects.filter(Q(is_adjusted=True) | ~Q(course_id__in=course_ids))
+    # The snapshot numbers its own slots instead of using the cached index, so it always
+    # matches the periods the entries are written to.
+    index = SlotIndex(Period.objects.only('id', 'day', 'period_number'))
+    slots = range(len(index))
+    if days is not None:
+        days = set(days)
+        slots = [slot for slot in slots if index.days[index.day_of_slot[slot]] in days]
+        pinned = pinned.filter(period_id__in=[index.period_ids[slot] for slot in slots])
+    periods = [(index.period_ids[slot], slot) for slot in slots]
+
+    course_ids = list(courses.values_list('id', flat=True))
+
+    subjects_by_course = defaultdict(list)
+    required = {}
+    for subject_id, course_id, periods_per_week in subjects.values_list('id', 'course_id', 'periods_per_week'):
+        subjects_by_course[course_id].append(subject_id)
+        if periods_per_week is not None:
+            required[subject_id] = periods_per_week
+
+    staff_by_subject = defaultdict(list)
+    for subject_id, staff_id in qualifications.values_list('subject_id', 'staff_id'):
+        staff_by_subject[subject_id].append(staff_id)
+
+    pinned = [
+        Assignment(*values)
+        for values in pinned.values_list('course_id', 'period_id', 'subject_id', 'staff_id')
+    ]
+
+    max_per_day = {}
+    max_per_week = {}
+    limited_staff = Staff.objects.filter(
+        Q(max_periods_per_day__isnull=False) | Q(max_periods_per_week__isnull=False)
+    )
+    for staff_id, day_limit, week_limit in limited_staff.values_list(
+            'id', 'max_periods_per_day', 'max_periods_per_week'):
+        if day_limit is not None:
+            max_per_day[staff_id] = day_limit
+        if week_limit is not None:
+            max_per_week[staff_id] = week_limit
+
+    unavailable = defaultdict(int)
+    for staff_id, period_id in Staff.unavailable_periods.through.objects.values_list('staff_id', 'period_id'):
+        unavailable[staff_id] |= 1 << index.slot_of_period[period_id]
+
+    base_load = {}
+    subject_base = {}
+    if days is not None:
+        outside = TimetableEntry.objects.exclude(period_id__in=[period_id for period_id, _ in periods])
+        if max_per_week:
+            kept = outside.filter(staff_id__in=list(max_per_week))
+            base_load = dict(kept.values('staff_id').annotate(count=Count('id')).values_list('staff_id', 'count'))
+        if required:
+            kept = outside.filter(subject_id__in=list(required))
+            subject_base = dict(kept.values('subject_id').annotate(count=Count('id')).values_list('subject_id', 'count'))
+
+    return SolverInput(
+        course_ids, dict(subjects_by_course), dict(staff_by_subject), periods,
+        [index.label(slot) for slot in range(len(index))], index.slot_of_period, pinned,
+        dict(unavailable), max_per_day, max_per_week, base_load, required, subject_base,
+    )
+
+
+def solve_greedy(data, rng=random, time_limit=None, progress=None):
+    """
+    Assigns a subject and a free qualified staff member to every course and period.
+
+    Subjects are tried furthest from their target first for each course (see SubjectQuotas),
+    so subjects with a weekly requirement are spread over the week and never exceed it, and
+    staff are tried in random order. A staff member is never placed in two courses during the
+    same day and period number, including courses whose entries are pinned, nor in a period
+    they are unavailable or beyond their daily or weekly limit. Pinned cells are kept, and cells
+    for which no free staff member or no subject with periods left exists are left empty.
+
+    Args:
+        data (SolverInput): The scheduling snapshot.
+        rng (random.Random): Source of randomness used to shuffle subjects and staff.
+        time_limit (float, optional): Wall-clock limit in seconds, checked before each course.
+        progress (callable, optional): Called with (cells_filled, cells_total) after each course.
+
+    Returns:
+        list: Assignment tuples for every filled cell.
+
+    Raises:
+        SolverTimeout: If the pass exceeds the time limit.
+    """
+    deadline = time.monotonic() + time_limit if time_limit is not None else None
+    busy_staff = data.busy_staff()  # slot -> ids of staff already teaching
+    limits = data.staff_limits()
+    quotas = data.subject_quotas()
+    subject_assignment_count = data.pinned_subject_counts()
+    total = data.open_cell_count()
+    assignments = []
+    for course_id in data.course_ids:
+        if deadline is not None and time.monotonic() > deadline:
+            raise SolverTimeout(f"The greedy pass did not finish within {time_limit} seconds.")
+        subjects = list(data.subjects_by_course.get(course_id, ()))
+
+        for period_id, slot in data.periods:
+            if (course_id, period_id) in data.pinned_cells:
+                continue
+            busy = busy_staff[slot]
+            rng.shuffle(subjects)
+            subjects_sorted = sorted(
+                (subject_id for subject_id in subjects if quotas.allows(quotas.bucket(course_id, subject_id))),
+                key=lambda subj: quotas.progress(subj, subject_assignment_count[subj])
+            )
+            for subject_id in subjects_sorted:
+                available_staff = [staff_id for staff_id in data.staff_by_subject.get(subject_id, ())
+                                   if staff_id not in busy and limits.allows(staff_id, slot)]
+                if not available_staff:
+                    continue
+                staff_id = rng.choice(available_staff)
+                busy.add(staff_id)
+                limits.book(staff_id, slot)
+                assignments.append(Assignment(course_id, period_id, subject_id, staff_id))
+                subject_assignment_count[subject_id] += 1
+                quotas.book(quotas.bucket(course_id, subject_id))
+                break
+        if progress is not None:
+            progress(len(assignments), total)
+    return assignments
+
+
+def solve_backtracking(data, rng=random, time_limit=None, progress=None):
+    """
+    Fills every course and period cell using forward checking with conflict-directed backjumping.
+
+    Each cell is a variable whose domain is the set of staff qualified for at least one of the
+    course's subjects. Assigning a staff member removes them from the domains of the other cells
+    in the same day and period number (forward checking), and the remaining cells of that slot
+    must still admit a matching onto distinct staff (arc consistency for the all-different
+    constraint). The cell with the smallest remaining domain is always expanded next, and on a
+    dead end the search jumps straight back to the most recent cell that contributed to the
+    conflict instead of the chronologically previous one. Values are (staff, subject) pairs,
+    tried furthest-from-target subject first to keep the timetable balanced, and a subject
+    whose SubjectQuotas bucket is used up is skipped, so every weekly requirement is met
+    exactly. Cells of courses whose subjects all have requirements may also be left free while
+    the course has free periods left. Pinned cells are kept and their staff are removed from
+    the domains of the other cells in the same slot. Staff are never placed in periods they
+    are unavailable, and a staff member whose daily or weekly limit is reached is skipped. In
+    both cases the cells that used up the quota or limit join the conflict set.
+
+    Requirements and staff limits give the search a heavy tail: most value orderings succeed
+    almost without backtracking, but an early unlucky choice can cost minutes. The search
+    therefore restarts with fresh random tie-breaking once it has taken RESTART_SLACK steps
+    per open cell beyond the one step each cell needs, doubling that slack on every restart.
+    A run that proves the timetable unsatisfiable ends the search, since the proof does not
+    depend on the ordering.
+
+    Args:
+        data (SolverInput): The scheduling snapshot.
+        rng (random.Random): Source of randomness used to break ties between staff.
+        time_limit (float, optional): Wall-clock limit in seconds for the search.
+        progress (callable, optional): Called periodically with (cells_assigned, cells_total).
+
+    Returns:
+        list: Assignment tuples covering every cell that is not pinned or left free.
+
+    Raises:
+        UnsatisfiableError: If some cell cannot be filled without double-booking staff,
+            breaking their availability or load limits or missing a weekly requirement.
+        SolverTimeout: If the search exceeds the time limit.
+    """
+    deadline = time.monotonic() + time_limit if time_limit is not None else None
+    cells = data.open_cell_count()
+    slack = max(int(RESTART_SLACK * cells), MIN_RESTART_SLACK)
+    while True:
+        assignments = _backtrack(data, rng, deadline, time_limit, progress, cells + slack)
+        if assignments is not None:
+            return assignments
+        slack *= 2
+
+
+def _backtrack(data, rng, deadline, time_limit, progress, max_steps):
+    """
+    Runs one backtracking search for solve_backtracking.
+
+    Returns the assignments, or None if the search took more than `max_steps` steps.
+    """
+    cells = []
+    options = []  # per cell: staff id -> subject ids of the course that staff can teach
+    for course_id in data.course_ids:
+        staff_subjects = defaultdict(list)
+        for subject_id in data.subjects_by_course.get(course_id, ()):
+            for staff_id in data.staff_by_subject.get(subject_id, ()):
+                staff_subjects[staff_id].append(subject_id)
+        for period_id, slot in data.periods:
+            if (course_id, period_id) not in data.pinned_cells:
+                cells.append((course_id, period_id, slot))
+                options.append(staff_subjects)
+
+    count = len(cells)
+    busy_staff = data.busy_staff()
+    limits = data.staff_limits()
+    quotas = data.subject_quotas()
+    can_free = [course_id in quotas.free_courses for course_id, _, _ in cells]
+    # Unavailability is fixed, so it is removed from the domains up front; daily and weekly
+    # loads depend on the other assignments and are checked when a value is tried.
+    unavailable = [set() for _ in range(data.slot_count)]
+    for staff_id, mask in data.unavailable.items():
+        for slot in range(data.slot_count):
+            if mask >> slot & 1:
+                unavailable[slot].add(staff_id)
+    domains = [set(options[var]) - busy_staff[cells[var][2]] - unavailable[cells[var][2]] for var in range(count)]
+    for var in range(count):
+        if not domains[var] and not can_free[var]:
+            course_id, period_id, _ = cells[var]
+            raise UnsatisfiableError(f"Course {course_id} has no free qualified staff in period {period_id}.")
+
+    slot_cells = [[] for _ in range(data.slot_count)]
+    for var, (_, _, slot) in enumerate(cells):
+        slot_cells[slot].append(var)
+
+    past_fc = [set() for _ in range(count)]      # assigned cells that pruned this cell's domain
+    conflicts = [set() for _ in range(count)]    # conflict set used to pick the backjump target
+    reductions = [[] for _ in range(count)]      # cells whose domain this cell's staff was removed from
+    tried = [None] * count                       # staff id currently being tried for a cell
+    remaining = [None] * count
+    chosen = [None] * count                      # (staff id, subject id) of an assigned cell, (None, None) if free
+    depth = [None] * count
+    matched = [None] * count                     # staff id matched to an unassigned cell
+    slot_owners = [{} for _ in range(data.slot_count)]  # slot -> staff id -> cell it is matched to
+    subject_counts = data.pinned_subject_counts()  # subject id -> cells assigned
+    staff_cells = defaultdict(set)               # staff id -> assigned cells teaching it
+    bucket_cells = defaultdict(set)              # quota bucket -> assigned cells drawing from it
+    stack = []
+
+    unassigned = set(range(count))
+    heap = [(len(domains[var]), var) for var in range(count)]
+    heapq.heapify(heap)
+
+    def select_variable():
+        while heap:
+            size, var = heapq.heappop(heap)
+            if var in unassigned and size == len(domains[var]):
+                return var
+        return min(unassigned, key=lambda var: len(domains[var]))
+
+    def order_values(var):
+        # Values are popped from the end, so the most promising pair goes last and leaving
+        # the cell free goes first.
+        values = [(staff_id, subject_id) for staff_id in domains[var] for subject_id in options[var][staff_id]]
+        rng.shuffle(values)
+        values.sort(key=lambda value: quotas.progress(value[1], subject_counts[value[1]]), reverse=True)
+        if can_free[var]:
+            values.insert(0, (None, None))
+        return values
+
+    def push(var):
+        unassigned.discard(var)
+        depth[var] = len(stack)
+        stack.append(var)
+        remaining[var] = order_values(var)
+        conflicts[var] = set()
+
+    def augment(var, owners, visited_staff, visited_cells):
+        visited_cells.add(var)
+        for staff_id in domains[var]:
+            if staff_id in visited_staff:
+                continue
+            visited_staff.add(staff_id)
+            owner = owners.get(staff_id)
+            if (owner is None or owner not in unassigned or matched[owner] != staff_id
+                    or staff_id not in domains[owner]
+                    or augment(owner, owners, visited_staff, visited_cells)):
+                owners[staff_id] = var
+                matched[var] = staff_id
+                return True
+        return False
+
+    def match_slot(slot):
+        # All cells of a slot need pairwise different staff, so the unassigned cells must admit
+        # a matching into their domains. On failure the visited cells form a Hall set whose
+        # pruned domains explain the conflict.
+        owners = slot_owners[slot]
+        for cell in slot_cells[slot]:
+            if cell not in unassigned or can_free[cell]:
+                continue
+            staff_id = matched[cell]
+            if staff_id is not None and staff_id in domains[cell] and owners.get(staff_id) == cell:
+                continue
+            matched[cell] = None
+            visited_cells = set()
+            if not augment(cell, owners, set(), visited_cells):
+                return visited_cells
+        return None
+
+    def forward_check(var, staff_id):
+        slot = cells[var][2]
+        for other in slot_cells[slot]:
+            if other in unassigned and staff_id in domains[other]:
+                domains[other].discard(staff_id)
+                reductions[var].append(other)
+                past_fc[other].add(var)
+                heapq.heappush(heap, (len(domains[other]), other))
+                if not domains[other] and not can_free[other]:
+                    return {other}
+        return match_slot(slot)
+
+    def load_conflict(var, staff_id):
+        # Returns None if the staff member's load limits allow the cell, else the assigned
+        # cells whose bookings of that staff member exhaust the limit.
+        slot = cells[var][2]
+        limit = limits.violation(staff_id, slot)
+        if limit is None:
+            return None
+        if limit == 'day':
+            day = data.slot_labels[slot][0]
+            return {cell for cell in staff_cells[staff_id] if data.slot_labels[cells[cell][2]][0] == day}
+        return set(staff_cells[staff_id])
+
+    def undo_reductions(var):
+        if chosen[var] is not None:
+            staff_id, subject_id = chosen[var]
+            bucket = quotas.bucket(cells[var][0], subject_id)
+            quotas.release(bucket)
+            bucket_cells[bucket].discard(var)
+            if staff_id is not None:
+                subject_counts[subject_id] -= 1
+                limits.release(staff_id, cells[var][2])
+                staff_cells[staff_id].discard(var)
+            chosen[var] = None
+        staff_id = tried[var]
+        for other in reductions[var]:
+            domains[other].add(staff_id)
+            past_fc[other].discard(var)
+            heapq.heappush(heap, (len(domains[other]), other))
+        reductions[var] = []
+
+    for slot, slot_vars in enumerate(slot_cells):
+        if slot_vars and match_slot(slot) is not None:
+            day, period_number = data.slot_labels[slot]
+            raise UnsatisfiableError(
+                f"{len(slot_vars)} courses cannot all get different qualified staff on "
+                f"{day} period {period_number}."
+            )
+
+    if not cells:
+        return []
+    push(select_variable())
+    steps = 0
+    while True:
+        if deadline is not None and time.monotonic() > deadline:
+            raise SolverTimeout(f"No complete timetable found within {time_limit} seconds.")
+        steps += 1
+        if steps > max_steps:
+            return None
+        if progress is not None and steps % PROGRESS_INTERVAL == 0:
+            progress(len(stack) - 1, count)
+
+        var = stack[-1]
+        assigned = False
+        while remaining[var]:
+            staff_id, subject_id = remaining[var].pop()
+            bucket = quotas.bucket(cells[var][0], subject_id)
+            if not quotas.allows(bucket):
+                conflicts[var] |= bucket_cells[bucket]
+                continue
+            tried[var] = staff_id
+            if staff_id is not None:
+                holders = load_conflict(var, staff_id)
+                if holders is not None:
+                    conflicts[var] |= holders
+                    continue
+                explanation = forward_check(var, staff_id)
+                if explanation is not None:
+                    for cell in explanation:
+                        conflicts[var] |= past_fc[cell]
+                    undo_reductions(var)
+                    continue
+                subject_counts[subject_id] += 1
+                limits.book(staff_id, cells[var][2])
+                staff_cells[staff_id].add(var)
+            quotas.book(bucket)
+            bucket_cells[bucket].add(var)
+            chosen[var] = (staff_id, subject_id)
+            assigned = True
+            break
+
+        if assigned:
+            if not unassigned:
+                break
+            push(select_variable())
+            continue
+
+        jump_set = (conflicts[var] | past_fc[var]) - {var}
+        if not jump_set:
+            course_id, period_id, _ = cells[var]
+            raise UnsatisfiableError(
+                f"Course {course_id} cannot be given a free qualified staff member in period {period_id}."
+            )
+        target = max(jump_set, key=lambda cell: depth[cell])
+        while stack[-1] != target:
+            cell = stack.pop()
+            if cell != var:
+                undo_reductions(cell)
+            remaining[cell] = None
+            conflicts[cell] = set()
+            unassigned.add(cell)
+            heapq.heappush(heap, (len(domains[cell]), cell))
+        undo_reductions(target)
+        conflicts[target] |= jump_set - {target}
+
+    if progress is not None:
+        progress(count, count)
+    return [
+        Assignment(cells[var][0], cells[var][1], chosen[var][1], chosen[var][0])
+        for var in range(count)
+        if chosen[var][0] is not None
+    ]
+
+
+SOLVERS = {
+    'greedy': solve_greedy,
+    'backtracking': solve_backtracking,
+}
+
+# Solvers that fill every open cell or fail, so the feasibility pre-check demands every cell.
+COMPLETE_SOLVERS = {'backtracking'}
+
+
+def get_solver(mode):
+    """
+    Returns the solver function registered under the given mode name.
+
+    Args:
+        mode (str): One of the keys of SOLVERS.
+
+    Returns:
+        callable: A solver taking (data, rng, time_limit, progress) and returning Assignment tuples.
+
+    Raises:
+        ValueError: If the mode is unknown.
+    """
+    try:
+        return SOLVERS[mode]
+    except KeyError:
+        raise ValueError(f"Unknown solver mode {mode!r}; expected one of {', '.join(SOLVERS)}.")
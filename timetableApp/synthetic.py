@@ -0,0 +1,127 @@
+"""
+Seeded synthetic institutions for benchmarks and tests.
+
+create_institution fills the database with courses, subjects, staff, qualifications and periods
+of a given size using bulk inserts. The same parameters and seed always produce the same data.
+"""
+import random
+from datetime import time
+
+from . import cache as timetable_cache
+from .models import Course, Subject, Staff, Period
+
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+SIZE_TIERS = {
+    'small': {'courses': 5, 'subjects_per_course': 4, 'staff': 15,
+              'qualifications_per_staff': 2, 'days': 5, 'periods_per_day': 4},
+    'medium': {'courses': 20, 'subjects_per_course': 6, 'staff': 60,
+               'qualifications_per_staff': 3, 'days': 5, 'periods_per_day': 6},
+    'large': {'courses': 60, 'subjects_per_course': 8, 'staff': 300,
+              'qualifications_per_staff': 3, 'days': 5, 'periods_per_day': 8},
+    'xlarge': {'courses': 150, 'subjects_per_course': 8, 'staff': 1000,
+               'qualifications_per_staff': 4, 'days': 6, 'periods_per_day': 8},
+}
+
+
+def create_institution(courses, subjects_per_course, staff, qualifications_per_staff,
+                       days, periods_per_day, seed=0, part_time=0.0, required=0.0):
+    """
+    Creates a synthetic institution in the database.
+
+    Every subject gets at least one qualified staff member; the remaining qualifications are
+    spread at random so that each staff member can teach `qualifications_per_staff` subjects.
+    The first `part_time` fraction of the staff are part-time: they teach at most half the
+    periods of a day and a third of the week, and are unavailable on the last day. The first
+    `required` fraction of each course's subjects must be taught an even share of the week.
+
+    Args:
+        courses (int): Number of courses.
+        subjects_per_course (int): Number of subjects of each course.
+        staff (int): Number of staff members.
+        qualifications_per_staff (int): Number of subjects each staff member can teach.
+        days (int): Number of days with periods, starting on Monday (at most 7).
+        periods_per_day (int): Number of periods on each day.
+        seed (int): Seed for the random qualifications.
+        part_time (float): Fraction of the staff with availability and load limits.
+        required (float): Fraction of each course's subjects with a weekly requirement.
+
+    Returns:
+        dict: Number of created 'courses', 'subjects', 'staff', 'part_time_staff',
+        'qualifications' and 'periods'.
+    """
+    rng = random.Random(seed)
+    course_objects = Course.objects.bulk_create([Course(name=f"Course {index + 1}") for index in range(courses)])
+    required_count = round(subjects_per_course * required)
+    share = days * periods_per_day // max(subjects_per_course, 1)
+    subject_objects = Subject.objects.bulk_create([
+        Subject(
+            name=f"Subject {course.pk}.{index + 1}",
+            course=course,
+            periods_per_week=share if index < required_count else None,
+        )
+        for course in course_objects
+        for index in range(subjects_per_course)
+    ])
+    part_time_count = round(staff * part_time)
+    staff_objects = Staff.objects.bulk_create([
+        Staff(
+            name=f"Staff {index + 1}",
+            max_periods_per_day=max(1, periods_per_day // 2) if index < part_time_count else None,
+            max_periods_per_week=max(1, days * periods_per_day // 3) if index < part_time_count else None,
+        )
+        for index in range(staff)
+    ])
+
+    qualifications = set()
+    if subject_objects and staff_objects:
+        for index, subject in enumerate(subject_objects):
+            qualifications.add((subject.pk, staff_objects[index % len(staff_objects)].pk))
+        per_staff = min(qualifications_per_staff, len(subject_objects))
+        for member in staff_objects:
+            for subject in rng.sample(subject_objects, per_staff):
+                qualifications.add((subject.pk, member.pk))
+    Qualification = Subject.staff.through
+    Qualification.objects.bulk_create([
+        Qualification(subject_id=subject_id, staff_id=staff_id)
+        for subject_id, staff_id in sorted(qualifications)
+    ], batch_size=1000)
+
+    period_objects = Period.objects.bulk_create([
+        Period(
+            day=day,
+            period_number=period_number,
+            start_time=time((7 + period_number) % 24, 0),
+            end_time=time((7 + period_number) % 24, 50),
+        )
+        for day in WEEKDAYS[:days]
+        for period_number in range(1, periods_per_day + 1)
+    ])
+    if part_time_count and days > 1:
+        Unavailable = Staff.unavailable_periods.through
+        Unavailable.objects.bulk_create([
+            Unavailable(staff_id=member.pk, period_id=period.pk)
+            for member in staff_objects[:part_time_count]
+            for period in period_objects
+            if period.day == WEEKDAYS[days - 1]
+        ], batch_size=1000)
+    # Bulk inserts send no signals.
+    timetable_cache.invalidate_timetable(structure=True)
+    return {
+        'courses': len(course_objects),
+        'subjects': len(subject_objects),
+        'staff': len(staff_objects),
+        'part_time_staff': part_time_count,
+        'qualifications': len(qualifications),
+        'periods': len(period_objects),
+    }
+
+
+def clear_institution():
+    """
+    Deletes every course, staff member and period, and with them all subjects and entries.
+    """
+    Course.objects.all().delete()
+    Staff.objects.all().delete()
+    Period.objects.all().delete()
+    timetable_cache.invalidate_timetable(structure=True)
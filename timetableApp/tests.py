@@ -1,3 +1,1194 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import random
+import sys
+from collections import Counter
+from datetime import time, timedelta
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.management.base import CommandError
+from django.db import connection
+from django.template.base import TokenType
+from django.test import TestCase, override_settings
+from django.urls import URLPattern, reverse
+from django.utils import timezone
+
+from timetable import urls as project_urls
+
+from . import cache as timetable_cache
+from . import profiling
+from .checks import check_timetable_cache
+from .export import CSV_COLUMNS
+from .feasibility import Bottleneck, InfeasibleError, check_feasibility, describe
+from .generation import _publish, generate_timetable
+from .importer import import_rows, read_rows
+from .jobs import enqueue_generation, run_job
+from .locks import TIMETABLE_LOCK, LockLost, LockTimeout, acquire
+from .management.commands.generate_timetable import INFEASIBLE_EXIT_CODE
+from .middleware import QueryProfilingMiddleware
+from .multistart import _init_worker, _run_attempt, solve_multistart
+from .models import (
+    Course, Subject, Staff, Period, TimetableEntry, GenerationJob, GenerationLock, TimetableSnapshot
+)
+from .occupancy import DayOccupancy
+from .optimizer import _State, optimize_assignments
+from .profiling import QueryRecorder, fingerprint, percentile
+from .scoring import Scorer, score_timetable
+from .snapshots import current_cells, diff_cells, restore_snapshot, take_snapshot, unpack_cells
+from .solver import Assignment, SolverError, UnsatisfiableError, load_solver_input, solve_backtracking, solve_greedy
+from .synthetic import create_institution, clear_institution
+
+APP_DIR = Path(__file__).resolve().parent
+
+# The tests run against a process-local cache instead of the shared one under .cache/ in
+# ORIGINAL_CACHES, so they neither see nor leave behind the dev server's cached timetables.
+ORIGINAL_CACHES = settings.CACHES
+TEST_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'timetable': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'timetable-tests'},
+}
+
+
+def first_pk(model):
+    return model.objects.order_by('pk').values_list('pk', flat=True).first()
+
+
+def build_institution(periods, courses):
+    """
+    Creates `periods` Monday periods and the given courses.
+
+    Args:
+        periods (int): Number of periods.
+        courses (dict): Course name -> {subject name: (staff names, periods_per_week)}. Staff
+            are created on first mention; subject names must be unique.
+
+    Returns:
+        dict: Name -> the created Course, Subject or Staff instance.
+    """
+    for number in range(1, periods + 1):
+        Period.objects.create(day='Monday', period_number=number)
+    objects = {}
+    for course_name, subjects in courses.items():
+        course = objects[course_name] = Course.objects.create(name=course_name)
+        for subject_name, (staff_names, periods_per_week) in subjects.items():
+            subject = objects[subject_name] = Subject.objects.create(
+                name=subject_name, course=course, periods_per_week=periods_per_week
+            )
+            for staff_name in staff_names:
+                if staff_name not in objects:
+                    objects[staff_name] = Staff.objects.create(name=staff_name)
+                subject.staff.add(objects[staff_name])
+    timetable_cache.invalidate_timetable(structure=True)
+    return objects
+
+
+def assert_valid_timetable(test, data, assignments):
+    """
+    Checks that no staff member or course is booked twice in a slot, that every cell is
+    taught by a qualified staff member, and that staff are available and within their daily
+    and weekly limits.
+    """
+    cells = data.pinned + list(assignments)
+    slots = [data.slot_of_period[cell.period_id] for cell in cells]
+    staff_slots = Counter((cell.staff_id, slot) for cell, slot in zip(cells, slots))
+    course_slots = Counter((cell.course_id, slot) for cell, slot in zip(cells, slots))
+    test.assertEqual([key for key, count in staff_slots.items() if count > 1], [], "double-booked staff")
+    test.assertEqual([key for key, count in course_slots.items() if count > 1], [], "double-booked course")
+    for cell in assignments:
+        test.assertIn(cell.subject_id, data.subjects_by_course[cell.course_id])
+        test.assertIn(cell.staff_id, data.staff_by_subject[cell.subject_id])
+
+    unavailable = [
+        (staff_id, slot) for staff_id, slot in staff_slots if data.unavailable.get(staff_id, 0) >> slot & 1
+    ]
+    test.assertEqual(unavailable, [], "staff booked in unavailable periods")
+    daily = Counter((staff_id, data.slot_labels[slot][0]) for staff_id, slot in staff_slots)
+    weekly = Counter(staff_id for staff_id, _ in staff_slots)
+    for (staff_id, day), count in daily.items():
+        test.assertLessEqual(count, data.max_per_day.get(staff_id, count), f"staff {staff_id} on {day}")
+    for staff_id, count in weekly.items():
+        count += data.base_load.get(staff_id, 0)
+        test.assertLessEqual(count, data.max_per_week.get(staff_id, count), f"staff {staff_id} this week")
+
+
+# URL name -> (maximum queries per request, function returning the URL kwargs).
+# Every URL in timetable/urls.py must be listed here.
+VIEW_BUDGETS = {
+    'timetable_list': (3, dict),
+    'generate_timetable': (2, dict),
+    'generation_job_status': (1, lambda: {'job_id': first_pk(GenerationJob)}),
+    'export_timetable': (1, lambda: {'file_format': 'csv'}),
+    'export_course_timetable': (2, lambda: {'file_format': 'ndjson', 'course_id': first_pk(Course)}),
+    'export_staff_timetable': (2, lambda: {'file_format': 'ics', 'staff_id': first_pk(Staff)}),
+    'timetable_api': (2, lambda: {'by': 'course'}),
+    'timetable_api_detail': (2, lambda: {'by': 'staff', 'key': first_pk(Staff)}),
+    'timetable_score': (7, dict),
+    'timetable_cache_stats': (2, dict),
+    'profiling_stats': (2, dict),
+    'snapshot_list': (3, dict),
+    'snapshot_diff': (8, lambda: {'pk': first_pk(TimetableSnapshot)}),
+    'snapshot_restore': (8, lambda: {'pk': first_pk(TimetableSnapshot)}),
+    'course_list': (1, dict),
+    'create_course': (0, dict),
+    'update_course': (1, lambda: {'pk': first_pk(Course)}),
+    'delete_course': (1, lambda: {'pk': first_pk(Course)}),
+    'subject_list': (2, dict),
+    'subject_create': (2, dict),
+    'subject_update': (4, lambda: {'pk': first_pk(Subject)}),
+    'subject_delete': (1, lambda: {'pk': first_pk(Subject)}),
+    'staff_list': (2, dict),
+    'staff_create': (2, dict),
+    'staff_update': (5, lambda: {'pk': first_pk(Staff)}),
+    'staff_delete': (1, lambda: {'pk': first_pk(Staff)}),
+    'staff_timetable': (3, lambda: {'pk': first_pk(Staff)}),
+    'staff_timetables': (3, dict),
+    'import_data': (2, dict),
+    'period_list': (1, dict),
+    'period_create': (0, dict),
+    'period_update': (1, lambda: {'pk': first_pk(Period)}),
+    'edit_timetable_row': (9, lambda: {
+        'course_id': first_pk(Course),
+        'day': Period.objects.order_by('pk').values_list('day', flat=True).first(),
+    }),
+    'get_staff_by_subject': (1, lambda: {'subject_id': first_pk(Subject)}),
+}
+
+SIZES = [
+    {'courses': 3, 'subjects_per_course': 3, 'staff': 12,
+     'qualifications_per_staff': 2, 'days': 2, 'periods_per_day': 3, 'part_time': 0.25, 'required': 0.5},
+    {'courses': 9, 'subjects_per_course': 5, 'staff': 40,
+     'qualifications_per_staff': 3, 'days': 4, 'periods_per_day': 5, 'part_time': 0.25, 'required': 0.5},
+]
+
+
+@override_settings(CACHES=TEST_CACHES)
+class TimetableTestCase(TestCase):
+    """
+    Base class of the timetable tests; every test starts from an empty timetable cache.
+    """
+    def setUp(self):
+        super().setUp()
+        timetable_cache.clear()
+
+
+class QueryOriginRecorder:
+    """
+    Execute wrapper that records each query's fingerprint together with where it was triggered:
+    the innermost template tag or variable being rendered and the innermost frame of app code.
+    """
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries.append((fingerprint(sql), self.origin()))
+        return execute(sql, params, many, context)
+
+    @staticmethod
+    def origin():
+        template_site = code_site = None
+        frame = sys._getframe(2)
+        while frame is not None and (template_site is None or code_site is None):
+            code = frame.f_code
+            if template_site is None and code.co_name == 'render_annotated':
+                node = frame.f_locals.get('self')
+                token = getattr(node, 'token', None)
+                origin = getattr(node, 'origin', None)
+                if token is not None and origin is not None:
+                    contents = f"{{{{ {token.contents} }}}}" if token.token_type == TokenType.VAR else f"{{% {token.contents} %}}"
+                    template_site = f"{origin.template_name}:{token.lineno} {contents}"
+            filename = Path(code.co_filename)
+            if code_site is None and APP_DIR in filename.parents and filename.name != 'tests.py':
+                code_site = f"{filename.relative_to(APP_DIR.parent)}:{frame.f_lineno} in {code.co_name}"
+            frame = frame.f_back
+        return template_site, code_site
+
+    def counts(self):
+        return Counter(sql for sql, _ in self.queries)
+
+    def origins(self, sql):
+        return Counter(origin for query, origin in self.queries if query == sql)
+
+
+class QueryBudgetTests(TimetableTestCase):
+    """
+    Renders every URL of timetable/urls.py against synthetic institutions of two sizes and
+    checks that each view issues a constant number of queries within its declared budget.
+    """
+    def measure_all(self, size):
+        clear_institution()
+        create_institution(seed=1, **size)
+        generate_timetable(seed=1, mode='greedy', attempts=1)
+        # Jobs enqueued by the previous size never run (on_commit does not fire in a TestCase)
+        # and would otherwise be joined instead of created.
+        GenerationJob.objects.all().delete()
+        GenerationJob.objects.create(key='test')
+        # Regenerate after the snapshot, so the snapshot views have changed cells to describe.
+        TimetableSnapshot.objects.all().delete()
+        take_snapshot('test')
+        generate_timetable(seed=2, mode='greedy', attempts=1)
+        recorders = {}
+        for name, (_, kwargs) in VIEW_BUDGETS.items():
+            timetable_cache.invalidate_timetable(structure=True)
+            url = reverse(name, kwargs=kwargs())
+            recorder = QueryOriginRecorder()
+            with connection.execute_wrapper(recorder):
+                response = self.client.get(url, HTTP_ACCEPT='application/json')
+                if response.streaming:
+                    b''.join(response.streaming_content)
+            self.assertLess(response.status_code, 400, f"{name} returned {response.status_code}")
+            recorders[name] = recorder
+        return recorders
+
+    def test_every_url_has_a_budget(self):
+        names = {pattern.name for pattern in project_urls.urlpatterns if isinstance(pattern, URLPattern)}
+        self.assertEqual(names - set(VIEW_BUDGETS), set(), "Declare a query budget for these URLs")
+
+    def test_query_counts_are_constant_and_within_budget(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        small, large = (self.measure_all(size) for size in SIZES)
+
+        failures = []
+        for name, (budget, _) in VIEW_BUDGETS.items():
+            small_count, large_count = len(small[name].queries), len(large[name].queries)
+            if small_count == large_count and large_count <= budget:
+                continue
+            lines = [
+                f"{name}: {small_count} queries on the small dataset, {large_count} on the large one "
+                f"(budget {budget})"
+            ]
+            small_counts, large_counts = small[name].counts(), large[name].counts()
+            for sql, count in large_counts.most_common():
+                growth = count - small_counts.get(sql, 0)
+                if growth <= 0 and large_count <= budget:
+                    continue
+                lines.append(f"  {count} x {sql[:200]}")
+                for (template_site, code_site), occurrences in large[name].origins(sql).most_common(3):
+                    lines.append(f"      {occurrences} from {template_site or '-'} / {code_site or '-'}")
+            failures.append('\n'.join(lines))
+        self.assertFalse(failures, '\n\n'.join(failures))
+
+
+class EditTimetableRowTests(TimetableTestCase):
+    """
+    Checks that the row editor validates every change and writes all of them or none.
+    """
+    def setUp(self):
+        super().setUp()
+        self.objects = build_institution(2, {
+            'Course A': {'Maths A': (['Ann', 'Bob'], None), 'Physics A': (['Cat'], None)},
+            'Course B': {'Maths B': (['Ann'], None)},
+        })
+        first, second = Period.objects.order_by('period_number')
+        self.entries = {
+            'A1': self.book('Course A', first, 'Maths A', 'Bob'),
+            'A2': self.book('Course A', second, 'Physics A', 'Cat'),
+            'B1': self.book('Course B', first, 'Maths B', 'Ann'),
+        }
+
+    def book(self, course, period, subject, staff):
+        return TimetableEntry.objects.create(
+            course=self.objects[course], period=period, subject=self.objects[subject], staff=self.objects[staff]
+        )
+
+    def post(self, changes):
+        """
+        Posts {period number: (subject name, staff name)} changes to Course A's Monday row.
+        """
+        data = {}
+        for period_number, (subject, staff) in changes.items():
+            data[f'subject_{period_number}'] = self.objects[subject].id
+            data[f'staff_{period_number}'] = self.objects[staff].id
+        url = reverse('edit_timetable_row', kwargs={'course_id': self.objects['Course A'].id, 'day': 'Monday'})
+        return self.client.post(url, data)
+
+    def assert_rejected(self, response, error):
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(error, response.context['errors'][0])
+        for name, entry in self.entries.items():
+            stored = TimetableEntry.objects.get(pk=entry.pk)
+            self.assertEqual(
+                (stored.subject_id, stored.staff_id, stored.is_adjusted),
+                (entry.subject_id, entry.staff_id, False), f"{name} was written"
+            )
+
+    def test_valid_change_is_saved_as_adjusted(self):
+        response = self.post({1: ('Maths A', 'Bob'), 2: ('Maths A', 'Ann')})
+        self.assertRedirects(response, reverse('timetable_list'), fetch_redirect_response=False)
+        changed = TimetableEntry.objects.get(pk=self.entries['A2'].pk)
+        self.assertEqual(
+            (changed.subject_id, changed.staff_id, changed.is_adjusted),
+            (self.objects['Maths A'].id, self.objects['Ann'].id, True)
+        )
+        # Resubmitting an unchanged cell does not mark it as adjusted.
+        self.assertFalse(TimetableEntry.objects.get(pk=self.entries['A1'].pk).is_adjusted)
+
+    def test_staff_booked_in_another_course_is_rejected(self):
+        response = self.post({1: ('Maths A', 'Ann')})
+        self.assert_rejected(response, 'Ann already teaches another course')
+
+    def test_unqualified_staff_is_rejected(self):
+        response = self.post({2: ('Physics A', 'Bob')})
+        self.assert_rejected(response, 'cannot teach this subject')
+
+    def test_staff_limits_are_enforced(self):
+        bob, ann = self.objects['Bob'], self.objects['Ann']
+        bob.max_periods_per_day = 1
+        bob.save()
+        self.assert_rejected(self.post({2: ('Maths A', 'Bob')}), 'Bob would teach more than 1 periods on Monday')
+        ann.max_periods_per_week = 1
+        ann.save()
+        self.assert_rejected(self.post({2: ('Maths A', 'Ann')}), 'Ann would teach more than 1 periods this week')
+
+    def test_unavailable_staff_is_rejected(self):
+        self.objects['Ann'].unavailable_periods.add(self.entries['A2'].period)
+        self.assert_rejected(self.post({2: ('Maths A', 'Ann')}), 'Ann is not available in this period')
+
+    def test_one_invalid_change_writes_nothing(self):
+        # Period 2 alone would be accepted, but period 1 is not.
+        response = self.post({1: ('Physics A', 'Bob'), 2: ('Maths A', 'Ann')})
+        self.assert_rejected(response, 'cannot teach this subject')
+
+    def test_concurrent_booking_is_rejected_by_the_database(self):
+        # An occupancy matrix loaded before another editor booked Ann misses the booking.
+        with mock.patch.object(DayOccupancy, 'is_free', return_value=True):
+            response = self.post({1: ('Maths A', 'Ann'), 2: ('Maths A', 'Bob')})
+        self.assert_rejected(response, 'was just booked for another course')
+
+
+class SolverTests(TimetableTestCase):
+    """
+    Checks the hard constraints of both solvers and of generation.
+    """
+    def test_greedy_never_double_books(self):
+        create_institution(seed=3, **SIZES[1])
+        data = load_solver_input()
+        for seed in range(5):
+            assert_valid_timetable(self, data, solve_greedy(data, random.Random(seed)))
+
+    def test_backtracking_fills_every_cell(self):
+        create_institution(seed=3, **SIZES[1])
+        data = load_solver_input()
+        free = data.subject_quotas().free_cells()
+        for seed in range(3):
+            assignments = solve_backtracking(data, random.Random(seed), time_limit=10)
+            assert_valid_timetable(self, data, assignments)
+            self.assertEqual(len(assignments), data.open_cell_count() - free)
+
+    def test_backtracking_reports_unsatisfiable(self):
+        # Two courses need the only staff member in the same single period.
+        build_institution(1, {
+            'Course A': {'Maths A': (['Ann'], None)},
+            'Course B': {'Maths B': (['Ann'], None)},
+        })
+        data = load_solver_input()
+        with self.assertRaises(UnsatisfiableError):
+            solve_backtracking(data, random.Random(0), time_limit=10)
+        greedy = solve_greedy(data, random.Random(0))
+        self.assertEqual(len(greedy), 1)
+
+    def test_solvers_respect_availability_and_limits(self):
+        # Maths needs three periods: Ann can give two (not in period 1) and Bob one.
+        objects = build_institution(4, {
+            'Course A': {'Maths A': (['Ann', 'Bob'], 2), 'Art A': (['Cat'], None)},
+            'Course B': {'Maths B': (['Ann', 'Bob'], 1), 'Art B': (['Dan'], None)},
+        })
+        ann, bob = objects['Ann'], objects['Bob']
+        ann.max_periods_per_day = 2
+        ann.save()
+        ann.unavailable_periods.add(Period.objects.get(period_number=1))
+        bob.max_periods_per_week = 1
+        bob.save()
+        data = load_solver_input()
+        for seed in range(5):
+            assert_valid_timetable(self, data, solve_greedy(data, random.Random(seed)))
+            assignments = solve_backtracking(data, random.Random(seed), time_limit=10)
+            assert_valid_timetable(self, data, assignments)
+            taught = Counter(assignment.staff_id for assignment in assignments)
+            self.assertEqual((taught[ann.id], taught[bob.id]), (2, 1))
+
+    def test_generation_keeps_adjusted_entries(self):
+        create_institution(seed=3, **SIZES[0])
+        generate_timetable(seed=1, mode='greedy', attempts=1)
+        entry = TimetableEntry.objects.order_by('pk').first()
+        TimetableEntry.objects.filter(pk=entry.pk).update(is_adjusted=True)
+        for mode in ('greedy', 'backtracking'):
+            generate_timetable(seed=2, mode=mode, attempts=1)
+            kept = TimetableEntry.objects.get(course_id=entry.course_id, period_id=entry.period_id)
+            self.assertEqual(
+                (kept.is_adjusted, kept.subject_id, kept.staff_id), (True, entry.subject_id, entry.staff_id)
+            )
+            self.assertEqual(
+                TimetableEntry.objects.filter(period_id=entry.period_id, staff_id=entry.staff_id).count(), 1
+            )
+
+    def test_scoped_generation_replaces_only_its_scope(self):
+        create_institution(seed=3, **SIZES[0])
+        generate_timetable(seed=1, mode='greedy', attempts=1)
+        course_id = first_pk(Course)
+        day = Period.objects.order_by('pk').values_list('day', flat=True).first()
+        for seed, (course_ids, days) in enumerate([([course_id], None), (None, [day]), ([course_id], [day])], 2):
+            def in_scope(entry):
+                return (course_ids is None or entry.course_id in course_ids) and \
+                    (days is None or entry.period.day in days)
+
+            before = {entry.pk: entry for entry in TimetableEntry.objects.select_related('period')}
+            replaced = {pk for pk, entry in before.items() if in_scope(entry)}
+            kept = set(before) - replaced
+            # Other courses' entries on the regenerated days are pinned, so their staff stay booked.
+            self.assertEqual(load_solver_input(course_ids, days).pinned_cells, {
+                (before[pk].course_id, before[pk].period_id) for pk in kept
+                if days is None or before[pk].period.day in days
+            })
+
+            generate_timetable(seed=seed, mode='backtracking', attempts=1, course_ids=course_ids, days=days)
+            after = {entry.pk: entry for entry in TimetableEntry.objects.select_related('period')}
+            self.assertEqual(set(after) & set(before), kept)
+            for pk in kept:
+                self.assertEqual(
+                    (after[pk].course_id, after[pk].period_id, after[pk].subject_id, after[pk].staff_id),
+                    (before[pk].course_id, before[pk].period_id, before[pk].subject_id, before[pk].staff_id)
+                )
+            written = [after[pk] for pk in set(after) - kept]
+            self.assertTrue(written)
+            self.assertTrue(all(in_scope(entry) for entry in written))
+            bookings = Counter((entry.staff_id, entry.period_id) for entry in after.values())
+            self.assertEqual([key for key, count in bookings.items() if count > 1], [], "double-booked staff")
+
+    def test_score_candidates_runs_the_feasibility_check(self):
+        build_institution(2, {
+            'Course A': {'Maths A': (['Ann'], 2)},
+            'Course B': {'Maths B': (['Ann'], 2)},
+        })
+        with self.assertRaisesMessage(CommandError, 'Infeasible'):
+            call_command('score_timetable', candidates=3, mode='backtracking', stdout=io.StringIO())
+
+
+class ScoringTests(TimetableTestCase):
+    def setUp(self):
+        super().setUp()
+        self.objects = build_institution(3, {
+            'Course A': {'Maths A': (['Ann'], None)},
+            'Course B': {'Maths B': (['Ann'], None)},
+        })
+        ann = self.objects['Ann']
+        ann.max_periods_per_day = 2
+        ann.max_periods_per_week = 2
+        ann.save()
+        self.periods = list(Period.objects.order_by('period_number'))
+        ann.unavailable_periods.add(self.periods[0])
+
+    def cells(self, bookings):
+        """
+        Returns Assignments of Ann teaching (course name, period index) cells.
+        """
+        return [
+            Assignment(self.objects[course].id, self.periods[period].id,
+                       self.objects[course.replace('Course', 'Maths')].id, self.objects['Ann'].id)
+            for course, period in bookings
+        ]
+
+    def test_staff_limits_are_violations(self):
+        scorer = Scorer.from_solver_input(load_solver_input())
+        # Ann teaches in her unavailable period 1 and three periods against limits of two.
+        breaking = scorer.encode(self.cells([('Course A', 0), ('Course A', 1), ('Course B', 2)]))
+        clean = scorer.encode(self.cells([('Course A', 1), ('Course B', 2)]))
+        scores = scorer.score(np.stack([breaking[0], clean[0]]), np.stack([breaking[1], clean[1]]))
+        for kind in ('unavailable', 'over_daily_limit', 'over_weekly_limit'):
+            self.assertEqual(scores[kind].tolist(), [1, 0], kind)
+        self.assertEqual(scores['violations'].tolist(), [3, 0])
+
+    def test_stored_timetable_reports_violations_per_staff(self):
+        TimetableEntry.objects.bulk_create([
+            TimetableEntry(course_id=cell.course_id, period_id=cell.period_id, subject_id=cell.subject_id,
+                           staff_id=cell.staff_id)
+            for cell in self.cells([('Course A', 0), ('Course A', 1), ('Course B', 2)])
+        ])
+        summary = score_timetable()
+        self.assertEqual(summary['totals']['violations'], 3)
+        ann = summary['staff'][str(self.objects['Ann'].id)]
+        self.assertEqual(
+            (ann['unavailable'], ann['over_daily_limit'], ann['over_weekly_limit']), (1, 1, 1)
+        )
+
+
+class FeasibilityTests(TimetableTestCase):
+    """
+    Checks the max-flow pre-check against instances whose bottleneck is known.
+    """
+    def test_overcommitted_course_is_rejected(self):
+        objects = build_institution(2, {
+            'Course A': {'Maths A': (['Ann'], 2), 'Physics A': (['Bob'], 1)},
+        })
+        report = check_feasibility(load_solver_input())
+        self.assertFalse(report.feasible)
+        self.assertEqual(report.bottlenecks[0], Bottleneck('course', objects['Course A'].id, 3, 2))
+        with self.assertRaisesMessage(InfeasibleError, 'Course A requires 3 periods but has 2 to fill'):
+            generate_timetable(seed=1, mode='backtracking', attempts=1)
+        self.assertFalse(TimetableEntry.objects.exists())
+
+    def test_saturated_staff_member_is_named(self):
+        objects = build_institution(3, {
+            'Course A': {'Maths A': (['Ann'], 2)},
+            'Course B': {'Maths B': (['Ann'], 1)},
+        })
+        objects['Ann'].max_periods_per_week = 2
+        objects['Ann'].save()
+        report = check_feasibility(load_solver_input())
+        self.assertEqual((report.demand, report.flow), (3, 2))
+        self.assertIn(Bottleneck('staff_week', objects['Ann'].id, None, 2), report.bottlenecks)
+        self.assertFalse([bottleneck for bottleneck in report.bottlenecks if bottleneck.kind == 'slot'])
+        self.assertIn('Ann is fully used (2 periods, capped by their weekly limit)', describe(report))
+
+    def test_feasible_requirements_are_met_exactly(self):
+        objects = build_institution(4, {
+            'Course A': {'Maths A': (['Ann'], 2), 'Physics A': (['Bob'], 1), 'Art A': (['Cat'], None)},
+            'Course B': {'Maths B': (['Ann'], 2), 'Physics B': (['Bob'], 2)},
+        })
+        data = load_solver_input()
+        for fill_all in (False, True):
+            self.assertTrue(check_feasibility(data, fill_all=fill_all).feasible)
+        # Greedy may leave cells empty but never exceeds a requirement; backtracking meets them.
+        for mode, check in (('greedy', self.assertLessEqual), ('backtracking', self.assertEqual)):
+            generate_timetable(seed=1, mode=mode, attempts=1)
+            taught = Counter(TimetableEntry.objects.values_list('subject_id', flat=True))
+            for name in ('Maths A', 'Physics A', 'Maths B', 'Physics B'):
+                check(taught[objects[name].id], objects[name].periods_per_week, f"{mode}: {name}")
+
+
+class GenerateCommandTests(TimetableTestCase):
+    def setUp(self):
+        # Ann cannot teach both courses in the single period, so one cell stays empty.
+        self.objects = build_institution(1, {
+            'Course A': {'Maths A': (['Ann'], None)},
+            'Course B': {'Maths B': (['Ann'], None)},
+        })
+
+    def test_incomplete_timetable_exits_with_status_2(self):
+        with self.assertRaises(CommandError) as raised:
+            call_command('generate_timetable', seed=1, mode='greedy', attempts=1, stdout=io.StringIO())
+        self.assertEqual(raised.exception.returncode, INFEASIBLE_EXIT_CODE)
+        self.assertIn('1 cells unfilled', str(raised.exception))
+
+    def test_allow_incomplete(self):
+        out = io.StringIO()
+        call_command('generate_timetable', seed=1, mode='greedy', attempts=1, allow_incomplete=True,
+                     json=True, stdout=out)
+        self.assertEqual(json.loads(out.getvalue())['unfilled_cells'], 1)
+
+    def test_scoped_run_ignores_other_courses(self):
+        # Course A alone can be filled; Course B stays empty but is outside the scope.
+        for dry_run in (True, False):
+            out = io.StringIO()
+            call_command('generate_timetable', seed=1, mode='greedy', attempts=1, dry_run=dry_run,
+                         course_ids=[self.objects['Course A'].id], json=True, stdout=out)
+            self.assertEqual(json.loads(out.getvalue())['unfilled_cells'], 0)
+        self.assertFalse(TimetableEntry.objects.filter(course=self.objects['Course B']).exists())
+
+    def test_free_periods_are_not_unfilled(self):
+        Period.objects.create(day='Tuesday', period_number=1)
+        Subject.objects.update(periods_per_week=1)
+        timetable_cache.invalidate_timetable(structure=True)
+        out = io.StringIO()
+        call_command('generate_timetable', seed=1, mode='backtracking', attempts=1, json=True, stdout=out)
+        stats = json.loads(out.getvalue())
+        self.assertEqual((stats['unfilled_cells'], stats['score']['empty_cells']), (0, 2))
+
+
+class GenerationLockTests(TimetableTestCase):
+    def setUp(self):
+        create_institution(seed=3, **SIZES[0])
+
+    def wait_for(self, holder):
+        # Instead of sleeping, the waiting side lets the holder finish at its first poll.
+        return mock.patch('timetableApp.locks.time.sleep', side_effect=lambda _: holder.release())
+
+    def test_overlapping_generations_take_turns(self):
+        holder = acquire()
+        with self.assertRaises(LockTimeout):
+            acquire(timeout=0)
+        with self.wait_for(holder) as sleep:
+            lease = acquire()
+        self.assertEqual(sleep.call_count, 1)
+        self.assertTrue(lease.waited)
+        self.assertEqual(GenerationLock.objects.get(name=TIMETABLE_LOCK).owner, lease.owner)
+        lease.release()
+        self.assertFalse(acquire(timeout=0).waited)
+
+    def test_waiting_duplicate_returns_the_published_result(self):
+        # Unseeded requests are not memoized, so only the lock's result key can be reused.
+        published = {entry.pk for entry in generate_timetable(mode='greedy', attempts=1)}
+        snapshots = TimetableSnapshot.objects.count()
+        with self.wait_for(acquire()):
+            entries = generate_timetable(mode='greedy', attempts=1)
+        self.assertEqual({entry.pk for entry in entries}, published)
+        self.assertEqual(set(TimetableEntry.objects.values_list('pk', flat=True)), published)
+        self.assertEqual(TimetableSnapshot.objects.count(), snapshots)
+
+    def test_abandoned_lock_is_taken_over(self):
+        stale = acquire()
+        abandoned = timezone.now() - timedelta(seconds=settings.TIMETABLE_GENERATION_LOCK_TIMEOUT + 1)
+        GenerationLock.objects.filter(name=TIMETABLE_LOCK).update(renewed_at=abandoned)
+        lease = acquire(timeout=0)
+        self.assertFalse(lease.waited)
+
+        data = load_solver_input()
+        with self.assertRaises(LockLost):
+            _publish(solve_greedy(data, random.Random(0)), None, None, stale, 'stale')
+        self.assertFalse(TimetableEntry.objects.exists())
+        self.assertFalse(TimetableSnapshot.objects.exists())
+        # The stale holder's release leaves the new holder's lock alone.
+        stale.release()
+        self.assertEqual(GenerationLock.objects.get(name=TIMETABLE_LOCK).owner, lease.owner)
+
+    def test_long_optimize_phase_keeps_the_lock(self):
+        abandoned = timezone.now() - timedelta(seconds=settings.TIMETABLE_GENERATION_LOCK_TIMEOUT + 1)
+
+        def optimize_after_a_long_solve(*args, **kwargs):
+            # By the time the optimizer starts, the lock looks abandoned unless it is renewed.
+            GenerationLock.objects.filter(name=TIMETABLE_LOCK).update(renewed_at=abandoned)
+            result = optimize_assignments(*args, **kwargs)
+            with self.assertRaises(LockTimeout):
+                acquire(timeout=0)
+            return result
+
+        with mock.patch('timetableApp.locks.RENEW_INTERVAL', 0), \
+                mock.patch('timetableApp.generation.optimize_assignments', side_effect=optimize_after_a_long_solve):
+            entries = generate_timetable(seed=1, mode='greedy', attempts=1, optimize_time=0.05)
+        self.assertTrue(entries)
+
+    def test_attempts_report_progress_while_running(self):
+        data = load_solver_input()
+        reports = []
+        solve_multistart(data, 'greedy', 2, workers=1, seed=1, progress=lambda *report: reports.append(report))
+        # Every solver report is passed on, not only one per finished attempt.
+        self.assertGreater(len(reports), 2)
+        self.assertEqual(reports[0], (0, data.open_cell_count()))
+
+    @override_settings(TIMETABLE_RESTORE_LOCK_WAIT=0)
+    def test_restore_is_refused_while_a_generation_runs(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        snapshot = take_snapshot('empty')
+        generate_timetable(seed=1, mode='greedy', attempts=1)
+        entries = TimetableEntry.objects.count()
+        acquire()
+        response = self.client.post(
+            reverse('snapshot_restore', kwargs={'pk': snapshot.pk}), HTTP_ACCEPT='application/json'
+        )
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(TimetableEntry.objects.count(), entries)
+
+
+class GenerationJobTests(TimetableTestCase):
+    def setUp(self):
+        super().setUp()
+        create_institution(seed=3, **SIZES[0])
+
+    def enqueue(self, **parameters):
+        # Jobs start on commit; the tests run them explicitly instead.
+        with self.captureOnCommitCallbacks() as callbacks:
+            job, created = enqueue_generation(**parameters)
+        self.assertEqual(len(callbacks), int(created))
+        return job, created
+
+    def execute(self, job):
+        # run_job closes its thread's connection when it is done, which would end the test transaction.
+        with mock.patch('timetableApp.jobs.connection'):
+            run_job(job.pk)
+        job.refresh_from_db()
+        return job
+
+    def status(self, job):
+        response = self.client.get(reverse('generation_job_status', kwargs={'job_id': job.pk}))
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_identical_request_joins_the_active_job(self):
+        job, created = self.enqueue(mode='greedy', course_ids=[1, 2])
+        self.assertTrue(created)
+        self.assertEqual(self.enqueue(course_ids=[1, 2], mode='greedy'), (job, False))
+        GenerationJob.objects.filter(pk=job.pk).update(status=GenerationJob.RUNNING)
+        self.assertEqual(self.enqueue(mode='greedy', course_ids=[1, 2]), (job, False))
+        self.assertTrue(self.enqueue(mode='greedy', course_ids=[1])[1])
+
+        response = self.client.get(
+            reverse('generate_timetable') + '?mode=greedy&course=2&course=1', HTTP_ACCEPT='application/json'
+        )
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['id'], job.pk)
+
+    def test_finished_and_stale_jobs_are_not_joined(self):
+        job, _ = self.enqueue(mode='greedy', seed=1, attempts=1)
+        stale = timezone.now() - timedelta(seconds=settings.TIMETABLE_JOB_STALE_AFTER + 1)
+        GenerationJob.objects.filter(pk=job.pk).update(status=GenerationJob.RUNNING, updated_at=stale)
+        replacement, created = self.enqueue(mode='greedy', seed=1, attempts=1)
+        self.assertTrue(created)
+        self.assertNotEqual(replacement.pk, job.pk)
+
+        self.execute(replacement)
+        self.assertTrue(self.enqueue(mode='greedy', seed=1, attempts=1)[1])
+
+    def test_status_of_a_pending_job(self):
+        job, _ = self.enqueue(mode='greedy')
+        status = self.status(job)
+        self.assertEqual(set(status), {
+            'id', 'status', 'percent_filled', 'cells_filled', 'cells_total', 'elapsed_seconds', 'error',
+        })
+        self.assertEqual(
+            (status['id'], status['status'], status['percent_filled'], status['error']),
+            (job.pk, GenerationJob.PENDING, 0.0, '')
+        )
+
+    def test_status_of_a_finished_job(self):
+        job = self.execute(self.enqueue(mode='greedy', seed=1, attempts=1)[0])
+        status = self.status(job)
+        self.assertEqual((status['status'], status['error']), (GenerationJob.SUCCEEDED, ''))
+        self.assertEqual(status['cells_filled'], TimetableEntry.objects.count())
+        self.assertEqual(status['percent_filled'], round(100.0 * status['cells_filled'] / status['cells_total'], 1))
+        self.assertGreaterEqual(status['elapsed_seconds'], 0)
+
+    def test_status_of_a_failed_job(self):
+        job, _ = self.enqueue(mode='greedy')
+        with mock.patch('timetableApp.jobs.generate_timetable', side_effect=SolverError('No staff left.')):
+            job = self.execute(job)
+        status = self.status(job)
+        self.assertEqual((status['status'], status['error']), (GenerationJob.FAILED, 'No staff left.'))
+        self.assertFalse(TimetableEntry.objects.exists())
+        self.assertTrue(self.enqueue(mode='greedy')[1])
+
+
+class SnapshotTests(TimetableTestCase):
+    def setUp(self):
+        create_institution(seed=3, **SIZES[0])
+        generate_timetable(seed=1, mode='greedy', attempts=1)
+
+    def test_round_trip(self):
+        adjusted = TimetableEntry.objects.order_by('pk').first()
+        TimetableEntry.objects.filter(pk=adjusted.pk).update(is_adjusted=True)
+        snapshot = take_snapshot('before')
+        generate_timetable(seed=2, mode='greedy', attempts=1)
+        changes = diff_cells(current_cells(), unpack_cells(snapshot))
+        self.assertTrue(changes)
+        self.assertNotIn((adjusted.course_id, adjusted.period_id), {change[:2] for change in changes})
+
+        self.assertEqual(restore_snapshot(snapshot), (snapshot.entry_count, 0))
+        self.assertEqual(diff_cells(current_cells(), unpack_cells(snapshot)), [])
+        np.testing.assert_array_equal(current_cells(), unpack_cells(snapshot))
+        restored = TimetableEntry.objects.get(course_id=adjusted.course_id, period_id=adjusted.period_id)
+        self.assertTrue(restored.is_adjusted)
+        # The replaced timetable was kept, so the restore can be undone.
+        undo = TimetableSnapshot.objects.filter(automatic=True).latest('created_at', 'pk')
+        self.assertEqual(len(diff_cells(unpack_cells(undo), unpack_cells(snapshot))), len(changes))
+
+    def test_restore_skips_deleted_rows(self):
+        snapshot = take_snapshot()
+        staff = Staff.objects.filter(timetableentry__isnull=False).distinct().order_by('pk').first()
+        taught = TimetableEntry.objects.filter(staff=staff).count()
+        staff.delete()
+        self.assertEqual(restore_snapshot(snapshot), (snapshot.entry_count - taught, taught))
+        self.assertFalse(TimetableEntry.objects.filter(staff_id=staff.pk).exists())
+        self.assertEqual(TimetableEntry.objects.count(), snapshot.entry_count - taught)
+
+    @override_settings(TIMETABLE_SNAPSHOT_KEEP=2)
+    def test_automatic_snapshots_are_pruned(self):
+        kept = take_snapshot('manual')
+        taken = [take_snapshot(automatic=True) for _ in range(4)]
+        automatic = TimetableSnapshot.objects.filter(automatic=True)
+        self.assertEqual(set(automatic.values_list('pk', flat=True)), {taken[-1].pk, taken[-2].pk})
+        self.assertTrue(TimetableSnapshot.objects.filter(pk=kept.pk).exists())
+
+
+class ProfilingTests(TimetableTestCase):
+    def setUp(self):
+        super().setUp()
+        profiling.store.reset()
+        self.addCleanup(profiling.store.reset)
+
+    def test_percentile_uses_the_nearest_rank(self):
+        ten = list(range(1, 11))
+        self.assertEqual(percentile(ten, 0.50), 5)
+        self.assertEqual(percentile(ten, 0.95), 10)
+        self.assertEqual(percentile(list(range(1, 21)), 0.95), 19)
+        self.assertEqual(percentile(list(range(1, 101)), 0.57), 57)
+        self.assertEqual(percentile(list(range(1, 101)), 0.99), 99)
+        self.assertEqual((percentile(ten, 0), percentile(ten, 1)), (1, 10))
+        self.assertEqual(percentile([7], 0.99), 7)
+        self.assertIsNone(percentile([], 0.5))
+
+    def test_recorder_reports_repeated_query_shapes(self):
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            for pk in (1, 2, 3):
+                list(Course.objects.filter(pk=pk))
+            list(Staff.objects.all())
+        self.assertEqual(recorder.count, 4)
+        self.assertEqual(list(recorder.duplicates().values()), [2])
+
+    @override_settings(TIMETABLE_PROFILING_SAMPLE_RATE=1)
+    def test_middleware_records_sampled_requests(self):
+        subject = build_institution(1, {'Course A': {'Maths A': (['Ann'], None)}})['Maths A']
+        url = reverse('get_staff_by_subject', kwargs={'subject_id': subject.id})
+        for _ in range(3):
+            self.client.get(url)
+        stats = profiling.store.summary()['get_staff_by_subject']
+        self.assertEqual((stats['requests'], stats['window']), (3, 3))
+        self.assertEqual(stats['queries'], {'p50': 1, 'p95': 1, 'p99': 1, 'max': 1})
+        self.assertGreater(stats['wall_ms']['max'], 0)
+
+    def test_middleware_is_removed_when_sampling_is_off(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            QueryProfilingMiddleware(lambda request: None)
+        self.client.get(reverse('course_list'))
+        self.assertEqual(profiling.store.summary(), {})
+
+    @override_settings(TIMETABLE_PROFILING_SAMPLE_RATE=1)
+    def test_stats_endpoint(self):
+        self.client.get(reverse('course_list'))
+        self.assertEqual(self.client.get(reverse('profiling_stats')).status_code, 302)
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        payload = self.client.get(reverse('profiling_stats')).json()
+        self.assertEqual(payload['sample_rate'], 1)
+        course_list = payload['views']['course_list']
+        self.assertEqual(
+            set(course_list), {'requests', 'window', 'wall_ms', 'queries', 'sql_ms', 'duplicate_queries'}
+        )
+        self.assertEqual(set(course_list['sql_ms']), {'p50', 'p95', 'p99', 'max'})
+
+
+class OptimizerTests(TimetableTestCase):
+    """
+    Checks the invariants of the simulated-annealing improvement.
+    """
+    def setUp(self):
+        super().setUp()
+        create_institution(seed=3, **SIZES[1])
+        generate_timetable(seed=1, mode='greedy', attempts=1)
+        adjusted = TimetableEntry.objects.order_by('pk')[:5].values_list('pk', flat=True)
+        TimetableEntry.objects.filter(pk__in=list(adjusted)).update(is_adjusted=True)
+        self.data = load_solver_input()
+        self.assignments = solve_greedy(self.data, random.Random(0))
+
+    def test_moves_keep_the_hard_constraints(self):
+        subjects = Counter((cell.course_id, cell.subject_id) for cell in self.assignments)
+        for seed in range(3):
+            optimized, _ = optimize_assignments(
+                self.data, self.assignments, random.Random(seed), time_limit=10, max_iterations=20000
+            )
+            assert_valid_timetable(self, self.data, optimized)
+            self.assertFalse({(cell.course_id, cell.period_id) for cell in optimized} & self.data.pinned_cells)
+            self.assertEqual(Counter((cell.course_id, cell.subject_id) for cell in optimized), subjects)
+
+    def test_result_never_scores_worse_than_the_input(self):
+        for seed in range(3):
+            optimized, stats = optimize_assignments(
+                self.data, self.assignments, random.Random(seed), time_limit=10, max_iterations=20000
+            )
+            self.assertGreater(stats['accepted'], 0)
+            self.assertLessEqual(stats['cost'], stats['initial_cost'])
+            # The returned timetable is the one the reported cost belongs to.
+            self.assertAlmostEqual(_State(self.data, optimized).cost, stats['cost'])
+
+    def test_best_timetable_is_restored_from_the_journal(self):
+        # At a high temperature most moves are accepted, so the runs end away from their best:
+        # the short one undoes its journal, the long one outgrows it and copies the best instead.
+        for iterations in (100, 20000):
+            with mock.patch('timetableApp.optimizer.START_TEMPERATURE', 50.0), \
+                    mock.patch('timetableApp.optimizer.END_TEMPERATURE', 50.0):
+                optimized, stats = optimize_assignments(
+                    self.data, self.assignments, random.Random(1), time_limit=10, max_iterations=iterations
+                )
+            self.assertAlmostEqual(_State(self.data, optimized).cost, stats['cost'])
+            assert_valid_timetable(self, self.data, optimized)
+
+
+class StopAfterChecks:
+    """
+    Stand-in for the multiprocessing stop event that reports being set after `checks` checks.
+    """
+    def __init__(self, checks):
+        self.checks = checks
+
+    def is_set(self):
+        self.checks -= 1
+        return self.checks < 0
+
+
+class MultistartTests(TimetableTestCase):
+    def test_running_attempt_stops_when_the_event_is_set(self):
+        create_institution(seed=3, **SIZES[1])
+        data = load_solver_input()
+        for mode in ('greedy', 'backtracking'):
+            # The event is clear when the attempt starts and set at its first progress report.
+            _init_worker(data, mode, 10, StopAfterChecks(1))
+            self.assertIsNone(_run_attempt(0))
+            _init_worker(data, mode, 10, StopAfterChecks(10 ** 6))
+            _, _, assignments = _run_attempt(0)
+            assert_valid_timetable(self, data, assignments)
+
+
+class ExportTests(TimetableTestCase):
+    def setUp(self):
+        super().setUp()
+        self.objects = build_institution(2, {
+            'Course A': {'Maths A': (['Ann', 'Dan'], None), 'Physics, Lab A': (['Bob'], None)},
+            'Course B': {'Maths B': (['Cat'], None)},
+        })
+        # The second period has no times, so it cannot be placed in a calendar.
+        Period.objects.filter(period_number=1).update(start_time=time(9), end_time=time(9, 45))
+        first, second = Period.objects.order_by('period_number')
+        self.entries = [
+            TimetableEntry.objects.create(
+                course=self.objects[course], period=period, subject=self.objects[subject], staff=self.objects[staff]
+            )
+            for course, period, subject, staff in [
+                ('Course B', first, 'Maths B', 'Cat'),
+                ('Course A', second, 'Physics, Lab A', 'Bob'),
+                ('Course A', first, 'Maths A', 'Ann'),
+            ]
+        ]
+
+    def export(self, name, query='', etag=None, **kwargs):
+        headers = {'If-None-Match': etag} if etag else {}
+        response = self.client.get(reverse(name, kwargs=kwargs) + query, headers=headers)
+        content = b''.join(response.streaming_content).decode() if response.streaming else ''
+        return response, content
+
+    def test_csv(self):
+        response, content = self.export('export_timetable', file_format='csv')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="timetable.csv"')
+        rows = list(csv.reader(io.StringIO(content, newline='')))
+        self.assertEqual(rows, [
+            CSV_COLUMNS,
+            ['Course A', 'Maths A', 'Ann', 'Monday', '1', '09:00', '09:45', '0'],
+            ['Course A', 'Physics, Lab A', 'Bob', 'Monday', '2', '', '', '0'],
+            ['Course B', 'Maths B', 'Cat', 'Monday', '1', '09:00', '09:45', '0'],
+        ])
+
+    def test_ndjson(self):
+        course = self.objects['Course A']
+        response, content = self.export('export_course_timetable', file_format='ndjson', course_id=course.id)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        lines = [json.loads(line) for line in content.splitlines()]
+        first = Period.objects.get(period_number=1)
+        self.assertEqual(lines[0], {
+            'course': {'id': course.id, 'name': 'Course A'},
+            'subject': {'id': self.objects['Maths A'].id, 'name': 'Maths A'},
+            'staff': {'id': self.objects['Ann'].id, 'name': 'Ann'},
+            'period': {'id': first.id, 'day': 'Monday', 'period_number': 1, 'start_time': '09:00', 'end_time': '09:45'},
+            'is_adjusted': False,
+        })
+        self.assertEqual([line['subject']['name'] for line in lines], ['Maths A', 'Physics, Lab A'])
+        self.assertIsNone(lines[1]['period']['start_time'])
+
+        missing = Course.objects.order_by('-pk').first().pk + 1
+        response, _ = self.export('export_course_timetable', file_format='ndjson', course_id=missing)
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.export('export_timetable', file_format='xml')[0].status_code, 404)
+
+    def test_ics(self):
+        # A Wednesday start places the events in the week beginning on Monday 19 October.
+        response, content = self.export('export_timetable', '?start=2026-10-21', file_format='ics')
+        self.assertEqual(response['Content-Type'], 'text/calendar; charset=utf-8')
+        self.assertTrue(content.endswith('\r\n'))
+        self.assertNotIn('\n', content.replace('\r\n', ''))
+        lines = content.split('\r\n')
+        self.assertEqual((lines[0], lines[-2]), ('BEGIN:VCALENDAR', 'END:VCALENDAR'))
+        # The untimed Physics period is left out.
+        self.assertEqual(lines.count('BEGIN:VEVENT'), 2)
+        self.assertEqual(lines.count('DTSTART:20261019T090000'), 2)
+        self.assertEqual(lines.count('DTEND:20261019T094500'), 2)
+        self.assertEqual(lines.count('RRULE:FREQ=WEEKLY;BYDAY=MO'), 2)
+        self.assertIn('SUMMARY:Maths A (Course A)', lines)
+
+        response, content = self.export(
+            'export_staff_timetable', file_format='ics', staff_id=self.objects['Bob'].id
+        )
+        self.assertNotIn('BEGIN:VEVENT', content)
+
+    def test_unchanged_export_is_not_modified(self):
+        url = {'file_format': 'csv', 'course_id': self.objects['Course A'].id}
+        response, content = self.export('export_course_timetable', **url)
+        etag = response['ETag']
+        response, _ = self.export('export_course_timetable', etag=etag, **url)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        # The calendar week is part of a calendar's ETag.
+        this_week, next_week = (
+            self.export('export_timetable', f'?start={start}', file_format='ics')[0]['ETag']
+            for start in ('2026-10-19', '2026-10-26')
+        )
+        self.assertNotEqual(this_week, next_week)
+
+        entry = self.entries[2]
+        entry.staff = self.objects['Dan']
+        with self.captureOnCommitCallbacks(execute=True):
+            entry.save()
+        response, changed = self.export('export_course_timetable', etag=etag, **url)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(changed, content.replace('Ann', 'Dan'))
+
+
+class TimetableApiTests(TimetableTestCase):
+    def setUp(self):
+        super().setUp()
+        self.objects = build_institution(2, {
+            'Course A': {'Maths A': (['Ann', 'Cat'], None), 'Physics A': (['Bob'], None)},
+            'Course B': {'Maths B': (['Bob'], None)},
+        })
+        tuesday = Period.objects.create(day='Tuesday', period_number=1)
+        timetable_cache.invalidate_timetable(structure=True)
+        first, second = Period.objects.filter(day='Monday').order_by('period_number')
+        for course, period, subject, staff in [
+            ('Course A', first, 'Maths A', 'Ann'),
+            ('Course A', tuesday, 'Physics A', 'Bob'),
+            ('Course B', second, 'Maths B', 'Bob'),
+        ]:
+            TimetableEntry.objects.create(
+                course=self.objects[course], period=period, subject=self.objects[subject], staff=self.objects[staff]
+            )
+
+    def ids(self, *names):
+        return [self.objects[name].id for name in names]
+
+    def get(self, by, key=None, etag=None):
+        url = reverse('timetable_api', kwargs={'by': by}) if key is None else \
+            reverse('timetable_api_detail', kwargs={'by': by, 'key': key})
+        return self.client.get(url, headers={'If-None-Match': etag} if etag else {})
+
+    def test_payload_by_course(self):
+        response = self.get('course')
+        self.assertEqual(response['Content-Type'], 'application/json')
+        course_a, course_b, maths_a, physics_a, maths_b, ann, bob = self.ids(
+            'Course A', 'Course B', 'Maths A', 'Physics A', 'Maths B', 'Ann', 'Bob'
+        )
+        # JSON object keys are strings.
+        self.assertEqual(response.json(), {
+            'by': 'course',
+            'days': ['Monday', 'Tuesday'],
+            'period_numbers': [1, 2],
+            'names': {
+                'courses': {str(course_a): 'Course A', str(course_b): 'Course B'},
+                'subjects': {str(maths_a): 'Maths A', str(physics_a): 'Physics A', str(maths_b): 'Maths B'},
+                'staff': {str(ann): 'Ann', str(bob): 'Bob'},
+            },
+            'grid': {
+                str(course_a): [[0, 0, course_a, maths_a, ann, 0], [1, 0, course_a, physics_a, bob, 0]],
+                str(course_b): [[0, 1, course_b, maths_b, bob, 0]],
+            },
+            'load': {str(course_a): [1, 1], str(course_b): [1, 0]},
+        })
+
+    def test_single_staff_member_and_day(self):
+        course_a, course_b, physics_a, maths_b, bob = self.ids('Course A', 'Course B', 'Physics A', 'Maths B', 'Bob')
+        payload = self.get('staff', bob).json()
+        self.assertEqual(payload['grid'], {
+            str(bob): [[0, 1, course_b, maths_b, bob, 0], [1, 0, course_a, physics_a, bob, 0]],
+        })
+        self.assertEqual(payload['load'], {str(bob): [1, 1]})
+        payload = self.get('day', 'Tuesday').json()
+        self.assertEqual(payload['grid'], {'Tuesday': [[1, 0, course_a, physics_a, bob, 0]]})
+        self.assertEqual(set(payload['names']['staff']), {str(bob)})
+
+        for by, key in [('period', None), ('course', 'first')]:
+            self.assertEqual(self.get(by, key).status_code, 404)
+
+    def test_etag_changes_when_the_timetable_is_edited(self):
+        response = self.get('course')
+        etag = response['ETag']
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertNotEqual(self.get('staff')['ETag'], etag)
+        with self.assertNumQueries(0):
+            response = self.get('course', etag=etag)
+        self.assertEqual((response.status_code, response.content), (304, b''))
+
+        url = reverse('edit_timetable_row', kwargs={'course_id': self.objects['Course A'].id, 'day': 'Monday'})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(url, {'subject_1': self.objects['Maths A'].id, 'staff_1': self.objects['Cat'].id})
+        response = self.get('course', etag=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        course_a, maths_a, cat = self.ids('Course A', 'Maths A', 'Cat')
+        # The cached payload was replaced, not served again.
+        self.assertEqual(response.json()['grid'][str(course_a)][0], [0, 0, course_a, maths_a, cat, 1])
+        self.assertEqual(self.get('course', etag=response['ETag']).status_code, 304)
+
+
+class CacheVersionTests(TimetableTestCase):
+    def test_bumps_always_change_the_version(self):
+        before = timetable_cache.get_versions(['timetable', 'course:1'])
+        timetable_cache.invalidate_timetable([1])
+        timetable_cache.invalidate_timetable([1])
+        after = timetable_cache.get_versions(['timetable', 'course:1'])
+        self.assertGreater(after['timetable'], before['timetable'] + 1)
+        self.assertGreater(after['course:1'], before['course:1'] + 1)
+
+    def test_process_local_cache_is_reported(self):
+        self.assertEqual([warning.id for warning in check_timetable_cache(None)], ['timetableApp.W001'])
+        with override_settings(CACHES=ORIGINAL_CACHES):
+            self.assertEqual(check_timetable_cache(None), [])
+
+
+class ImporterTests(TimetableTestCase):
+    QUALIFICATIONS = (
+        "staff,subject,course\n"
+        "Ann,Maths,Course A\n"
+        "Ann,Physics,Course A\n"
+        "Bob,Maths,Course A\n"
+        "Bob,Maths,Course B\n"
+        "Bob,Maths,Course B\n"
+        ",Art,Course B\n"
+    )
+
+    def import_qualifications(self):
+        rows = read_rows(io.StringIO(self.QUALIFICATIONS, newline=''), 'csv')
+        return import_rows('qualifications', rows, batch_size=2)
+
+    def test_importing_twice_creates_nothing_new(self):
+        first = self.import_qualifications()
+        self.assertEqual(first['created'], {'courses': 2, 'subjects': 3, 'staff': 2, 'qualifications': 4})
+        self.assertEqual(first['skipped'], 1)
+        self.assertEqual(Subject.staff.through.objects.count(), 4)
+
+        second = self.import_qualifications()
+        self.assertEqual(second['created'], {'courses': 0, 'subjects': 0, 'staff': 0, 'qualifications': 0})
+        self.assertEqual(Subject.staff.through.objects.count(), 4)
+        self.assertEqual(Course.objects.count(), 2)
+
+
+class GenerationMemoTests(TimetableTestCase):
+    def setUp(self):
+        create_institution(seed=3, **SIZES[0])
+
+    def entry_ids(self):
+        return set(TimetableEntry.objects.values_list('pk', flat=True))
+
+    def test_same_seed_and_inputs_write_nothing(self):
+        generate_timetable(seed=4, mode='greedy', attempts=1)
+        written = self.entry_ids()
+        snapshots = TimetableSnapshot.objects.count()
+        entries = generate_timetable(seed=4, mode='greedy', attempts=1)
+        self.assertEqual({entry.pk for entry in entries}, written)
+        self.assertEqual(self.entry_ids(), written)
+        self.assertEqual(TimetableSnapshot.objects.count(), snapshots)
+
+    def test_changed_input_misses(self):
+        generate_timetable(seed=4, mode='greedy', attempts=1)
+        written = self.entry_ids()
+        subject = Subject.objects.order_by('pk').first()
+        subject.staff.add(*Staff.objects.exclude(subjects=subject)[:1])
+        generate_timetable(seed=4, mode='greedy', attempts=1)
+        self.assertTrue(self.entry_ids().isdisjoint(written))
+
+    def test_unseeded_generation_is_not_memoized(self):
+        generate_timetable(mode='greedy', attempts=1)
+        written = self.entry_ids()
+        generate_timetable(mode='greedy', attempts=1)
+        self.assertTrue(self.entry_ids().isdisjoint(written))
@@ -1,80 +1,101 @@
+import io
+import json
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.admin.views.decorators import staff_member_required
 from django.shortcuts import render, get_object_or_404, redirect
-from .models import Course, Subject, Staff, Period, TimetableEntry
-from .forms import SubjectForm, StaffForm, PeriodForm, CourseForm
-import random
-from collections import defaultdict
-from django.http import JsonResponse
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils.safestring import mark_safe
+from . import cache as timetable_cache
+from . import profiling
+from .models import Course, Subject, Staff, Period, TimetableEntry, GenerationJob, TimetableSnapshot
+from .occupancy import DayOccupancy
+from .forms import SubjectForm, StaffForm, PeriodForm, CourseForm, ImportForm
+from .export import CONTENT_TYPES, buffered, export_entries, stream_csv, stream_ndjson, stream_ics
+from .grid import GRID_KEYS, build_course_grid, build_staff_grid, timetable_payload
+from .importer import read_rows, import_rows
+from .jobs import enqueue_generation, job_status
+from .locks import LockLost, LockTimeout
+from .scoring import score_timetable
+from .slots import get_slot_index
+from .snapshots import current_cells, describe_changes, diff_cells, restore_snapshot, take_snapshot, unpack_cells
+from .solver import SOLVERS
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+from django.db import IntegrityError, transaction
+from django.db.models import Prefetch
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
 
-def generate_timetable():
+def generate_timetable_view(request):
     """
-    Generates a new timetable by assigning subjects and available staff to courses and periods, ensuring no scheduling conflicts.
-    
-    - Clears all existing TimetableEntry records.
-    - Loops through each course to assign subjects and available staff members to periods.
-    - Balances subject assignments across periods and avoids scheduling conflicts by checking staff availability.
+    View to start a background timetable generation job.
 
-    Returns:
-        None
-    """
-    TimetableEntry.objects.all().delete()
-    subject_assignment_count = defaultdict(lambda: defaultdict(int))
-    for course in Course.objects.all():
-        subjects = list(course.subjects.all())
-        periods = Period.objects.all()
-        
-        for period in periods:
-            random.shuffle(subjects)
-            assigned = False  # Flag to indicate if a suitable entry is created
-            subjects_sorted = sorted(subjects, key=lambda subj: subject_assignment_count[course][subj])
-            for selected_subject in subjects_sorted:
-                available_staff = list(selected_subject.staff.all())
-                random.shuffle(available_staff)  # Shuffle staff list to pick a random available member
-                
-                for staff in available_staff:
-                    conflict_exists = TimetableEntry.objects.filter(
-                        staff=staff,
-                        period__day=period.day,
-                        period__period_number=period.period_number
-                    ).exists()
-                    
-                    if not conflict_exists:
-                        TimetableEntry.objects.create(
-                            course=course,
-                            subject=selected_subject,
-                            staff=staff,
-                            period=period
-                        )
-                        # Increment the assignment count for this subject
-                        subject_assignment_count[course][selected_subject] += 1
-                        assigned = True
-                        break
-
-                if assigned:
-                    break
+    The solver can be chosen with the 'mode' query parameter ('greedy' or 'backtracking'), and
+    regeneration can be limited with repeated 'course' (course id) and 'day' query parameters.
+    'optimize' sets the seconds of local-search improvement, up to the solver time limit.
+    An identical generation that is still running is joined instead of starting a new one.
 
+    Args:
+        request (HttpRequest): The HTTP request object.
 
-def generate_timetable_view(request):
-    """
-    View to trigger the timetable generation and redirect to the timetable listing page.
+    Returns:
+        JsonResponse: The job status with HTTP 202 if JSON was requested.
+        HttpResponseRedirect: Otherwise redirects to 'timetable_list', which shows the job progress.
+    """
+    parameters = {}
+    mode = request.GET.get('mode')
+    if mode in SOLVERS:
+        parameters['mode'] = mode
+    course_ids = sorted({int(course_id) for course_id in request.GET.getlist('course') if course_id.isdigit()})
+    if course_ids:
+        parameters['course_ids'] = course_ids
+    days = sorted(set(request.GET.getlist('day')))
+    if days:
+        parameters['days'] = days
+    try:
+        optimize_time = float(request.GET['optimize'])
+    except (KeyError, ValueError):
+        optimize_time = None
+    if optimize_time is not None and optimize_time >= 0:
+        parameters['optimize_time'] = min(optimize_time, settings.TIMETABLE_SOLVER_TIME_LIMIT)
+
+    job, _ = enqueue_generation(**parameters)
+    if 'application/json' in request.headers.get('Accept', ''):
+        status = job_status(job)
+        status['status_url'] = reverse('generation_job_status', args=[job.pk])
+        return JsonResponse(status, status=202)
+    return redirect(f"{reverse('timetable_list')}?job={job.pk}")
+
+
+def generation_job_status(request, job_id):
+    """
+    Reports the progress of a background generation job.
 
     Args:
         request (HttpRequest): The HTTP request object.
+        job_id (int): The primary key of the GenerationJob.
 
     Returns:
-        HttpResponseRedirect: Redirects to 'timetable_list'.
+        JsonResponse: The job id, status, percent of cells filled, elapsed time and any error.
     """
-    generate_timetable()
-    return redirect('timetable_list')
-
+    job = get_object_or_404(GenerationJob, pk=job_id)
+    return JsonResponse(job_status(job))
 
 
 def edit_timetable_row(request, course_id, day):
     """
     Allows manual editing of timetable entries for a specific course and day.
 
-    - Retrieves the timetable entries for the specified course and day.
-    - Filters staff availability for each period and subject, excluding those already assigned to other courses.
-    - Updates timetable entries based on user-selected subjects and staff.
+    - Loads the day's staff occupancy once into a staff x period matrix (see occupancy.DayOccupancy).
+    - Derives, in memory, the staff that are qualified for each subject, free in each period and
+      within their availability and daily and weekly limits.
+    - Validates every submitted change against the same matrix and applies them with one bulk_update
+      inside a transaction, marking changed entries as adjusted. The database constraint on
+      (staff, period) rejects bookings made concurrently by other editors.
 
     Args:
         request (HttpRequest): The HTTP request object.
@@ -82,62 +103,117 @@ def edit_timetable_row(request, course_id, day):
         day (str): The day of the week for editing timetable entries.
 
     Returns:
-        HttpResponse: Redirects to 'timetable_list' after a POST request.
-        HttpResponse: Renders 'edit_timetable_row.html' with initial and available staff data for the form.
+        HttpResponse: Redirects to 'timetable_list' after a valid POST request.
+        HttpResponse: Renders 'edit_timetable_row.html' with the rows, staff options and any validation errors.
     
     Template Context:
         - 'course': The Course instance being edited.
         - 'day': The day of the week.
-        - 'timetable_entries': QuerySet of TimetableEntry objects for the specified course and day.
-        - 'initial_staff_per_subject': Pre-filtered staff list for each subject.
-        - 'available_staff_per_period': Staff available for each period without scheduling conflicts.
-        - 'subjects': QuerySet of Subject objects related to the course.
+        - 'rows': List of (entry, staff_options) pairs, where staff_options are the staff qualified
+          for the entry's subject, free in its period and within their limits.
+        - 'subjects': List of Subject objects related to the course.
+        - 'availability': Period number -> subject id -> list of {'id', 'name'} for the staff dropdowns.
+        - 'errors': Validation errors of a rejected POST.
     """
     course = get_object_or_404(Course, id=course_id)
-    periods = Period.objects.all()
-    timetable_entries = TimetableEntry.objects.filter(course=course, period__day=day)
-
-    # Pre-filter staff available for each period
-    available_staff_per_period = {}
-    for period in periods:
-        unavailable_staff = TimetableEntry.objects.filter(
-            period__day=day,
-            period__period_number=period.period_number
-        ).exclude(course=course).values_list('staff', flat=True)
-        available_staff = Staff.objects.exclude(id__in=unavailable_staff)
-        available_staff_per_period[period.period_number] = available_staff
-        
-    # Pre-filter staff for each timetable entry based on the subject
-    initial_staff_per_subject = {}
+    index = get_slot_index()
+    slots = index.slots_on(day)
+    timetable_entries = list(
+        TimetableEntry.objects.filter(course=course, period_id__in=[index.period_ids[slot] for slot in slots])
+    )
     for entry in timetable_entries:
-        initial_staff_per_subject[entry.subject.id] = Staff.objects.filter(subjects=entry.subject)
-        staff_for_subject = Staff.objects.filter(subjects=entry.subject)
-        # Exclude staff already assigned to the same period on the same day for a different course
-        already_assigned_staff = TimetableEntry.objects.filter(
-            period__day=day,
-            period__period_number=entry.period.period_number
-        ).exclude(course=course).values_list('staff', flat=True)
-        
-        initial_staff_per_subject[entry.subject.id] = staff_for_subject.exclude(id__in=already_assigned_staff)
-
+        entry.period = index.periods[index.slot_of_period[entry.period_id]]
+    timetable_entries.sort(key=lambda entry: entry.period.period_number)
+    occupancy = DayOccupancy(index, day, course.id)
+
+    subjects = list(Subject.objects.filter(course=course).order_by('id'))
+    subject_staff = defaultdict(list)
+    qualifications = Subject.staff.through.objects.filter(subject__course=course).order_by('staff__name')
+    for subject_id, staff_id in qualifications.values_list('subject_id', 'staff_id'):
+        subject_staff[subject_id].append(staff_id)
+    staff_by_id = Staff.objects.in_bulk({staff_id for staff in subject_staff.values() for staff_id in staff})
+    occupancy.load_limits(staff_by_id.values())
+    row_counts = Counter(entry.staff_id for entry in timetable_entries)
+
+    def available_staff(subject_id, entry):
+        # The cell's current staff member does not count against their own limits.
+        counts = Counter(row_counts)
+        counts[entry.staff_id] -= 1
+        return occupancy.free_staff(
+            [staff_by_id[staff_id] for staff_id in subject_staff.get(subject_id, ())],
+            entry.period.period_number, counts
+        )
+
+    errors = []
     if request.method == 'POST':
+        changed_entries = []
         for entry in timetable_entries:
-            subject_id = request.POST.get(f'subject_{entry.period.period_number}')
-            staff_id = request.POST.get(f'staff_{entry.period.period_number}')
-            if subject_id and staff_id:
-                entry.subject = Subject.objects.get(id=subject_id)
-                entry.staff = Staff.objects.get(id=staff_id)
-                entry.save()
-        return redirect('timetable_list') 
+            period_number = entry.period.period_number
+            subject_id = request.POST.get(f'subject_{period_number}')
+            staff_id = request.POST.get(f'staff_{period_number}')
+            if not (subject_id and staff_id):
+                continue
+            if not (subject_id.isdigit() and staff_id.isdigit()):
+                errors.append(f"Period {period_number}: invalid selection.")
+                continue
+            subject_id, staff_id = int(subject_id), int(staff_id)
+            if (subject_id, staff_id) == (entry.subject_id, entry.staff_id):
+                continue
+            if staff_id not in subject_staff.get(subject_id, ()):
+                errors.append(f"Period {period_number}: the selected staff member cannot teach this subject.")
+            elif not occupancy.is_free(staff_id, period_number):
+                errors.append(f"Period {period_number}: {staff_by_id[staff_id].name} already teaches another course.")
+            else:
+                entry.subject_id = subject_id
+                entry.staff_id = staff_id
+                entry.is_adjusted = True  # Keep manual changes across regenerations
+                changed_entries.append(entry)
+        row_counts = Counter(entry.staff_id for entry in timetable_entries)
+        for entry in changed_entries:
+            limit = occupancy.violation(entry.staff_id, entry.period.period_number, row_counts[entry.staff_id])
+            if limit is not None:
+                errors.append(_limit_error(staff_by_id[entry.staff_id], entry.period, limit))
+        if not errors:
+            try:
+                if changed_entries:
+                    with transaction.atomic():
+                        TimetableEntry.objects.bulk_update(changed_entries, ['subject', 'staff', 'is_adjusted'])
+                        # bulk_update sends no post_save signals, so invalidate this course here.
+                        transaction.on_commit(lambda: timetable_cache.invalidate_timetable([course.id]))
+                return redirect('timetable_list')
+            except IntegrityError:
+                # The unique (staff, period) constraint caught a booking made by another editor
+                # after the occupancy matrix was loaded.
+                errors.append("A selected staff member was just booked for another course. Please review the changes.")
+
+    availability = {
+        entry.period.period_number: {
+            subject.id: [{'id': staff.id, 'name': staff.name} for staff in available_staff(subject.id, entry)]
+            for subject in subjects
+        }
+        for entry in timetable_entries
+    }
+    rows = [(entry, available_staff(entry.subject_id, entry)) for entry in timetable_entries]
     return render(request, 'timetable/edit_timetable_row.html', {
         'course': course,
         'day': day,
-        'timetable_entries': timetable_entries,
-        'initial_staff_per_subject': initial_staff_per_subject,
-        'available_staff_per_period': available_staff_per_period,
-        'subjects': Subject.objects.filter(course=course)
-    })
+        'rows': rows,
+        'subjects': subjects,
+        'availability': availability,
+        'errors': errors,
+    }, status=400 if errors else 200)
     
+def _limit_error(staff, period, limit):
+    """
+    Returns the validation message for a staff member's broken limit ('unavailable', 'day' or 'week').
+    """
+    if limit == 'unavailable':
+        return f"Period {period.period_number}: {staff.name} is not available in this period."
+    if limit == 'day':
+        return f"Period {period.period_number}: {staff.name} would teach more than {staff.max_periods_per_day} periods on {period.day}."
+    return f"Period {period.period_number}: {staff.name} would teach more than {staff.max_periods_per_week} periods this week."
+
+
 def get_staff_by_subject(request, subject_id):
     """
     Retrieves a list of staff members who can teach a specific subject.
@@ -245,7 +321,7 @@ def subject_list(request):
     Returns:
         HttpResponse: Renders the list of subjects.
     """
-    subjects = Subject.objects.all()
+    subjects = Subject.objects.select_related('course').prefetch_related('staff')
     return render(request, 'timetable/subject_list.html', {'subjects': subjects})
 
 def subject_create(request):
@@ -327,7 +403,9 @@ def staff_list(request):
     Returns:
         HttpResponse: Renders the list of staff members.
     """
-    staffs = Staff.objects.prefetch_related('subjects').all()
+    staffs = Staff.objects.prefetch_related(
+        Prefetch('subjects', queryset=Subject.objects.select_related('course'))
+    )
     return render(request, 'staff/staff_list.html', {'staffs': staffs})
 
 def staff_create(request):
@@ -357,7 +435,7 @@ def staff_create(request):
         form = StaffForm()
 
     subjects = Subject.objects.all() 
-    return render(request, 'staff/staff_form.html', {'form': form, 'subjects': subjects})
+    return _render_staff_form(request, form, subjects)
 
 
 def staff_update(request, pk):
@@ -388,7 +466,39 @@ def staff_update(request, pk):
         form = StaffForm(instance=staff)
     
     subjects = Subject.objects.all()
-    return render(request, 'staff/staff_form.html', {'form': form, 'subjects': subjects, 'staff': staff})
+    return _render_staff_form(request, form, subjects, staff)
+
+
+def _render_staff_form(request, form, subjects, staff=None):
+    """
+    Renders the staff form with its subject checkboxes and the week grid of unavailable periods.
+    """
+    index = get_slot_index()
+    return render(request, 'staff/staff_form.html', {
+        'form': form,
+        'subjects': subjects,
+        'staff': staff,
+        'selected_subjects': _selected_subject_ids(request, staff),
+        'week_rows': index.week_rows(),
+        'period_numbers': index.period_numbers,
+        # The bound field holds the submitted choices or the saved ones, so a rejected form keeps its input.
+        'unavailable_periods': {
+            int(pk) for pk in form['unavailable_periods'].value() or () if str(pk).isdigit()
+        },
+    })
+
+
+def _selected_subject_ids(request, staff=None):
+    """
+    Returns the ids of the subjects to show as checked on the staff form.
+
+    Submitted choices win over the staff member's saved subjects, so a rejected form keeps its input.
+    """
+    if request.method == 'POST':
+        return {int(subject_id) for subject_id in request.POST.getlist('subjects') if subject_id.isdigit()}
+    if staff is None:
+        return set()
+    return set(staff.subjects.values_list('id', flat=True))
 
 def staff_delete(request, pk):
     """
@@ -408,9 +518,95 @@ def staff_delete(request, pk):
         return redirect('staff_list')
     return render(request, 'staff/staff_delete.html', {'staff': staff})
 
+def staff_timetable(request, pk):
+    """
+    Displays one staff member's week as a day x period grid with their weekly load.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+        pk (int): The primary key of the staff member.
+
+    Returns:
+        HttpResponse: Renders 'staff/staff_timetable.html' for the staff member.
+    """
+    staff = get_object_or_404(Staff, pk=pk)
+    return _render_staff_timetables(request, [staff], staff.name)
+
+
+def staff_timetables(request):
+    """
+    Displays the timetable of every staff member on one printable page.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+
+    Returns:
+        HttpResponse: Renders 'staff/staff_timetable.html' for all staff members.
+    """
+    return _render_staff_timetables(request, Staff.objects.order_by('name', 'id'), 'All Staff Timetables')
+
+
+def _render_staff_timetables(request, staff_members, title):
+    """
+    Renders staff timetables from one joined query over their entries, whatever their number;
+    periods come from the cached slot index.
+
+    Template Context:
+        - 'title': Page heading.
+        - 'staff_timetables': (staff, rows, load) triples from grid.build_staff_grid.
+        - 'period_numbers': Sorted period numbers defined in the Period table.
+    """
+    staff_members = list(staff_members)
+    index = get_slot_index()
+    entries = TimetableEntry.objects.select_related('course', 'subject')
+    if len(staff_members) == 1:
+        entries = entries.filter(staff_id=staff_members[0].id)
+    return render(request, 'staff/staff_timetable.html', {
+        'title': title,
+        'staff_timetables': build_staff_grid(staff_members, entries, index),
+        'period_numbers': index.period_numbers,
+    })
+
+
+@staff_member_required
+def import_data(request):
+    """
+    Imports courses, subjects, staff or qualifications from an uploaded CSV or JSON file.
+
+    The upload is streamed row by row and written in batches, so large files are not held
+    in memory.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+
+    Returns:
+        HttpResponse: Renders the upload form, with the import statistics after a POST.
+
+    Template Context:
+        form (ImportForm): The upload form.
+        stats (dict): Result of importer.import_rows, after a successful upload.
+    """
+    stats = None
+    if request.method == 'POST':
+        form = ImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            upload = form.cleaned_data['file']
+            stream = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+            try:
+                stats = import_rows(form.cleaned_data['kind'], read_rows(stream, form.file_format))
+            except ValueError as error:
+                form.add_error('file', f"Could not read the file: {error}")
+            finally:
+                stream.detach()
+    else:
+        form = ImportForm()
+    return render(request, 'timetable/import_form.html', {'form': form, 'stats': stats})
+
 def period_list(request):
     """
-    Displays a list of periods with editable start and end times, and saves any modifications.
+    Displays the periods of the week with editable start and end times, and saves any modifications.
+
+    Days and period numbers are whatever the Period table holds, laid out by the slot index.
 
     Args:
         request (HttpRequest): The HTTP request object.
@@ -420,23 +616,51 @@ def period_list(request):
         HttpResponse: Renders the 'timetable/period_list.html' template, listing all periods.
     
     Template Context:
-        - 'periods': QuerySet of all Period objects.
-        - 'days': List of weekdays ('Monday' to 'Friday').
-        - 'period_numbers': Range object indicating period numbers (1 to 4).
+        - 'rows': List of (day, periods) pairs with one Period or None per period number.
+        - 'period_numbers': Sorted period numbers defined in the Period table.
     """
-    periods = Period.objects.all() 
     if request.method == 'POST':
+        periods = list(Period.objects.all())
         for period in periods:
             start_time = request.POST.get(f'start_time_{period.pk}')
             end_time = request.POST.get(f'end_time_{period.pk}')
             period.start_time = start_time if start_time else None  
             period.end_time = end_time if end_time else None  
-            period.save()
+        with transaction.atomic():
+            Period.objects.bulk_update(periods, ['start_time', 'end_time'])
+            # bulk_update sends no post_save signals, so invalidate the structure here.
+            transaction.on_commit(lambda: timetable_cache.invalidate_timetable(structure=True))
         return redirect('period_list') 
 
-    days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']
-    period_numbers = range(1, 5)
-    return render(request, 'timetable/period_list.html', {'periods': periods, 'days': days, 'period_numbers': period_numbers})
+    index = get_slot_index()
+    return render(request, 'timetable/period_list.html', {
+        'rows': index.week_rows(),
+        'period_numbers': index.period_numbers,
+    })
+
+
+def period_create(request):
+    """
+    Adds a period to the week, e.g. an extra period number or a Saturday period.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+
+    Returns:
+        HttpResponse: Redirects to 'period_list' after a successful creation on a POST request.
+        HttpResponse: Renders the 'timetable/period_form.html' template with an empty form.
+
+    Template Context:
+        - 'form': Instance of PeriodForm.
+    """
+    if request.method == 'POST':
+        form = PeriodForm(request.POST)
+        if form.is_valid():
+            form.save()
+            return redirect('period_list')
+    else:
+        form = PeriodForm()
+    return render(request, 'timetable/period_form.html', {'form': form})
 
 
 def period_update(request, pk):
@@ -466,7 +690,12 @@ def period_update(request, pk):
 
 def timetable_list(request):
     """
-    Displays a comprehensive timetable listing for all courses over a five-day week.
+    Displays a comprehensive timetable listing for all courses over the days and periods defined in the Period table.
+
+    The page and each course's timetable are cached under versioned keys (see cache.py), so only
+    courses that changed since the last render are rebuilt. Missing courses are loaded with their
+    subject and staff in a single joined query and placed into a dense grid by the slot index of
+    their period, so the template renders each cell without further lookups.
 
     Args:
         request (HttpRequest): The HTTP request object.
@@ -475,23 +704,317 @@ def timetable_list(request):
         HttpResponse: Renders the 'timetable/timetable_list.html' template displaying the timetable.
     
     Template Context:
-        - 'timetable_data': Dictionary where each course maps to its associated TimetableEntry instances.
-        - 'days': List of weekdays ('Monday' to 'Friday').
-        - 'period_numbers': Range object indicating period numbers (1 to 4).
+        - 'course_timetables': Rendered 'timetable/course_timetable.html' fragment of each course.
+        - 'job_id': Id of a generation job whose progress should be shown, if any.
+
+    Course Fragment Context:
+        - 'course': The Course instance.
+        - 'rows': List of (day, cells) pairs holding one list of entries per period.
+        - 'period_numbers': Sorted period numbers defined in the Period table.
+    """
+    job_id = request.GET.get('job')
+    job_id = int(job_id) if job_id and job_id.isdigit() else None
+    cacheable = job_id is None and not len(messages.get_messages(request))
+    if cacheable:
+        page_key = timetable_cache.page_key('timetable_list')
+        page = timetable_cache.get_page(page_key)
+        if page is not None:
+            return HttpResponse(page)
+
+    courses = list(Course.objects.order_by('id'))
+    keys = timetable_cache.fragment_keys([course.id for course in courses])
+    fragments = timetable_cache.get_fragments(keys)
+    missing = [course for course in courses if course.id not in fragments]
+    if missing:
+        index = get_slot_index()
+        entries = TimetableEntry.objects.select_related('subject', 'staff')
+        if len(missing) < len(courses):
+            entries = entries.filter(course_id__in=[course.id for course in missing])
+        for course, rows in build_course_grid(missing, entries, index):
+            fragment = render_to_string('timetable/course_timetable.html', {
+                'course': course,
+                'rows': rows,
+                'period_numbers': index.period_numbers,
+            })
+            timetable_cache.set_fragment(keys[course.id], fragment)
+            fragments[course.id] = fragment
+
+    response = render(request, 'timetable/timetable_list.html', {
+        'course_timetables': [mark_safe(fragments[course.id]) for course in courses],
+        'job_id': job_id,
+    })
+    if cacheable:
+        timetable_cache.set_page(page_key, response.content.decode(response.charset))
+    return response
+
+
+
+def _export_week_start(request):
     """
-    courses = Course.objects.all()
-    timetable_data = {}
+    Returns the Monday of the week given by the 'start' query parameter (YYYY-MM-DD), or of this week.
+    """
+    try:
+        day = date.fromisoformat(request.GET['start'])
+    except (KeyError, ValueError):
+        day = timezone.localdate()
+    return day - timedelta(days=day.weekday())
+
+
+def _export_etag(request, file_format, course_id=None, staff_id=None):
+    # The global timetable version changes whenever any entry, course, subject, staff member
+    # or period changes, so an unchanged version means an unchanged export.
+    version = timetable_cache.get_versions(['timetable'])['timetable']
+    etag = f"export-{file_format}-{course_id or ''}-{staff_id or ''}-{version}"
+    if file_format == 'ics':
+        etag += f"-{_export_week_start(request).isoformat()}"
+    return etag
+
+
+@condition(etag_func=_export_etag)
+def export_timetable(request, file_format, course_id=None, staff_id=None):
+    """
+    Streams the timetable of the whole institution, one course or one staff member.
+
+    Entries are read through a server-side iterator and written line by line, so memory use
+    does not depend on the size of the timetable. Responses carry an ETag derived from the
+    timetable cache version; a matching If-None-Match gets HTTP 304 without reading any entries.
+
+    Args:
+        request (HttpRequest): The HTTP request object. For 'ics', the optional 'start' query
+            parameter (YYYY-MM-DD) selects the week of the first occurrences.
+        file_format (str): 'csv', 'ndjson' or 'ics'.
+        course_id (int, optional): Export only this course.
+        staff_id (int, optional): Export only this staff member.
+
+    Returns:
+        StreamingHttpResponse: The export as an attachment.
+
+    Raises:
+        Http404: If the format is unknown or the course or staff member does not exist.
+    """
+    if file_format not in CONTENT_TYPES:
+        raise Http404(f"Unknown export format {file_format!r}.")
+    name = 'timetable'
+    if course_id is not None:
+        get_object_or_404(Course, pk=course_id)
+        name = f'timetable-course-{course_id}'
+    if staff_id is not None:
+        get_object_or_404(Staff, pk=staff_id)
+        name = f'timetable-staff-{staff_id}'
+
+    entries = export_entries(course_id=course_id, staff_id=staff_id)
+    if file_format == 'csv':
+        content = stream_csv(entries)
+    elif file_format == 'ndjson':
+        content = stream_ndjson(entries)
+    else:
+        content = stream_ics(entries, _export_week_start(request), domain=request.get_host())
+    response = StreamingHttpResponse(buffered(content), content_type=CONTENT_TYPES[file_format])
+    response['Content-Disposition'] = f'attachment; filename="{name}.{file_format}"'
+    return response
+
+
+def _timetable_api_etag(request, by, key=None):
+    # Polls compare only the timetable version, which every entry change bumps, so an
+    # unchanged timetable is answered with 304 before the entry table is read.
+    version = timetable_cache.get_versions(['timetable'])['timetable']
+    return f"api-{by}-{key or ''}-{version}"
 
-    days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']
-    period_numbers = range(1, 5)
 
-    for course in courses:
-        course_entries = TimetableEntry.objects.filter(course=course)
-        timetable_data[course] = course_entries
+@cache_control(no_cache=True)
+@condition(etag_func=_timetable_api_etag)
+def timetable_api(request, by, key=None):
+    """
+    Returns the timetable grid as compact JSON, grouped by course, staff member or day.
+
+    Cells are lists of ids and indexes; names are sent once in a shared lookup table (see
+    grid.timetable_payload). The serialized payload is cached under the timetable version, and
+    the same version is the ETag, so clients that send If-None-Match get HTTP 304 until the
+    timetable changes.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+        by (str): 'course', 'staff' or 'day'.
+        key (str, optional): Course id, staff id or day name to return a single group.
+
+    Returns:
+        HttpResponse: The JSON payload.
+
+    Raises:
+        Http404: If 'by' is unknown or a course or staff key is not an id.
+    """
+    if by not in GRID_KEYS or (key is not None and by != 'day' and not key.isdigit()):
+        raise Http404("Unknown timetable grid.")
+    page_key = timetable_cache.page_key(f"api:{by}:{key or ''}")
+    content = timetable_cache.get_page(page_key)
+    if content is None:
+        payload = timetable_payload(by, int(key) if key is not None and by != 'day' else key)
+        content = json.dumps(payload, separators=(',', ':'))
+        timetable_cache.set_page(page_key, content)
+    return HttpResponse(content, content_type='application/json')
+
+
+def _timetable_score_etag(request):
+    version = timetable_cache.get_versions(['timetable'])['timetable']
+    return f"score-{version}"
+
+
+@cache_control(no_cache=True)
+@condition(etag_func=_timetable_score_etag)
+def timetable_score(request):
+    """
+    Returns the quality scores of the stored timetable as JSON.
+
+    See scoring.Scorer for the metrics. The result is cached under the timetable version, which
+    is also the ETag, so it is only recomputed after the timetable changes.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+
+    Returns:
+        HttpResponse: 'totals' (including the weighted 'penalty'), 'weights', 'days', and
+        per-course and per-staff breakdowns keyed by id.
+    """
+    page_key = timetable_cache.page_key('score')
+    content = timetable_cache.get_page(page_key)
+    if content is None:
+        content = json.dumps(score_timetable(), separators=(',', ':'))
+        timetable_cache.set_page(page_key, content)
+    return HttpResponse(content, content_type='application/json')
 
-    return render(request, 'timetable/timetable_list.html', {
-        'timetable_data': timetable_data,
-        'days': days,
-        'period_numbers': period_numbers,
+@staff_member_required
+def timetable_cache_stats(request):
+    """
+    Reports the timetable cache hit and miss counters of the current process.
+
+    Args:
+        request (HttpRequest): The HTTP request object; the user must be staff.
+
+    Returns:
+        JsonResponse: Counters such as 'page_hits', 'page_misses', 'fragment_hits' and 'fragment_misses'.
+    """
+    return JsonResponse(timetable_cache.stats.as_dict())
+
+
+@staff_member_required
+def profiling_stats(request):
+    """
+    Reports per-view SQL and latency statistics collected by QueryProfilingMiddleware.
+
+    Args:
+        request (HttpRequest): The HTTP request object; the user must be staff.
+
+    Returns:
+        JsonResponse: For each URL name, the number of sampled requests and p50/p95/p99/max of
+        wall time, query count and SQL time, plus the most repeated query fingerprints.
+    """
+    return JsonResponse({
+        'sample_rate': settings.TIMETABLE_PROFILING_SAMPLE_RATE,
+        'views': profiling.store.summary(),
+    })
+
+
+def _snapshot_payload(snapshot):
+    return {
+        'id': snapshot.pk,
+        'name': snapshot.name,
+        'automatic': snapshot.automatic,
+        'entry_count': snapshot.entry_count,
+        'created_at': snapshot.created_at.isoformat(),
+        'diff_url': reverse('snapshot_diff', args=[snapshot.pk]),
+        'restore_url': reverse('snapshot_restore', args=[snapshot.pk]),
+    }
+
+
+@staff_member_required
+def snapshot_list(request):
+    """
+    Lists the timetable snapshots, newest first, or takes a snapshot of the timetable on POST.
+
+    Args:
+        request (HttpRequest): The HTTP request object; the user must be staff. A POST may give
+            the snapshot a 'name'.
+
+    Returns:
+        JsonResponse: 'snapshots' with the id, name, whether it was taken automatically, entry
+        count and creation time of each; after a POST, the new snapshot with HTTP 201.
+    """
+    if request.method == 'POST':
+        snapshot = take_snapshot(name=request.POST.get('name', '')[:100])
+        return JsonResponse(_snapshot_payload(snapshot), status=201)
+    snapshots = TimetableSnapshot.objects.defer('cells').order_by('-created_at', '-pk')
+    return JsonResponse({'snapshots': [_snapshot_payload(snapshot) for snapshot in snapshots]})
+
+
+@staff_member_required
+def snapshot_diff(request, pk):
+    """
+    Lists the cells that changed between a snapshot and another snapshot or the current timetable.
+
+    Args:
+        request (HttpRequest): The HTTP request object; the user must be staff. The 'against'
+            query parameter names the snapshot to compare with; without it the snapshot is
+            compared with the current timetable.
+        pk (int): The primary key of the earlier snapshot.
+
+    Returns:
+        JsonResponse: 'from' and 'to' (None for the current timetable), the number of changed
+        cells and 'changes', each with its course and period and the subject and staff
+        'before' and 'after' (None where the cell is empty).
+    """
+    snapshot = get_object_or_404(TimetableSnapshot, pk=pk)
+    against = request.GET.get('against')
+    if against:
+        if not against.isdigit():
+            raise Http404("Unknown snapshot.")
+        other = get_object_or_404(TimetableSnapshot, pk=against)
+        after = unpack_cells(other)
+    else:
+        other = None
+        after = current_cells()
+    changes = diff_cells(unpack_cells(snapshot), after)
+    return JsonResponse({
+        'from': _snapshot_payload(snapshot),
+        'to': _snapshot_payload(other) if other is not None else None,
+        'changed': len(changes),
+        'changes': describe_changes(changes),
     })
 
+
+@staff_member_required
+def snapshot_restore(request, pk):
+    """
+    Restores a snapshot as the whole timetable on POST; a GET previews the cells it would change.
+
+    The timetable being replaced is kept as an automatic snapshot, so a restore can be undone
+    the same way. See snapshots.restore_snapshot.
+
+    Args:
+        request (HttpRequest): The HTTP request object; the user must be staff.
+        pk (int): The primary key of the snapshot to restore.
+
+    Returns:
+        JsonResponse: On GET, the snapshot and the changes restoring it would make. On POST,
+            the restored and skipped entry counts if JSON was requested, or the error with
+            status 409 if a running generation kept the timetable locked.
+        HttpResponseRedirect: Otherwise redirects to 'timetable_list' after restoring.
+    """
+    snapshot = get_object_or_404(TimetableSnapshot, pk=pk)
+    if request.method != 'POST':
+        changes = diff_cells(current_cells(), unpack_cells(snapshot))
+        return JsonResponse({
+            'snapshot': _snapshot_payload(snapshot),
+            'changed': len(changes),
+            'changes': describe_changes(changes),
+        })
+    try:
+        restored, skipped = restore_snapshot(snapshot)
+    except (LockTimeout, LockLost) as error:
+        return JsonResponse({'snapshot': _snapshot_payload(snapshot), 'error': str(error)}, status=409)
+    if 'application/json' in request.headers.get('Accept', ''):
+        return JsonResponse({'snapshot': _snapshot_payload(snapshot), 'restored': restored, 'skipped': skipped})
+    message = f"Restored {restored} entries from snapshot {snapshot.name or snapshot.pk}."
+    if skipped:
+        message += f" {skipped} entries referred to deleted records and were skipped."
+    messages.success(request, message)
+    return redirect('timetable_list')